@@ -1,7 +1,12 @@
-from fastapi import APIRouter, WebSocket, WebSocketDisconnect, HTTPException
+import secrets
+from contextlib import aclosing
+from fastapi import APIRouter, Depends, Header, Query, WebSocket, WebSocketDisconnect, HTTPException
 from fastapi.responses import StreamingResponse
+from app.core.config import settings
+from app.services.chat_analytics_service import BUCKET_FORMATS, chat_analytics_service, parse_time
+from app.services.chat_archive_service import chat_archive_service
 from app.services.chat_service import chat_service
-from app.utils.response import success_response
+from app.utils.response import dumps, success_response
 import json
 from app.schemas.chat import ChatMessageRequest
 
@@ -30,13 +35,117 @@ async def create_chat_session():
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
+HISTORY_FIELDS = {"session_id", "user_message", "bot_response", "intent", "source", "created_at"}
+
 @router.get("/history/{session_id}")
-async def get_chat_history(session_id: str):
+async def get_chat_history(
+    session_id: str,
+    limit: int = Query(None, ge=1, le=settings.chat_history_page_max),
+    before: str = Query(None),
+    after: str = Query(None),
+    fields: str = Query(None)
+):
+    """
+    Lịch sử chat phân trang keyset trên (session_id, _id), stream từng tin nhắn.
+    - Mặc định: `limit` (CHAT_HISTORY_LIMIT) tin mới nhất, mới nhất trước.
+    - `before=next_before`: trang cũ hơn tiếp theo.
+    - `after=<cursor>`: chỉ các tin mới hơn cursor, cũ nhất trước (client kết nối lại dùng `next_after`).
+    - `fields`: danh sách trường cần lấy, cách nhau bởi dấu phẩy (luôn kèm _id).
+    """
+    if before and after:
+        raise HTTPException(status_code=400, detail="Use either before or after, not both")
+    field_list = [f.strip() for f in fields.split(",") if f.strip()] if fields else None
+    if field_list and not set(field_list) <= HISTORY_FIELDS:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(sorted(set(field_list) - HISTORY_FIELDS))}")
     try:
-        history = await chat_service.get_chat_history(session_id)
-        return success_response(data=history)
+        # Lấy dư một bản ghi để biết còn trang tiếp theo hay không
+        page = chat_service.iter_chat_history(session_id, (limit or settings.chat_history_limit) + 1, before, after, field_list)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
+    return StreamingResponse(
+        _stream_history(page, limit or settings.chat_history_limit, before, after),
+        media_type="application/json"
+    )
+
+async def _stream_history(page, limit: int, before: str, after: str):
+    yield b'{"success":true,"message":"Success","data":['
+    count = 0
+    first_id = last_id = None
+    has_more = False
+    async with aclosing(page):
+        async for doc in page:
+            if count == limit:
+                has_more = True
+                break
+            yield dumps(doc) if count == 0 else b"," + dumps(doc)
+            first_id = first_id or doc["_id"]
+            last_id = doc["_id"]
+            count += 1
+    if after:
+        # Tin cũ nhất trước: tiếp tục từ tin mới nhất đã nhận
+        cursors = {"next_before": None, "next_after": last_id or after}
+    else:
+        cursors = {"next_before": last_id if has_more else None, "next_after": first_id or before}
+    yield b'],"has_more":' + dumps(has_more) + b',"next_before":' + dumps(cursors["next_before"]) + \
+        b',"next_after":' + dumps(cursors["next_after"]) + b',"error":null}'
+
+@router.get("/archive/status")
+async def get_archive_status():
+    """
+    Trạng thái retention / lưu trữ lịch sử chat (watermark, lần chạy gần nhất, bộ đếm).
+    """
+    return success_response(data=chat_archive_service.status())
+
+def require_admin(x_admin_token: str = Header(None)):
+    """Endpoint admin: header X-Admin-Token phải khớp ADMIN_TOKEN (chưa cấu hình -> tắt)"""
+    if not settings.admin_token:
+        raise HTTPException(status_code=403, detail="Admin endpoints are disabled (ADMIN_TOKEN not set)")
+    if not x_admin_token or not secrets.compare_digest(x_admin_token, settings.admin_token):
+        raise HTTPException(status_code=401, detail="Invalid admin token")
+
+def _time_window(since: str, until: str):
+    try:
+        return parse_time(since), parse_time(until)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="since/until must be ISO dates")
+
+@router.get("/admin/export", dependencies=[Depends(require_admin)])
+async def export_chat_messages(
+    since: str = Query(None),
+    until: str = Query(None),
+    fields: str = Query(None),
+    compress: bool = Query(True)
+):
+    """
+    Stream chat_messages dạng NDJSON (mặc định nén gzip) trong khoảng [since, until).
+    Duyệt cursor theo lô nên bộ nhớ không phụ thuộc kích thước collection.
+    """
+    start, end = _time_window(since, until)
+    field_list = [f.strip() for f in fields.split(",") if f.strip()] if fields else None
+    filename = "chat_messages.ndjson.gz" if compress else "chat_messages.ndjson"
+    return StreamingResponse(
+        chat_analytics_service.export_ndjson(start, end, field_list, compress),
+        media_type="application/gzip" if compress else "application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+@router.get("/admin/analytics", dependencies=[Depends(require_admin)])
+async def get_chat_analytics(
+    since: str = Query(None),
+    until: str = Query(None),
+    bucket: str = Query("day", pattern=f"^({'|'.join(BUCKET_FORMATS)})$")
+):
+    """
+    Phân bố intent, số tin nhắn mỗi session, tỷ lệ template/LLM và tỷ lệ lỗi theo khung thời gian
+    (tính bằng aggregation pipeline trên MongoDB).
+    """
+    start, end = _time_window(since, until)
+    try:
+        return success_response(data=await chat_analytics_service.report(start, end, bucket))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
 
 # WebSocket endpoint for real-time chat
 @router.websocket("/ws/{session_id}")
@@ -1,11 +1,15 @@
-from fastapi import APIRouter, HTTPException, BackgroundTasks
+from fastapi import APIRouter, HTTPException, BackgroundTasks, UploadFile, File, Form
+from fastapi.responses import StreamingResponse
 from typing import List
+import csv
+import io
 from app.utils.response import success_response, error_response
 from pydantic import BaseModel, Field
 import aiohttp
 import asyncio
-from app.core.mongo import mongo_db
 from app.services.ranking_service import ranking_service
+from app.schemas.ranking import BulkRankingRequest, REGION_PATTERN
+from app.core.config import settings
 
 router = APIRouter(prefix="/ranking", tags=["ranking"])
 
@@ -17,7 +21,7 @@ class RankingSearchRequest(BaseModel):
         pattern="^\\d{8}$", 
         description="Số báo danh (8 chữ số)"
     )
-    region: str = Field(default="CN", description="Khu vực: CN, MB, MT, MN")
+    region: str = Field(default="CN", pattern=REGION_PATTERN, description="Khu vực: CN, MB, MT, MN")
 
 class SubjectScore(BaseModel):
     name: str
@@ -54,7 +58,7 @@ async def search_student_ranking(request: RankingSearchRequest):
         student_data = await ranking_service.get_student_ranking(request, save_to_db=True)
         if student_data:
             return success_response(
-                data=student_data.dict(),
+                data=student_data,
                 message="Tra cứu thành công"
             )
         else:
@@ -65,4 +69,52 @@ async def search_student_ranking(request: RankingSearchRequest):
     except HTTPException as e:
         raise e
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Lỗi hệ thống: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Lỗi hệ thống: {str(e)}")
+
+# Tên cột SBD được nhận diện là dòng tiêu đề của file CSV
+CSV_SBD_COLUMNS = ("sbd", "so_bao_danh", "so bao danh", "số báo danh", "candidate_number")
+
+def _bulk_response(candidate_numbers: List[str], region: str) -> StreamingResponse:
+    if len(candidate_numbers) > settings.ranking_bulk_max:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Tối đa {settings.ranking_bulk_max} số báo danh mỗi lần tra cứu."
+        )
+    return StreamingResponse(
+        ranking_service.stream_bulk_rankings(candidate_numbers, region or "CN"),
+        media_type="application/x-ndjson"
+    )
+
+@router.post("/thptqg/2025/bulk")
+async def bulk_search_student_ranking(request: BulkRankingRequest):
+    """Tra cứu ranking hàng loạt, trả về NDJSON (mỗi dòng một SBD, dòng cuối là summary)"""
+    return _bulk_response(request.candidate_numbers, request.region)
+
+@router.post("/thptqg/2025/bulk/csv")
+async def bulk_search_student_ranking_csv(file: UploadFile = File(...), region: str = Form("CN", pattern=REGION_PATTERN)):
+    """
+    Tra cứu ranking hàng loạt từ file CSV: cột có tiêu đề sbd/candidate_number, hoặc cột đầu
+    tiên nếu dòng đầu không phải tiêu đề. Dòng không hợp lệ (kể cả thiếu cột) được trả về
+    với status "invalid" thay vì bị bỏ qua.
+    """
+    try:
+        content = (await file.read()).decode("utf-8-sig")
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=400, detail="File CSV phải được mã hóa UTF-8.")
+    rows = [row for row in csv.reader(io.StringIO(content)) if any(cell.strip() for cell in row)]
+    column = 0
+    if rows:
+        header = [cell.strip().lower() for cell in rows[0]]
+        for name in CSV_SBD_COLUMNS:
+            if name in header:
+                column = header.index(name)
+                rows = rows[1:]
+                break
+    # Dòng thiếu cột SBD giữ nguyên nội dung để được báo là không hợp lệ
+    candidate_numbers = [row[column] if len(row) > column and row[column].strip() else ",".join(row) for row in rows]
+    return _bulk_response(candidate_numbers, region)
+
+@router.get("/metrics")
+async def get_ranking_metrics():
+    """Metrics của rate limiter khi gọi API tuyensinh247"""
+    return success_response(data=ranking_service.get_metrics())
@@ -1,32 +1,92 @@
-from fastapi import APIRouter, HTTPException, Query, Body
+from bson.errors import InvalidId
+from fastapi import APIRouter, HTTPException, Query, Body, Request, Response
+from fastapi.responses import StreamingResponse
+from app.core.config import settings
+from app.services.suggest_service import SUGGEST_TOP_K, suggest_service
 from app.services.university_service import university_service
+from app.services.university_sync_service import LeaseLostError, university_sync_scheduler
+from app.utils.response import FastJSONResponse, dumps
 
 router = APIRouter(prefix="/university", tags=["university"])
 
 @router.get("/all")
-async def get_all_universities():
+async def get_all_universities(
+    request: Request,
+    limit: int = Query(None, ge=1, le=1000),
+    after: str = Query(None),
+    fields: str = Query(None)
+):
     """
-    Lấy toàn bộ danh sách trường đại học/cao đẳng từ database.
+    Lấy danh sách trường đại học/cao đẳng từ database.
+    - Có `limit`: phân trang keyset, trang tiếp theo dùng `after=next_cursor`.
+    - Không có `limit`: stream toàn bộ danh mục (cùng định dạng JSON như trước).
+    - `fields`: danh sách trường cần lấy, cách nhau bởi dấu phẩy (luôn kèm id).
+    ETag theo version danh mục; If-None-Match khớp -> 304.
     """
     try:
-        data = await university_service.get_all_universities_from_db()
-        return {"success": True, "data": data}
+        version = await university_service.get_catalog_version()
+        etag = f'"catalog-{version}"'
+        headers = {"ETag": etag, "Cache-Control": "no-cache"}
+        if request.headers.get("if-none-match") == etag:
+            return Response(status_code=304, headers=headers)
+        field_list = [f.strip() for f in fields.split(",") if f.strip()] if fields else None
+        if limit:
+            try:
+                data, next_cursor = await university_service.list_universities_page(limit, after, field_list)
+            except InvalidId:
+                raise HTTPException(status_code=400, detail="Invalid cursor")
+            return FastJSONResponse({"success": True, "data": data, "next_cursor": next_cursor}, headers=headers)
+        return StreamingResponse(
+            _stream_universities(field_list),
+            media_type="application/json",
+            headers=headers
+        )
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+async def _stream_universities(fields):
+    yield b'{"success":true,"data":['
+    first = True
+    async for doc in university_service.iter_universities(fields):
+        yield dumps(doc) if first else b"," + dumps(doc)
+        first = False
+    yield b"]}"
+
 @router.post("/update")
 async def update_universities():
     """
     Gọi API ngoài để lấy danh sách trường mới nhất, lưu vào database.
-    Nếu trường chưa có thì tạo mới, nếu đã có thì update thông tin.
+    Chỉ ghi các trường mới hoặc có nội dung thay đổi; trả về changeset.
+    Worker khác đang giữ lease đồng bộ (đang chạy sync) -> 409.
     """
     try:
-        universities = await university_service.fetch_all_universities_from_api()
-        await university_service.save_all_universities_to_db(universities)
-        return {"success": True, "count": len(universities)}
+        result = await university_sync_scheduler.run_as_leader(conditional=False)
+        if result is None:
+            raise HTTPException(status_code=409, detail="University sync is running on another worker")
+        return FastJSONResponse({"success": True, "count": result["count"], "changes": result["changes"]})
+    except HTTPException:
+        raise
+    except LeaseLostError as e:
+        raise HTTPException(status_code=409, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.get("/sync/status")
+async def get_sync_status():
+    """
+    Trạng thái job đồng bộ nền (leader, lần chạy gần nhất, lỗi, lịch chạy tiếp theo).
+    """
+    return FastJSONResponse({"success": True, "data": university_sync_scheduler.status()})
+
+@router.get("/sync/metrics")
+async def get_sync_metrics():
+    """
+    Bộ đếm của job đồng bộ nền.
+    """
+    return FastJSONResponse({"success": True, "data": university_sync_scheduler.metrics()})
+
 @router.post("/create")
 async def create_university(uni_data: dict = Body(...)):
     """
@@ -34,7 +94,7 @@ async def create_university(uni_data: dict = Body(...)):
     """
     try:
         doc = await university_service.create_university(uni_data)
-        return {"success": True, "data": doc}
+        return FastJSONResponse({"success": True, "data": doc})
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -45,17 +105,45 @@ async def update_university(uni_id: int, update_data: dict = Body(...)):
     """
     try:
         doc = await university_service.update_university(uni_id, update_data)
-        return {"success": True, "data": doc}
+        return FastJSONResponse({"success": True, "data": doc})
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/search")
-async def search_universities(code: str = Query(None), name: str = Query(None)):
+async def search_universities(
+    code: str = Query(None),
+    name: str = Query(None),
+    limit: int = Query(50, ge=1, le=500)
+):
     """
-    Tìm kiếm trường theo code (exact) hoặc name (chứa, không phân biệt hoa thường).
+    Tìm kiếm trường theo code (exact) hoặc name (không dấu, không phân biệt hoa thường),
+    kết quả xếp theo độ liên quan.
     """
     try:
-        data = await university_service.search_universities(code=code, name=name)
-        return {"success": True, "data": data}
+        data = await university_service.search_universities(code=code, name=name, limit=limit)
+        return FastJSONResponse({"success": True, "data": data})
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
+@router.get("/suggest")
+async def suggest_universities(
+    request: Request,
+    q: str = Query(..., min_length=1, max_length=100),
+    limit: int = Query(8, ge=1, le=SUGGEST_TOP_K)
+):
+    """
+    Gợi ý trường khi gõ (không dấu) theo code, alias, tên; trả về tối đa `limit` kết quả.
+    """
+    if not suggest_service.ready:
+        # Trie chưa dựng xong (vừa khởi động): không cho cache kết quả rỗng
+        return FastJSONResponse({"success": True, "data": []}, headers={"Cache-Control": "no-store"})
+    headers = {
+        "ETag": suggest_service.etag,
+        "Cache-Control": f"public, max-age={settings.suggest_cache_max_age}"
+    }
+    if request.headers.get("if-none-match") == suggest_service.etag:
+        return Response(status_code=304, headers=headers)
+    try:
+        data = suggest_service.suggest(q, limit)
+        return FastJSONResponse({"success": True, "data": data}, headers=headers)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
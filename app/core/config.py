@@ -1,5 +1,6 @@
 import os
-from typing import Optional
+import json
+from typing import Dict, Optional
 from pydantic_settings import BaseSettings
 from dotenv import load_dotenv
 
@@ -10,12 +11,102 @@ class Settings(BaseSettings):
     debug: bool = os.getenv("DEBUG", "False").lower() == "true"
     openai_api_key: Optional[str] = os.getenv("OPENAI_API_KEY")
     openai_model: str = os.getenv("OPENAI_MODEL", "gpt-3.5-turbo")
+    openai_timeout: float = float(os.getenv("OPENAI_TIMEOUT", 60))
+    openai_max_retries: int = int(os.getenv("OPENAI_MAX_RETRIES", 2))
     chat_history_limit: int = int(os.getenv("CHAT_HISTORY_LIMIT", 30))
+    # Session memory (entity đã giải quyết theo session): TTL từ lần ghi cuối, LRU in-process
+    session_memory_ttl: int = int(os.getenv("SESSION_MEMORY_TTL", 86400))
+    session_memory_cache_size: int = int(os.getenv("SESSION_MEMORY_CACHE_SIZE", 10000))
+    session_memory_cache_ttl: float = float(os.getenv("SESSION_MEMORY_CACHE_TTL", 60))
+    session_memory_max_schools: int = int(os.getenv("SESSION_MEMORY_MAX_SCHOOLS", 5))
+    # Cỡ trang tối đa của /chat/history (tham số limit; mặc định CHAT_HISTORY_LIMIT)
+    chat_history_page_max: int = int(os.getenv("CHAT_HISTORY_PAGE_MAX", 200))
     secret_key: str = os.getenv("SECRET_KEY", "your-secret-key")
     port: int = int(os.getenv("PORT", 8001))
     api_prefix: str = os.getenv("API_PREFIX", "/api/v1")
+    # Số worker; PRELOAD=True: zygote dựng state chỉ đọc rồi fork worker (copy-on-write, app/core/prefork.py)
+    workers: int = int(os.getenv("WORKERS", 1))
+    preload: bool = os.getenv("PRELOAD", "False").lower() == "true"
+    prefork_ready_timeout: float = float(os.getenv("PREFORK_READY_TIMEOUT", 60))
+    # Thời gian tối đa zygote thế hệ mới nạp snapshot khi roll (cộng thêm PREFORK_READY_TIMEOUT)
+    prefork_preload_timeout: float = float(os.getenv("PREFORK_PRELOAD_TIMEOUT", 300))
+    # Chạy lại bước khởi động bắt buộc bị lỗi (Mongo, KB): chờ ban đầu và tối đa (giây, tăng gấp đôi)
+    warm_up_retry_interval: float = float(os.getenv("WARM_UP_RETRY_INTERVAL", 5))
+    warm_up_retry_max_interval: float = float(os.getenv("WARM_UP_RETRY_MAX_INTERVAL", 60))
     mongo_url: str = os.getenv("MONGO_URL", "mongodb://localhost:27017")
     mongo_db: str = os.getenv("MONGO_DB", "ai_chatbot")
+    # Pool Motor (tạo lazy, mở trong lifespan)
+    mongo_max_pool_size: int = int(os.getenv("MONGO_MAX_POOL_SIZE", 100))
+    mongo_min_pool_size: int = int(os.getenv("MONGO_MIN_POOL_SIZE", 5))
+    mongo_max_idle_time_ms: int = int(os.getenv("MONGO_MAX_IDLE_TIME_MS", 60000))
+    mongo_server_selection_timeout_ms: int = int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", 5000))
+    mongo_connect_timeout_ms: int = int(os.getenv("MONGO_CONNECT_TIMEOUT_MS", 5000))
+    # Tạo index khi khởi động; tắt nếu chạy `python -m app.core.indexes` như một bước migration
+    mongo_ensure_indexes: bool = os.getenv("MONGO_ENSURE_INDEXES", "True").lower() == "true"
+    # Backend lưu lịch sử chat: mongo | sqlite (file SQLITE_PATH, chế độ WAL) | memory
+    chat_backend: str = os.getenv("CHAT_BACKEND", "mongo")
+    sqlite_path: str = os.getenv("SQLITE_PATH", "chatbot_tuyensinh.db")
+    sqlite_read_pool_size: int = int(os.getenv("SQLITE_READ_POOL_SIZE", 4))
+    sqlite_write_batch_size: int = int(os.getenv("SQLITE_WRITE_BATCH_SIZE", 64))
+    # Retention lịch sử chat (backend mongo): số ngày giữ trong Mongo (0 = giữ mãi, không TTL);
+    # bản ghi cũ được lưu trữ sang CHAT_ARCHIVE_DIR (JSONL gzip theo ngày) trước hạn TTL LEAD_HOURS giờ
+    chat_retention_days: int = int(os.getenv("CHAT_RETENTION_DAYS", 0))
+    chat_archive_dir: Optional[str] = os.getenv("CHAT_ARCHIVE_DIR", "app/data/chat_archive") or None
+    chat_archive_lead_hours: float = float(os.getenv("CHAT_ARCHIVE_LEAD_HOURS", 24))
+    chat_archive_interval: float = float(os.getenv("CHAT_ARCHIVE_INTERVAL", 3600))
+    chat_archive_batch_size: int = int(os.getenv("CHAT_ARCHIVE_BATCH_SIZE", 1000))
+    # Số shard index archive (trên 256) mỗi process giữ trong bộ nhớ sau khi đọc
+    chat_archive_index_cache: int = int(os.getenv("CHAT_ARCHIVE_INDEX_CACHE", 32))
+    # Export / analytics lịch sử chat: cỡ lô cursor; ADMIN_TOKEN (header X-Admin-Token) bảo vệ endpoint admin, rỗng = tắt
+    chat_export_batch_size: int = int(os.getenv("CHAT_EXPORT_BATCH_SIZE", 1000))
+    admin_token: Optional[str] = os.getenv("ADMIN_TOKEN") or None
+    # Shared HTTP client (keep-alive pool + DNS cache)
+    http_pool_size: int = int(os.getenv("HTTP_POOL_SIZE", 100))
+    http_pool_size_per_host: int = int(os.getenv("HTTP_POOL_SIZE_PER_HOST", 20))
+    http_dns_cache_ttl: int = int(os.getenv("HTTP_DNS_CACHE_TTL", 300))
+    http_keepalive_timeout: float = float(os.getenv("HTTP_KEEPALIVE_TIMEOUT", 30))
+    # Token bucket cho API ranking tuyensinh247 (request/giây, burst)
+    ranking_rate_limit: float = float(os.getenv("RANKING_RATE_LIMIT", 1.0))
+    ranking_rate_burst: int = int(os.getenv("RANKING_RATE_BURST", 1))
+    # Cache ranking: LRU in-process -> Mongo -> API ngoài
+    ranking_cache_size: int = int(os.getenv("RANKING_CACHE_SIZE", 10000))
+    ranking_fresh_ttl: int = int(os.getenv("RANKING_FRESH_TTL", 3600))
+    # TTL riêng theo năm dữ liệu, ví dụ {"2024": 0, "2025": 600}; 0 = không hết hạn
+    ranking_freshness: Dict[int, int] = {
+        int(year): int(ttl) for year, ttl in json.loads(os.getenv("RANKING_FRESHNESS", "{}")).items()
+    }
+    ranking_upstream_timeout: float = float(os.getenv("RANKING_UPSTREAM_TIMEOUT", 10))
+    ranking_breaker_threshold: int = int(os.getenv("RANKING_BREAKER_THRESHOLD", 5))
+    ranking_breaker_reset: float = float(os.getenv("RANKING_BREAKER_RESET", 30))
+    # Tra cứu ranking hàng loạt
+    ranking_bulk_max: int = int(os.getenv("RANKING_BULK_MAX", 5000))
+    ranking_bulk_concurrency: int = int(os.getenv("RANKING_BULK_CONCURRENCY", 8))
+    # Dataset điểm thi chính thức (CSV) cho engine xếp hạng offline
+    score_dataset_path: Optional[str] = os.getenv("SCORE_DATASET_PATH")
+    score_dataset_year: int = int(os.getenv("SCORE_DATASET_YEAR", 2025))
+    # Thư mục score store dạng cột (memory-map, dùng chung giữa các worker); rỗng = chỉ giữ trong RAM
+    score_store_dir: Optional[str] = os.getenv("SCORE_STORE_DIR", "app/data/score_store") or None
+    # Cộng điểm ưu tiên (cột uu_tien trong dataset) trước khi xếp hạng
+    score_apply_priority: bool = os.getenv("SCORE_APPLY_PRIORITY", "False").lower() == "true"
+    # Đồng bộ nền danh sách trường: chu kỳ gọi API nguồn (giây, 0 = tắt), chu kỳ kiểm tra/kéo thay đổi, lease
+    university_sync_interval: int = int(os.getenv("UNIVERSITY_SYNC_INTERVAL", 21600))
+    university_sync_poll_interval: float = float(os.getenv("UNIVERSITY_SYNC_POLL_INTERVAL", 60))
+    university_sync_jitter: float = float(os.getenv("UNIVERSITY_SYNC_JITTER", 0.1))
+    university_sync_lease_ttl: float = float(os.getenv("UNIVERSITY_SYNC_LEASE_TTL", 180))
+    # Watermark _seq: thời gian chờ một _seq còn thiếu (ghi đang dở) và số _seq gần nhất đọc lại sau warm-up
+    university_sync_gap_grace: float = float(os.getenv("UNIVERSITY_SYNC_GAP_GRACE", 120))
+    university_sync_inflight_window: int = int(os.getenv("UNIVERSITY_SYNC_INFLIGHT_WINDOW", 5000))
+    # Cache-Control max-age (giây) cho /university/suggest
+    suggest_cache_max_age: int = int(os.getenv("SUGGEST_CACHE_MAX_AGE", 300))
+    # So khớp tên trường sai chính tả: ngưỡng tỷ lệ trigram (lọc ứng viên) và điểm rapidfuzz (0-100)
+    fuzzy_candidate_threshold: float = float(os.getenv("FUZZY_CANDIDATE_THRESHOLD", 0.5))
+    fuzzy_match_threshold: float = float(os.getenv("FUZZY_MATCH_THRESHOLD", 80))
+    # KB snapshot (JSON đã parse + index dẫn xuất, pickle); rỗng = luôn parse file nguồn
+    kb_snapshot_path: Optional[str] = os.getenv("KB_SNAPSHOT_PATH", "app/data/knowledge_base.snapshot") or None
+    # Local vector retrieval (knowledge base + universities)
+    retrieval_dim: int = int(os.getenv("RETRIEVAL_DIM", 512))
+    retrieval_top_k: int = int(os.getenv("RETRIEVAL_TOP_K", 3))
+    retrieval_min_score: float = float(os.getenv("RETRIEVAL_MIN_SCORE", 0.2))
 
     class Config:
         env_file = ".env"
@@ -0,0 +1,51 @@
+# Môn thi THPT (key cột trong dataset -> tên hiển thị)
+SUBJECTS = {
+    "toan": "Toán",
+    "ngu_van": "Ngữ văn",
+    "ngoai_ngu": "Ngoại ngữ",
+    "vat_li": "Vật lí",
+    "hoa_hoc": "Hóa học",
+    "sinh_hoc": "Sinh học",
+    "lich_su": "Lịch sử",
+    "dia_li": "Địa lí",
+    "gdktpl": "GDKT&PL",
+    "tin_hoc": "Tin học",
+    "cong_nghe_cn": "Công nghệ CN",
+    "cong_nghe_nn": "Công nghệ NN",
+}
+
+# Tên cột khác thường gặp trong các file điểm công bố
+SUBJECT_ALIASES = {
+    "van": "ngu_van",
+    "anh": "ngoai_ngu",
+    "tieng_anh": "ngoai_ngu",
+    "ly": "vat_li",
+    "vat_ly": "vat_li",
+    "hoa": "hoa_hoc",
+    "sinh": "sinh_hoc",
+    "su": "lich_su",
+    "dia": "dia_li",
+    "dia_ly": "dia_li",
+    "gdcd": "gdktpl",
+    "tin": "tin_hoc",
+}
+
+# Khối xét tuyển -> các môn thành phần
+EXAM_BLOCKS = {
+    "A00": ["toan", "vat_li", "hoa_hoc"],
+    "A01": ["toan", "vat_li", "ngoai_ngu"],
+    "A02": ["toan", "vat_li", "sinh_hoc"],
+    "B00": ["toan", "hoa_hoc", "sinh_hoc"],
+    "B08": ["toan", "sinh_hoc", "ngoai_ngu"],
+    "C00": ["ngu_van", "lich_su", "dia_li"],
+    "C01": ["ngu_van", "toan", "vat_li"],
+    "C03": ["ngu_van", "toan", "lich_su"],
+    "C04": ["ngu_van", "toan", "dia_li"],
+    "D01": ["ngu_van", "toan", "ngoai_ngu"],
+    "D07": ["toan", "hoa_hoc", "ngoai_ngu"],
+    "D14": ["ngu_van", "lich_su", "ngoai_ngu"],
+    "D15": ["ngu_van", "dia_li", "ngoai_ngu"],
+}
+
+# Khu vực xếp hạng: CN = cả nước
+REGIONS = ["CN", "MB", "MT", "MN"]
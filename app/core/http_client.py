@@ -0,0 +1,41 @@
+import asyncio
+from typing import Optional
+
+import aiohttp
+
+from app.core.config import settings
+
+
+class HttpClient:
+    """
+    aiohttp.ClientSession dùng chung cho mọi lời gọi API ngoài.
+    Giữ kết nối keep-alive trong pool và cache DNS, được đóng khi app shutdown.
+    """
+
+    def __init__(self):
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._lock = asyncio.Lock()
+
+    async def get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            async with self._lock:
+                if self._session is None or self._session.closed:
+                    connector = aiohttp.TCPConnector(
+                        limit=settings.http_pool_size,
+                        limit_per_host=settings.http_pool_size_per_host,
+                        ttl_dns_cache=settings.http_dns_cache_ttl,
+                        keepalive_timeout=settings.http_keepalive_timeout
+                    )
+                    self._session = aiohttp.ClientSession(
+                        connector=connector,
+                        timeout=aiohttp.ClientTimeout(total=30)
+                    )
+        return self._session
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+
+http_client = HttpClient()
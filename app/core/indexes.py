@@ -0,0 +1,117 @@
+"""
+Khai báo index Mongo tập trung cho mọi collection.
+
+Chạy tự động khi khởi động (MONGO_ENSURE_INDEXES) hoặc như một lệnh migration:
+
+    python -m app.core.indexes             # tạo index còn thiếu
+    python -m app.core.indexes --verify    # tạo index rồi explain() các truy vấn repository/service ghi
+                                           # lại trên database tạm (app/core/query_plans.py), exit code 1
+                                           # nếu có truy vấn nào COLLSCAN
+"""
+import argparse
+import asyncio
+import logging
+import sys
+from typing import Dict, List
+
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import OperationFailure
+
+from app.core.config import settings
+from app.core.mongo import mongo
+
+logger = logging.getLogger("indexes")
+
+# Retention (CHAT_RETENTION_DAYS > 0): TTL theo created_at, chỉ cho bản ghi archiver đã lưu
+# trữ (partial filter archived_at), xem app/services/chat_archive_service.py
+RETENTION_SECONDS = max(settings.chat_retention_days, 0) * 86400
+
+
+def _retention_indexes() -> List[IndexModel]:
+    if not RETENTION_SECONDS:
+        return []
+    return [IndexModel(
+        [("created_at", ASCENDING)],
+        name="created_at_ttl",
+        expireAfterSeconds=RETENTION_SECONDS,
+        partialFilterExpression={"archived_at": {"$exists": True}}
+    )]
+
+
+INDEX_SPECS: Dict[str, List[IndexModel]] = {
+    # Lịch sử chat: find({"session_id"[, "_id" < / > cursor]}).sort("_id", -1 / 1)
+    "chat_messages": [
+        IndexModel([("session_id", ASCENDING), ("_id", DESCENDING)]),
+        *_retention_indexes()
+    ],
+    "chat_sessions": _retention_indexes(),
+    # Cache ranking: find_one / upsert / $in theo SBD
+    "student_ranking": [
+        IndexModel([("candidate_number", ASCENDING)], unique=True)
+    ],
+    "universities": [
+        # Upsert đồng bộ theo id; bản ghi tạo tay có thể không có id
+        IndexModel([("id", ASCENDING)], unique=True, partialFilterExpression={"id": {"$exists": True}}),
+        IndexModel([("code", ASCENDING)]),
+        # Token không dấu của name/alias/code (multikey), dùng cho tìm kiếm theo tên
+        IndexModel([("search_tokens", ASCENDING)]),
+        # pull_changes: các bản ghi có _seq sau watermark
+        IndexModel([("_seq", ASCENDING)])
+    ],
+    # Session memory: find_one theo _id (session_id); hết hạn theo expires_at
+    "session_memory": [
+        IndexModel([("expires_at", ASCENDING)], expireAfterSeconds=0)
+    ],
+    # Histogram điểm: get_year và replace theo (year, block, region)
+    "score_distributions": [
+        IndexModel([("year", ASCENDING), ("block", ASCENDING), ("region", ASCENDING)], unique=True)
+    ],
+    # Lease job nền và bộ đếm danh mục: chỉ truy vấn theo _id
+    "sync_leases": [],
+    "catalog_meta": []
+}
+
+
+async def ensure_indexes(db=None) -> Dict[str, List[str]]:
+    """Tạo các index còn thiếu (idempotent); lỗi của một index không chặn các index khác"""
+    db = mongo.db if db is None else db
+    created = {}
+    for collection, models in INDEX_SPECS.items():
+        names = []
+        for model in models:
+            try:
+                names.extend(await db[collection].create_indexes([model]))
+            except OperationFailure as e:
+                if e.code == 85 and "expireAfterSeconds" in model.document:
+                    # IndexOptionsConflict: đổi CHAT_RETENTION_DAYS -> cập nhật TTL tại chỗ
+                    await db.command("collMod", collection, index={
+                        "name": model.document["name"],
+                        "expireAfterSeconds": model.document["expireAfterSeconds"]
+                    })
+                    names.append(model.document["name"])
+                    continue
+                logger.error(f"Create index {model.document['key']} on {collection} failed: {e}")
+        created[collection] = names
+    return created
+
+
+async def _main(verify: bool) -> int:
+    created = await ensure_indexes()
+    for collection, names in created.items():
+        print(f"{collection}: {', '.join(names) or '-'}")
+    if not verify:
+        return 0
+    from app.core.query_plans import verify_query_plans
+    failed = 0
+    for plan in await verify_query_plans():
+        status = "COLLSCAN" if plan["collscan"] else "scan" if plan["full_scan"] else "ok"
+        failed += plan["collscan"]
+        print(f"[{status:8}] {plan['collection']:20} {plan['query']:40} {' <- '.join(plan['stages'])}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ensure MongoDB indexes")
+    parser.add_argument("--verify", action="store_true", help="explain() queries recorded from the repositories, fail on COLLSCAN")
+    args = parser.parse_args()
+    sys.exit(asyncio.run(_main(args.verify)))
@@ -1,6 +1,78 @@
-from motor.motor_asyncio import AsyncIOMotorClient
-import os
- 
-MONGO_URL = os.getenv("MONGO_URL", "mongodb://localhost:27017")
-mongo_client = AsyncIOMotorClient(MONGO_URL)
-mongo_db = mongo_client[os.getenv("MONGO_DB", "ai_chatbot")] 
\ No newline at end of file
+from typing import Dict, Optional
+
+from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorCollection, AsyncIOMotorDatabase
+
+from app.core.config import settings
+
+
+class MongoManager:
+    """
+    Motor client dùng chung, tạo lazy ở lần truy cập đầu (không tạo lúc import)
+    với pool cấu hình qua settings; lifespan gọi connect() để mở pool và close() khi shutdown.
+    """
+
+    def __init__(self):
+        self._client: Optional[AsyncIOMotorClient] = None
+        self._collections: Dict[str, AsyncIOMotorCollection] = {}
+
+    @property
+    def client(self) -> AsyncIOMotorClient:
+        if self._client is None:
+            self._client = AsyncIOMotorClient(
+                settings.mongo_url,
+                maxPoolSize=settings.mongo_max_pool_size,
+                minPoolSize=settings.mongo_min_pool_size,
+                maxIdleTimeMS=settings.mongo_max_idle_time_ms,
+                serverSelectionTimeoutMS=settings.mongo_server_selection_timeout_ms,
+                connectTimeoutMS=settings.mongo_connect_timeout_ms,
+                retryWrites=True
+            )
+        return self._client
+
+    @property
+    def db(self) -> AsyncIOMotorDatabase:
+        return self.client[settings.mongo_db]
+
+    def collection(self, name: str) -> AsyncIOMotorCollection:
+        collection = self._collections.get(name)
+        if collection is None:
+            collection = self._collections[name] = self.db[name]
+        return collection
+
+    async def connect(self):
+        """Chọn server và mở kết nối đầu tiên của pool (minPoolSize được bổ sung ở nền)"""
+        await self.client.admin.command("ping")
+
+    def close(self):
+        if self._client is not None:
+            self._client.close()
+        self._client = None
+        self._collections = {}
+
+
+class LazyCollection:
+    """
+    Descriptor cho thuộc tính collection của repository/service: lấy collection từ
+    MongoManager khi truy cập nên import module không tạo client. Gán đè trên instance
+    (vd. collection của database tạm trong benchmark) vẫn được.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.attr = name
+
+    def __set_name__(self, owner, attr: str):
+        self.attr = attr
+
+    def __get__(self, obj, objtype=None):
+        if obj is None:
+            return self
+        if self.attr in obj.__dict__:
+            return obj.__dict__[self.attr]
+        return mongo.collection(self.name)
+
+    def __set__(self, obj, value):
+        obj.__dict__[self.attr] = value
+
+
+mongo = MongoManager()
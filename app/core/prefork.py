@@ -0,0 +1,312 @@
+"""
+Chế độ preload: mỗi thế hệ worker được fork từ một zygote đã dựng state chỉ đọc một lần.
+
+Master không giữ state mà fork một zygote cho mỗi thế hệ. Zygote nạp KB snapshot, danh mục
+trường (retrieval, gazetteer, suggest, fuzzy), score store, đóng mọi client mạng rồi gọi
+gc.freeze() trước khi fork các worker uvicorn. Các worker dùng chung những trang bộ nhớ đó
+theo copy-on-write: gc.freeze() đưa object hiện có vào thế hệ permanent nên GC trong worker
+không ghi vào header của chúng (không làm bẩn trang). Worker khởi động với
+resources.preloaded = True và chỉ kéo các thay đổi sau snapshot. Worker chết bất thường được
+zygote của nó fork lại, từ đúng snapshot của thế hệ đó.
+
+Đổi snapshot nóng: gửi SIGHUP cho master -> master fork zygote mới (nạp snapshot mới rồi fork
+thế hệ worker mới), chờ mọi worker mới báo ready rồi SIGTERM zygote cũ (zygote SIGTERM các
+worker của nó: uvicorn tắt êm, socket dùng chung nên không rớt kết nối). Nếu không phải mọi
+worker mới đều ready trong PREFORK_PRELOAD_TIMEOUT + PREFORK_READY_TIMEOUT, zygote mới cùng
+worker của nó bị SIGKILL; zygote cũ vẫn giữ snapshot cũ nên thế hệ cũ tiếp tục phục vụ.
+
+    python run.py --preload --workers 4
+"""
+import asyncio
+import gc
+import logging
+import os
+import random
+import select
+import signal
+import socket
+import time
+from typing import Dict, Optional, Set
+
+import uvicorn
+
+from app.core.config import settings
+from app.core.mongo import mongo
+from app.core.resources import resources
+from app.services import kb_snapshot
+from app.services.fuzzy_match_service import fuzzy_match_service
+from app.services.gazetteer_service import gazetteer_service
+from app.services.offline_ranking_service import offline_ranking_service
+from app.services.suggest_service import suggest_service
+from app.services.university_service import university_service
+from app.utils.lazy import reset_all, resolve_all
+
+logger = logging.getLogger("prefork")
+
+# Master -> zygote: huỷ thế hệ (SIGKILL worker rồi thoát ngay, kể cả khi đang preload)
+ABORT_SIGNAL = signal.SIGUSR1
+# Chờ trước khi fork lại zygote của thế hệ hiện tại vừa chết (vd. preload lỗi)
+ZYGOTE_RESPAWN_DELAY = 1.0
+
+
+async def _preload_state():
+    kb_snapshot.reset_snapshot()
+    reset_all()
+    resolve_all()
+    try:
+        count = await university_service.warm_up()
+        logger.info(f"Preloaded {count} universities")
+    except Exception as e:
+        logger.warning(f"Preloading universities failed: {e}")
+    try:
+        offline_ranking_service.load_configured_dataset()
+    except Exception as e:
+        logger.warning(f"Preloading score dataset failed: {e}")
+    gazetteer_service.warm_up()
+    fuzzy_match_service.warm_up()
+    # Không fork khi thread dựng trie còn chạy (thread không được sao sang worker)
+    suggest_service.join()
+    # Client Motor gắn với event loop / socket của zygote, worker tự tạo client mới
+    mongo.close()
+
+
+class PreforkServer:
+    def __init__(self, app, host: str, port: int, workers: int):
+        self.app = app
+        self.host = host
+        self.port = port
+        self.workers = workers
+        self.sock = None
+        # Master: pid zygote -> thế hệ (tăng mỗi lần roll), pid zygote -> đầu đọc pipe ready
+        self._zygotes: Dict[int, int] = {}
+        self._ready_pipes: Dict[int, int] = {}
+        self._generation = 0
+        self._signals: Set[int] = set()
+        self._respawn_at = 0.0
+        # Zygote: các worker đang chạy và đầu ghi pipe ready mà worker kế thừa
+        self._workers: Set[int] = set()
+        self._ready_write: Optional[int] = None
+
+    # ---------- Master ----------
+
+    def _bind(self):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind((self.host, self.port))
+        sock.listen(2048)
+        sock.set_inheritable(True)
+        return sock
+
+    def _spawn_zygote(self) -> int:
+        ready_read, ready_write = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                os.close(ready_read)
+                for fd in self._ready_pipes.values():
+                    os.close(fd)
+                self._run_zygote(ready_write)
+            except BaseException as e:
+                logger.error(f"Zygote failed: {e}")
+                code = 1
+            os._exit(code)
+        os.close(ready_write)
+        self._zygotes[pid] = self._generation
+        self._ready_pipes[pid] = ready_read
+        return pid
+
+    def _current(self) -> Optional[int]:
+        """Zygote của thế hệ đang phục vụ"""
+        return next((pid for pid, generation in self._zygotes.items() if generation == self._generation), None)
+
+    def _drain(self, pid: int) -> int:
+        """Đọc hết thông báo ready của một zygote; trả về số worker vừa báo ready"""
+        fd = self._ready_pipes.get(pid)
+        ready = 0
+        while fd is not None and select.select([fd], [], [], 0)[0]:
+            data = os.read(fd, 64)
+            if not data:
+                break
+            ready += len(data)
+        return ready
+
+    def _wait_ready(self, pid: int, timeout: float) -> int:
+        """Chờ worker của zygote `pid` báo ready; trả về số worker đã ready (dừng sớm nếu zygote chết)"""
+        ready = 0
+        deadline = time.monotonic() + timeout
+        while ready < self.workers and time.monotonic() < deadline:
+            select.select([self._ready_pipes[pid]], [], [], 0.5)
+            ready += self._drain(pid)
+            if pid in self._reap():
+                break
+        return ready
+
+    def _stop(self, pids, sig=signal.SIGTERM):
+        for pid in pids:
+            try:
+                os.kill(pid, sig)
+            except ProcessLookupError:
+                pass
+
+    def _reap(self) -> Set[int]:
+        dead = set()
+        while self._zygotes:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                break
+            if pid == 0:
+                break
+            generation = self._zygotes.pop(pid, None)
+            if generation is None:
+                continue
+            dead.add(pid)
+            os.close(self._ready_pipes.pop(pid))
+            if generation == self._generation and status != 0:
+                logger.warning(f"Zygote {pid} exited with status {status}")
+        return dead
+
+    def _wait_exit(self, pids: Set[int], timeout: float):
+        deadline = time.monotonic() + timeout
+        while pids & set(self._zygotes) and time.monotonic() < deadline:
+            self._reap()
+            time.sleep(0.05)
+        self._stop(pids & set(self._zygotes), signal.SIGKILL)
+        while pids & set(self._zygotes):
+            self._reap()
+            time.sleep(0.05)
+
+    def roll(self) -> bool:
+        """
+        Nạp snapshot mới trong zygote mới và thay toàn bộ worker mà không đóng socket. Thế hệ cũ
+        chỉ bị dừng khi mọi worker mới đã ready; nếu không, huỷ zygote mới, zygote cũ (với
+        snapshot cũ) tiếp tục phục vụ.
+        """
+        old = self._current()
+        self._generation += 1
+        new = self._spawn_zygote()
+        ready = self._wait_ready(new, settings.prefork_preload_timeout + settings.prefork_ready_timeout)
+        if ready < self.workers:
+            self._generation -= 1
+            logger.error(f"Roll aborted: {ready}/{self.workers} new workers ready, keeping generation {self._generation}")
+            self._stop([new], ABORT_SIGNAL)
+            self._wait_exit({new}, settings.prefork_ready_timeout)
+            return False
+        logger.info(f"Rolled workers: {ready}/{self.workers} new ready, stopping zygote {old}")
+        if old is not None:
+            self._stop([old])
+        return True
+
+    def start(self):
+        self.sock = self._bind()
+        self._spawn_zygote()
+
+    def tick(self):
+        """Một vòng của master: roll khi có SIGHUP, fork lại zygote của thế hệ hiện tại nếu nó chết"""
+        # Rút thông báo ready cũ để pipe không đầy
+        for pid in list(self._ready_pipes):
+            self._drain(pid)
+        if signal.SIGHUP in self._signals:
+            self._signals.discard(signal.SIGHUP)
+            self.roll()
+        self._reap()
+        if self._current() is None and time.monotonic() >= self._respawn_at:
+            self._respawn_at = time.monotonic() + ZYGOTE_RESPAWN_DELAY
+            self._spawn_zygote()
+
+    def shutdown(self):
+        zygotes = set(self._zygotes)
+        self._stop(zygotes)
+        # Zygote chờ tối đa PREFORK_READY_TIMEOUT cho worker tắt êm trước khi SIGKILL
+        self._wait_exit(zygotes, 2 * settings.prefork_ready_timeout)
+        self.sock.close()
+
+    def serve(self):
+        for sig in (signal.SIGHUP, signal.SIGTERM, signal.SIGINT):
+            signal.signal(sig, lambda signum, frame: self._signals.add(signum))
+        self.start()
+        logger.info(f"Prefork master {os.getpid()} serving on {self.host}:{self.port} with {self.workers} workers")
+        while signal.SIGTERM not in self._signals and signal.SIGINT not in self._signals:
+            time.sleep(0.2)
+            self.tick()
+        self.shutdown()
+
+    # ---------- Zygote ----------
+
+    def preload(self):
+        start = time.perf_counter()
+        gc.unfreeze()
+        asyncio.run(_preload_state())
+        gc.collect()
+        gc.freeze()
+        logger.info(f"Preloaded shared state in {time.perf_counter() - start:.2f}s ({gc.get_freeze_count()} frozen objects)")
+
+    def _abort(self, signum, frame):
+        self._stop(self._workers, signal.SIGKILL)
+        os._exit(1)
+
+    def _spawn_worker(self) -> int:
+        pid = os.fork()
+        if pid == 0:
+            try:
+                self._run_worker()
+            finally:
+                os._exit(0)
+        self._workers.add(pid)
+        return pid
+
+    def _reap_workers(self, stopping: bool = False):
+        while self._workers:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                break
+            if pid == 0:
+                break
+            if pid in self._workers:
+                self._workers.discard(pid)
+                if status != 0 and not stopping:
+                    logger.warning(f"Worker {pid} exited with status {status}")
+
+    def _run_zygote(self, ready_write: int):
+        self._zygotes, self._ready_pipes = {}, {}
+        stopping = []
+        # Ctrl-C tới cả process group: master điều phối việc dừng qua SIGTERM
+        for sig in (signal.SIGHUP, signal.SIGINT):
+            signal.signal(sig, signal.SIG_IGN)
+        signal.signal(signal.SIGTERM, lambda signum, frame: stopping.append(signum))
+        signal.signal(ABORT_SIGNAL, self._abort)
+        self.preload()
+        self._ready_write = ready_write
+        while not stopping:
+            self._reap_workers()
+            for _ in range(self.workers - len(self._workers)):
+                self._spawn_worker()
+            time.sleep(0.2)
+        self._stop(self._workers)
+        deadline = time.monotonic() + settings.prefork_ready_timeout
+        while self._workers and time.monotonic() < deadline:
+            self._reap_workers(stopping=True)
+            time.sleep(0.1)
+        self._stop(self._workers, signal.SIGKILL)
+
+    # ---------- Worker ----------
+
+    def _run_worker(self):
+        for sig in (signal.SIGHUP, signal.SIGTERM, signal.SIGINT, ABORT_SIGNAL):
+            signal.signal(sig, signal.SIG_DFL)
+        # Trạng thái random của zygote được sao sang mọi worker (jitter của scheduler, ...)
+        random.seed()
+        ready_write = self._ready_write
+        resources.preloaded = True
+        resources.on_ready = lambda: os.write(ready_write, b"1")
+        config = uvicorn.Config(self.app, lifespan="on", log_level="debug" if settings.debug else "info")
+        uvicorn.Server(config).run(sockets=[self.sock])
+
+
+def serve(host: str, port: int, workers: int):
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(process)d] %(name)s: %(message)s")
+    from app.main import app
+
+    PreforkServer(app, host, port, workers).serve()
@@ -0,0 +1,349 @@
+"""
+Kiểm tra plan truy vấn Mongo từ chính code của repository/service (không khai báo tay).
+
+QueryRecorder bọc các collection mà LazyCollection trả về và ghi lại filter / sort / pipeline
+của mọi truy vấn; exercise() chạy các luồng thật (lịch sử chat, lưu trữ, analytics, đồng bộ
+và tìm kiếm trường, lease, session memory, ranking, histogram điểm) trên một database.
+verify_query_plans() chạy exercise() trên database tạm `<MONGO_DB>_plan_check` đã tạo index,
+explain() từng truy vấn đã ghi và đánh dấu truy vấn có filter mà vẫn COLLSCAN. Filter rỗng
+là quét toàn bộ có chủ đích (nạp danh mục khi warm up, so hash khi đồng bộ) nên không tính.
+
+    python -m app.core.indexes --verify
+"""
+import contextlib
+import datetime
+import shutil
+import tempfile
+from typing import Any, Dict, List, Optional, Tuple
+
+from bson import ObjectId
+from pymongo import ASCENDING
+
+from app.core.config import settings
+from app.core.indexes import INDEX_SPECS, ensure_indexes
+from app.core.mongo import mongo
+from app.repositories.chat_repository import MongoChatRepository
+from app.repositories.lease_repository import LeaseRepository
+from app.repositories.ranking_repository import RankingRepository
+from app.repositories.score_distribution_repository import ScoreDistributionRepository
+from app.services.chat_analytics_service import ChatAnalyticsService
+from app.services.chat_archive_service import ChatArchiveService
+from app.services.session_memory_service import SessionMemoryService
+from app.services.university_service import UniversityService
+
+PLAN_CHECK_SUFFIX = "_plan_check"
+
+# Method của collection nhận filter ở tham số đầu
+FILTER_METHODS = {
+    "find_one", "count_documents", "update_one", "update_many", "replace_one", "delete_one", "delete_many",
+    "find_one_and_update", "find_one_and_replace", "find_one_and_delete"
+}
+
+SAMPLE_UNIVERSITIES = [
+    {"id": 1, "name": "Đại học Bách khoa Hà Nội", "alias": "HUST", "code": "BKA"},
+    {"id": 2, "name": "Đại học Kinh tế Quốc dân", "alias": "NEU", "code": "KHA"},
+    {"id": 3, "name": "Học viện Ngân hàng", "code": "NHH"}
+]
+
+
+def _sort_spec(key_or_list, direction=None) -> List[Tuple[str, int]]:
+    if isinstance(key_or_list, str):
+        return [(key_or_list, direction or ASCENDING)]
+    return [tuple(item) for item in key_or_list]
+
+
+class _RecordingCursor:
+    """Cursor của find(): ghi lại sort, các method khác chuyển thẳng cho cursor gốc"""
+
+    def __init__(self, cursor, query: Dict[str, Any]):
+        self._cursor = cursor
+        self._query = query
+
+    def sort(self, key_or_list, direction=None):
+        self._query["sort"] = _sort_spec(key_or_list, direction)
+        self._cursor = self._cursor.sort(key_or_list, direction)
+        return self
+
+    def __getattr__(self, name):
+        attr = getattr(self._cursor, name)
+        if not callable(attr):
+            return attr
+
+        def call(*args, **kwargs):
+            result = attr(*args, **kwargs)
+            # limit / batch_size / skip trả về cursor: giữ wrapper để sort gọi sau vẫn được ghi
+            if type(result) is type(self._cursor):
+                self._cursor = result
+                return self
+            return result
+        return call
+
+    def __aiter__(self):
+        return self._cursor.__aiter__()
+
+
+class RecordingCollection:
+    """Collection Motor kèm ghi lại truy vấn vào QueryRecorder"""
+
+    def __init__(self, collection, recorder: "QueryRecorder"):
+        self._collection = collection
+        self._recorder = recorder
+
+    @property
+    def name(self) -> str:
+        return self._collection.name
+
+    def find(self, filter=None, *args, **kwargs):
+        query = self._recorder.record(self.name, "find", filter=filter)
+        return _RecordingCursor(self._collection.find(filter, *args, **kwargs), query)
+
+    def aggregate(self, pipeline, *args, **kwargs):
+        self._recorder.record(self.name, "aggregate", pipeline=pipeline)
+        return self._collection.aggregate(pipeline, *args, **kwargs)
+
+    def bulk_write(self, requests, *args, **kwargs):
+        for request in requests:
+            # UpdateOne / ReplaceOne / DeleteOne giữ filter ở _filter; InsertOne không có
+            if getattr(request, "_filter", None) is not None:
+                self._recorder.record(self.name, type(request).__name__, filter=request._filter)
+        return self._collection.bulk_write(requests, *args, **kwargs)
+
+    def __getattr__(self, name):
+        attr = getattr(self._collection, name)
+        if name not in FILTER_METHODS:
+            return attr
+
+        def call(filter, *args, **kwargs):
+            self._recorder.record(self.name, name, filter=filter)
+            return attr(filter, *args, **kwargs)
+        return call
+
+
+class QueryRecorder:
+    """Danh sách truy vấn đã ghi: {label, collection, op, filter, sort, pipeline}"""
+
+    def __init__(self):
+        self.queries: List[Dict[str, Any]] = []
+        self.label: Optional[str] = None
+
+    def record(self, collection: str, op: str, filter=None, pipeline=None) -> Dict[str, Any]:
+        query = {
+            "label": self.label,
+            "collection": collection,
+            "op": op,
+            "filter": filter or {},
+            "sort": None,
+            "pipeline": pipeline
+        }
+        self.queries.append(query)
+        return query
+
+    @contextlib.contextmanager
+    def step(self, label: str):
+        previous, self.label = self.label, label
+        try:
+            yield
+        finally:
+            self.label = previous
+
+
+@contextlib.contextmanager
+def _settings(**values):
+    previous = {key: getattr(settings, key) for key in values}
+    for key, value in values.items():
+        setattr(settings, key, value)
+    try:
+        yield
+    finally:
+        for key, value in previous.items():
+            setattr(settings, key, value)
+
+
+# ---------- Kịch bản ----------
+
+async def _exercise_chat(recorder: QueryRecorder):
+    repo = MongoChatRepository()
+    with recorder.step("chat history"):
+        session_id = await repo.create_session("plan-check")
+        first = await repo.create_message(session_id, "xin chào", "chào bạn", source="template")
+        last = await repo.create_message(session_id, "điểm chuẩn BKA", "...", intent="school")
+        await repo.update_message_bot_response(last["_id"], "điểm chuẩn là ...", source="llm")
+        await repo.get_chat_history(session_id, 10)
+        [doc async for doc in repo.iter_history(session_id, 10, before=last["_id"])]
+        [doc async for doc in repo.iter_history(session_id, 10, after=first["_id"], fields=["user_message"])]
+
+
+async def _exercise_archive(recorder: QueryRecorder, db, archive_dir: str):
+    # Bản ghi quá hạn lưu trữ, một bản ghi cũ thiếu created_at (bị xoá thay vì đánh dấu)
+    old = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(days=60)
+    await db["chat_messages"].insert_many([
+        {"_id": ObjectId.from_datetime(old), "session_id": "archived", "user_message": "cũ", "created_at": old},
+        {"_id": ObjectId.from_datetime(old + datetime.timedelta(seconds=1)), "session_id": "archived", "user_message": "cũ hơn"}
+    ])
+    await db["chat_sessions"].insert_one({"_id": ObjectId.from_datetime(old), "session_id": "archived", "created_at": old})
+    with recorder.step("chat archive"), _settings(chat_retention_days=30, chat_archive_dir=archive_dir):
+        archiver = ChatArchiveService()
+        await archiver.run_once()
+        await archiver.run_once()
+
+
+async def _exercise_analytics(recorder: QueryRecorder):
+    analytics = ChatAnalyticsService()
+    now = datetime.datetime.now(datetime.timezone.utc)
+    since, until = now - datetime.timedelta(days=7), now + datetime.timedelta(days=1)
+    with recorder.step("chat analytics"):
+        await analytics.report(since, until)
+        [doc async for doc in analytics.iter_messages(since, until)]
+
+
+async def _exercise_universities(recorder: QueryRecorder, db):
+    service = UniversityService()
+    with recorder.step("university sync"):
+        await service.save_all_universities_to_db([dict(uni) for uni in SAMPLE_UNIVERSITIES])
+        # Bản ghi tạo trước khi có search_tokens -> warm up chạy backfill
+        await db["universities"].insert_one({"name": "Đại học Y Hà Nội", "code": "YHB"})
+        await service.warm_up()
+        await service.update_university(2, {"alias": "KTQD"})
+        await service.pull_changes()
+    with recorder.step("university read"):
+        await service.search_universities(code="bka")
+        await service.search_universities(name="bach kh")
+        await service.search_universities(code="BKA", name="bach khoa")
+        docs, cursor = await service.list_universities_page(2)
+        await service.list_universities_page(2, after=cursor)
+        await service.get_catalog_version()
+    with recorder.step("university write"):
+        await service.create_university({"name": "Đại học Thủy lợi", "code": "TLA"})
+
+
+async def _exercise_lease(recorder: QueryRecorder):
+    leases = LeaseRepository()
+    with recorder.step("lease"):
+        await leases.acquire("plan-check", "worker-1", 60)
+        await leases.acquire("plan-check", "worker-2", 60)
+        await leases.update("plan-check", "worker-1", {"last_result": "ok"})
+        await leases.release("plan-check", "worker-1")
+        await leases.get("plan-check")
+
+
+async def _exercise_session_memory(recorder: QueryRecorder):
+    with recorder.step("session memory"):
+        await SessionMemoryService().update("plan-check", name="An", region="CN")
+        await SessionMemoryService().get("plan-check")
+
+
+async def _exercise_ranking(recorder: QueryRecorder):
+    rankings = RankingRepository()
+    distributions = ScoreDistributionRepository()
+    with recorder.step("ranking"):
+        await rankings.upsert_ranking("01000001", {"candidate_number": "01000001", "mark_info": []})
+        await rankings.bulk_upsert_rankings([{"candidate_number": "01000002", "mark_info": []}])
+        await rankings.get_by_candidate_number("01000001")
+        await rankings.get_many_by_candidate_numbers(["01000001", "01000002"])
+    with recorder.step("score distribution"):
+        await distributions.replace_year(2025, [{"year": 2025, "block": "A00", "region": "CN", "histogram": []}])
+        await distributions.get_year(2025)
+
+
+async def exercise(recorder: QueryRecorder, db) -> List[Dict[str, Any]]:
+    """Chạy các luồng đọc/ghi của repository/service trên `db`, trả về các truy vấn đã ghi"""
+    archive_dir = tempfile.mkdtemp(prefix="plan_check_")
+    saved = mongo._collections
+    mongo._collections = {name: RecordingCollection(db[name], recorder) for name in INDEX_SPECS}
+    try:
+        with _settings(mongo_db=db.name, chat_backend="mongo", chat_retention_days=0):
+            await _exercise_chat(recorder)
+            await _exercise_archive(recorder, db, archive_dir)
+            await _exercise_analytics(recorder)
+            await _exercise_universities(recorder, db)
+            await _exercise_lease(recorder)
+            await _exercise_session_memory(recorder)
+            await _exercise_ranking(recorder)
+    finally:
+        mongo._collections = saved
+        shutil.rmtree(archive_dir, ignore_errors=True)
+    return recorder.queries
+
+
+# ---------- Explain ----------
+
+def _shape(value):
+    """Filter với giá trị thay bằng tên kiểu, để gộp các truy vấn cùng dạng"""
+    if isinstance(value, dict):
+        return {key: _shape(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_shape(item) for item in value]
+    return type(value).__name__
+
+
+def unique_queries(queries: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    seen, result = set(), []
+    for query in queries:
+        key = repr((query["collection"], query["op"], query["label"], _shape(query["filter"]),
+                    query["sort"], _shape(query["pipeline"])))
+        if key not in seen:
+            seen.add(key)
+            result.append(query)
+    return result
+
+
+def query_filter(query: Dict[str, Any]) -> Dict[str, Any]:
+    """Filter đi xuống planner: filter của truy vấn hoặc $match đầu pipeline"""
+    if query["pipeline"] is None:
+        return query["filter"]
+    first = query["pipeline"][0] if query["pipeline"] else {}
+    return first.get("$match", {})
+
+
+def _winning_stages(node) -> List[str]:
+    """Mọi stage trong plan đã chọn (find, aggregate, SBE, sharded), bỏ qua rejectedPlans"""
+    stages = []
+    if isinstance(node, dict):
+        for key, value in node.items():
+            if key == "rejectedPlans":
+                continue
+            if key == "stage" and isinstance(value, str):
+                stages.append(value)
+            else:
+                stages.extend(_winning_stages(value))
+    elif isinstance(node, list):
+        for item in node:
+            stages.extend(_winning_stages(item))
+    return stages
+
+
+async def explain_query(db, query: Dict[str, Any]) -> Dict[str, Any]:
+    if query["pipeline"] is not None:
+        command = {"aggregate": query["collection"], "pipeline": query["pipeline"], "cursor": {}}
+    else:
+        command = {"find": query["collection"], "filter": query["filter"]}
+        if query["sort"]:
+            command["sort"] = dict(query["sort"])
+    plan = await db.command("explain", command, verbosity="queryPlanner")
+    stages = _winning_stages(plan)
+    full_scan = not query_filter(query)
+    return {
+        "collection": query["collection"],
+        "query": f"{query['label']}: {query['op']}",
+        "filter": query_filter(query),
+        "stages": stages,
+        "full_scan": full_scan,
+        "collscan": "COLLSCAN" in stages and not full_scan
+    }
+
+
+async def verify_query_plans(client=None) -> List[Dict[str, Any]]:
+    """
+    exercise() trên database tạm `<MONGO_DB>_plan_check` (đã ensure_indexes) rồi explain()
+    từng dạng truy vấn; database tạm bị xoá sau khi kiểm tra.
+    """
+    client = mongo.client if client is None else client
+    name = f"{settings.mongo_db}{PLAN_CHECK_SUFFIX}"
+    await client.drop_database(name)
+    db = client[name]
+    try:
+        await ensure_indexes(db)
+        queries = await exercise(QueryRecorder(), db)
+        return [await explain_query(db, query) for query in unique_queries(queries)]
+    finally:
+        await client.drop_database(name)
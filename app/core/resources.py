@@ -0,0 +1,157 @@
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from app.core.config import settings
+from app.core.http_client import http_client
+from app.core.indexes import ensure_indexes
+from app.core.mongo import mongo
+from app.repositories.chat_repository import chat_repository
+from app.services.chat_archive_service import chat_archive_service
+from app.services.fuzzy_match_service import fuzzy_match_service
+from app.services.gazetteer_service import gazetteer_service
+from app.services.offline_ranking_service import offline_ranking_service
+from app.services.openai_service import openai_service
+from app.services.university_service import university_service
+from app.services.university_sync_service import university_sync_scheduler
+from app.utils.lazy import resolve_all
+
+logger = logging.getLogger("resources")
+
+# Bước bắt buộc: lỗi ở đây giữ ready = False (readiness 503) và được chạy lại tới khi thành công
+CRITICAL_STEPS = ("mongo", "services")
+
+
+class ResourceManager:
+    """
+    Vòng đời tài nguyên dùng chung của app (gọi từ lifespan của FastAPI).
+
+    startup(): mở pool Mongo, kho lịch sử chat, HTTP session dùng chung và client OpenAI, rồi chạy warm-up
+    (index Mongo, index in-memory của danh mục trường, score store, gazetteer, fuzzy)
+    trong một task nền để liveness trả lời ngay. `ready` chỉ bật sau khi warm-up xong và mọi
+    bước trong CRITICAL_STEPS thành công, nên readiness probe giữ pod mới ngoài load balancer
+    tới khi cache đã nóng; bước lỗi được chạy lại sau WARM_UP_RETRY_INTERVAL giây (tăng dần).
+    shutdown(): dừng job nền rồi đóng các client theo thứ tự ngược lại.
+    """
+
+    def __init__(self):
+        self.ready = False
+        self.started_at: Optional[float] = None
+        self.ready_at: Optional[float] = None
+        self.steps: Dict[str, Dict[str, Any]] = {}
+        # Bước lỗi -> hàm để chạy lại
+        self._failed: Dict[str, Callable[[], Awaitable[Any]]] = {}
+        self._warm_task: Optional[asyncio.Task] = None
+        # Chế độ preload (app/core/prefork.py): master đã dựng sẵn KB, danh mục trường, score
+        # store trước khi fork; worker chỉ kéo phần thay đổi sau snapshot
+        self.preloaded = False
+        self.on_ready: Optional[Callable[[], None]] = None
+
+    async def _step(self, name: str, fn: Callable[[], Awaitable[Any]]) -> bool:
+        """Chạy một bước, ghi thời gian/lỗi vào steps; lỗi không dừng các bước sau"""
+        start = time.perf_counter()
+        attempts = self.steps.get(name, {}).get("attempts", 0) + 1
+        try:
+            result = await fn()
+            self.steps[name] = {"ok": True, "ms": round((time.perf_counter() - start) * 1000, 1), "attempts": attempts}
+            if result is not None:
+                self.steps[name]["result"] = result
+            self._failed.pop(name, None)
+            return True
+        except Exception as e:
+            self.steps[name] = {
+                "ok": False,
+                "ms": round((time.perf_counter() - start) * 1000, 1),
+                "attempts": attempts,
+                "error": str(e),
+                "critical": name in CRITICAL_STEPS
+            }
+            self._failed[name] = fn
+            logger.warning(f"Startup step {name} failed: {e}")
+            return False
+
+    @property
+    def failed_critical(self) -> List[str]:
+        return [name for name in CRITICAL_STEPS if name in self._failed]
+
+    async def _retry_failed(self):
+        """Chạy lại các bước lỗi (theo thứ tự ban đầu) tới khi không còn bước bắt buộc nào lỗi"""
+        delay = settings.warm_up_retry_interval
+        while self.failed_critical:
+            logger.error(f"Not ready, critical steps failed: {', '.join(self.failed_critical)}; retrying in {delay:g}s")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, settings.warm_up_retry_max_interval)
+            for name, fn in list(self._failed.items()):
+                await self._step(name, fn)
+
+    async def startup(self):
+        self.started_at = time.time()
+        await self._step("mongo", mongo.connect)
+        await self._step("chat_repository", chat_repository.open)
+        await self._step("http_client", self._open_http_client)
+        await self._step("openai_client", self._open_openai_client)
+        self._warm_task = asyncio.create_task(self.warm_up())
+
+    async def _open_http_client(self):
+        await http_client.get_session()
+
+    async def _open_openai_client(self):
+        # Truy cập property để tạo client; thiếu OPENAI_API_KEY chỉ ghi lỗi, chat dùng fallback
+        return openai_service.client is not None
+
+    async def _start_schedulers(self):
+        # Đồng bộ nền danh sách trường (leader qua lease Mongo)
+        university_sync_scheduler.start()
+        # Lưu trữ lịch sử chat cũ trước hạn TTL (CHAT_RETENTION_DAYS > 0)
+        chat_archive_service.start()
+
+    async def warm_up(self):
+        # Dựng các singleton lazy (knowledge base từ snapshot, chat/openai service)
+        await self._step("services", lambda: asyncio.to_thread(resolve_all))
+        if settings.mongo_ensure_indexes:
+            await self._step("indexes", ensure_indexes)
+        if self.preloaded:
+            await self._step("universities", university_service.pull_changes)
+        else:
+            # Danh mục trường -> retrieval, gazetteer, suggest, fuzzy (qua sync listener)
+            await self._step("universities", university_service.warm_up)
+            # Dataset điểm thi cho engine xếp hạng offline (score store đã build hoặc CSV)
+            await self._step("score_dataset", lambda: asyncio.to_thread(offline_ranking_service.load_configured_dataset))
+        await self._step("gazetteer", lambda: asyncio.to_thread(gazetteer_service.warm_up))
+        await self._step("fuzzy_match", lambda: asyncio.to_thread(fuzzy_match_service.warm_up))
+        await self._step("schedulers", self._start_schedulers)
+        await self._retry_failed()
+        self.ready = True
+        self.ready_at = time.time()
+        logger.info(f"Warm-up finished in {self.ready_at - self.started_at:.2f}s")
+        if self.on_ready is not None:
+            self.on_ready()
+
+    async def shutdown(self):
+        self.ready = False
+        if self._warm_task is not None and not self._warm_task.done():
+            self._warm_task.cancel()
+            try:
+                await self._warm_task
+            except asyncio.CancelledError:
+                pass
+        await university_sync_scheduler.stop()
+        await chat_archive_service.stop()
+        await chat_repository.close()
+        await http_client.close()
+        if openai_service.resolved:
+            await openai_service.close()
+        mongo.close()
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "ready": self.ready,
+            "failed_critical": self.failed_critical,
+            "preloaded": self.preloaded,
+            "warm_up_seconds": round(self.ready_at - self.started_at, 3) if self.ready_at else None,
+            "steps": self.steps
+        }
+
+
+resources = ResourceManager()
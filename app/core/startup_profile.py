@@ -0,0 +1,58 @@
+"""
+Báo cáo thời gian khởi động của một worker: import từng module (python -X importtime)
+và thời gian khởi tạo từng singleton lazy.
+
+    python -m app.core.startup_profile --top 25
+    python -m app.core.startup_profile --all-modules   # gồm cả thư viện bên thứ ba
+"""
+import argparse
+import os
+import subprocess
+import sys
+import time
+from typing import List, Tuple
+
+
+def import_times(target: str = "app.main") -> Tuple[List[Tuple[str, int, int]], float]:
+    """(module, self µs, cumulative µs) của mọi module được import khi import `target`, trong process mới"""
+    start = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {target}"],
+        capture_output=True, text=True, env=os.environ.copy()
+    )
+    wall = time.perf_counter() - start
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1] if proc.stderr else "import failed")
+    rows = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        rows.append((name.strip(), int(self_us), int(cumulative_us)))
+    return rows, wall
+
+
+def main(top: int, all_modules: bool):
+    rows, wall = import_times()
+    total = next((cumulative for name, _, cumulative in rows if name == "app.main"), 0)
+    print(f"Cold import of app.main: {total / 1000:.1f}ms (process wall {wall * 1000:.0f}ms)\n")
+    if not all_modules:
+        rows = [row for row in rows if row[0] == "app" or row[0].startswith("app.")]
+    print(f"{'module':48} {'self ms':>9} {'cumulative ms':>14}")
+    for name, self_us, cumulative_us in sorted(rows, key=lambda row: -row[1])[:top]:
+        print(f"{name:48} {self_us / 1000:9.1f} {cumulative_us / 1000:14.1f}")
+
+    # Khởi tạo các singleton lazy trong process hiện tại (như bước warm-up "services")
+    import app.main  # noqa: F401
+    from app.utils.lazy import resolve_all
+    print(f"\n{'lazy service':48} {'init ms':>9}")
+    for name, seconds in resolve_all().items():
+        print(f"{name:48} {seconds * 1000:9.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Worker startup profile")
+    parser.add_argument("--top", type=int, default=25)
+    parser.add_argument("--all-modules", action="store_true")
+    args = parser.parse_args()
+    main(args.top, args.all_modules)
@@ -1,13 +1,27 @@
+import logging
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from app.core.config import settings
+from app.core.resources import resources
 from app.controllers import chat_controller, ranking_controller
 from app.controllers.university_controller import router as university_router
+from app.utils.response import FastJSONResponse
+
+logger = logging.getLogger("main")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Mở pool/client dùng chung; warm-up chạy nền, /health/ready báo sẵn sàng khi xong
+    await resources.startup()
+    yield
+    await resources.shutdown()
 
 app = FastAPI(
     title=settings.app_name,
     debug=settings.debug,
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # CORS middleware
@@ -41,9 +55,21 @@ async def root():
     }
 
 @app.get("/health")
+@app.get("/health/live")
 async def health_check():
+    """Liveness: process còn phục vụ request"""
     return {"status": "healthy", "app": settings.app_name}
 
+@app.get("/health/ready")
+async def readiness_check():
+    """Readiness: 503 cho tới khi warm-up (index, cache) hoàn tất và các bước bắt buộc thành công"""
+    status = resources.status()
+    state = "ready" if status["ready"] else "failed" if status["failed_critical"] else "warming_up"
+    return FastJSONResponse(
+        {"status": state, **status},
+        status_code=200 if status["ready"] else 503
+    )
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(
@@ -1,24 +1,89 @@
-from app.core.mongo import mongo_db
+import abc
+import bisect
+import datetime
+import itertools
 import uuid
-from app.core.config import settings
+from typing import Any, AsyncIterator, Dict, List, Optional
+
 from bson import ObjectId
+from bson.errors import InvalidId
 
-class ChatRepository:
-    def __init__(self):
-        self.session_collection = mongo_db["chat_sessions"]
-        self.message_collection = mongo_db["chat_messages"]
+from app.core.config import settings
+from app.core.mongo import LazyCollection
+from app.services.chat_archive_service import chat_archive_service
+
+
+class BaseChatRepository(abc.ABC):
+    """
+    Interface lưu phiên chat và tin nhắn, chọn backend qua CHAT_BACKEND (mongo | sqlite | memory).
+    Tin nhắn trả ra có dạng {_id (str), session_id, user_message, bot_response, intent, source, created_at};
+    get_chat_history trả tin mới nhất trước. `source` cho analytics: template (câu trả lời dựng sẵn),
+    llm, fallback (LLM lỗi) hoặc error.
+
+    iter_history phân trang keyset trên (session_id, _id): `before` -> các tin cũ hơn cursor
+    (mới nhất trước), `after` -> các tin mới hơn cursor (cũ nhất trước, cho client kết nối lại).
+    """
+
+    async def open(self):
+        """Chuẩn bị kết nối / schema (gọi trong lifespan)"""
+
+    async def close(self):
+        """Ghi nốt dữ liệu còn chờ và đóng kết nối"""
+
+    @abc.abstractmethod
+    async def create_session(self, user_id: str) -> str:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def create_message(self, session_id: str, user_message: str, bot_response: str, intent: str = "text", source: str = None) -> Dict[str, Any]:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def get_chat_history(self, session_id: str, limit: int = None) -> List[Dict[str, Any]]:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def update_message_bot_response(self, message_id: str, bot_response: str, source: str = None):
+        raise NotImplementedError
+
+    def parse_cursor(self, cursor: str):
+        """Cursor (_id dạng chuỗi) -> khóa so sánh của backend; ValueError nếu không hợp lệ"""
+        return int(cursor)
+
+    @abc.abstractmethod
+    def iter_history(self, session_id: str, limit: int, before: str = None, after: str = None,
+                     fields: List[str] = None) -> AsyncIterator[Dict[str, Any]]:
+        """Async generator: yield tin nhắn theo thứ tự trang"""
+
+
+def project(doc: Dict[str, Any], fields: Optional[List[str]]) -> Dict[str, Any]:
+    """Giữ các trường được yêu cầu (luôn kèm _id để làm cursor)"""
+    if not fields:
+        return doc
+    return {key: doc[key] for key in ["_id", *fields] if key in doc}
+
+
+class MongoChatRepository(BaseChatRepository):
+    session_collection = LazyCollection("chat_sessions")
+    message_collection = LazyCollection("chat_messages")
 
     async def create_session(self, user_id: str) -> str:
         session_id = str(uuid.uuid4())
-        await self.session_collection.insert_one({"user_id": user_id, "session_id": session_id})
+        await self.session_collection.insert_one({
+            "user_id": user_id,
+            "session_id": session_id,
+            "created_at": datetime.datetime.now(datetime.timezone.utc)
+        })
         return session_id
 
-    async def create_message(self, session_id: str, user_message: str, bot_response: str, intent: str = "text"):
+    async def create_message(self, session_id: str, user_message: str, bot_response: str, intent: str = "text", source: str = None):
         doc = {
             "session_id": session_id,
             "user_message": user_message,
             "bot_response": bot_response,
-            "intent": intent
+            "intent": intent,
+            "source": source,
+            "created_at": datetime.datetime.now(datetime.timezone.utc)
         }
         result = await self.message_collection.insert_one(doc)
         doc["_id"] = str(result.inserted_id)
@@ -33,12 +98,120 @@ class ChatRepository:
             if "_id" in doc:
                 doc["_id"] = str(doc["_id"])
             result.append(doc)
+        if len(result) < limit and chat_archive_service.enabled:
+            # Session cũ quay lại: bổ sung phần đã lưu trữ (TTL đã xoá khỏi Mongo)
+            hot_ids = {doc["_id"] for doc in result}
+            archived = await chat_archive_service.get_archived_history(session_id, limit)
+            result.extend(doc for doc in archived if doc["_id"] not in hot_ids)
+            result.sort(key=lambda doc: doc["_id"], reverse=True)
+            result = result[:limit]
         return result
 
-    async def update_message_bot_response(self, message_id: str, bot_response: str):
-        await self.message_collection.update_one(
-            {"_id": ObjectId(message_id)},
-            {"$set": {"bot_response": bot_response}}
-        )
+    async def update_message_bot_response(self, message_id: str, bot_response: str, source: str = None):
+        fields = {"bot_response": bot_response}
+        if source is not None:
+            fields["source"] = source
+        await self.message_collection.update_one({"_id": ObjectId(message_id)}, {"$set": fields})
+
+    def parse_cursor(self, cursor: str) -> ObjectId:
+        try:
+            return ObjectId(cursor)
+        except (InvalidId, TypeError):
+            raise ValueError(f"Invalid cursor: {cursor}")
+
+    async def iter_history(self, session_id: str, limit: int, before: str = None, after: str = None,
+                           fields: List[str] = None):
+        query: Dict[str, Any] = {"session_id": session_id}
+        if after:
+            query["_id"] = {"$gt": self.parse_cursor(after)}
+        elif before:
+            query["_id"] = {"$lt": self.parse_cursor(before)}
+        projection = {field: 1 for field in fields} if fields else None
+        # Index (session_id, _id) phục vụ cả hai chiều; mỗi trang chỉ đọc tối đa `limit` bản ghi
+        cursor = self.message_collection.find(query, projection).sort("_id", 1 if after else -1).limit(limit)
+        remaining = limit
+        boundary = before
+        async for doc in cursor:
+            doc["_id"] = str(doc["_id"])
+            boundary = doc["_id"]
+            remaining -= 1
+            yield doc
+        if after or remaining <= 0 or not chat_archive_service.enabled:
+            return
+        # Hết phần nóng khi lùi về quá khứ: tiếp tục trong kho lưu trữ (cũ hơn mọi tin còn trong Mongo)
+        for doc in await chat_archive_service.get_archived_history(session_id):
+            if boundary is None or doc["_id"] < boundary:
+                yield project(doc, fields)
+                remaining -= 1
+                if remaining <= 0:
+                    return
+
+
+class InMemoryChatRepository(BaseChatRepository):
+    """Backend trong bộ nhớ process (test, benchmark); mất dữ liệu khi restart"""
+
+    def __init__(self):
+        self._ids = itertools.count(1)
+        self._sessions: Dict[str, str] = {}
+        self._messages: Dict[str, Dict[str, Any]] = {}
+        # session_id -> id (int) theo thứ tự tăng dần, để bisect theo cursor
+        self._by_session: Dict[str, List[int]] = {}
+
+    async def create_session(self, user_id: str) -> str:
+        session_id = str(uuid.uuid4())
+        self._sessions[session_id] = user_id
+        return session_id
+
+    async def create_message(self, session_id: str, user_message: str, bot_response: str, intent: str = "text", source: str = None):
+        doc = {
+            "_id": str(next(self._ids)),
+            "session_id": session_id,
+            "user_message": user_message,
+            "bot_response": bot_response,
+            "intent": intent,
+            "source": source,
+            "created_at": datetime.datetime.now(datetime.timezone.utc)
+        }
+        self._messages[doc["_id"]] = doc
+        self._by_session.setdefault(session_id, []).append(int(doc["_id"]))
+        return dict(doc)
+
+    async def get_chat_history(self, session_id: str, limit: int = None):
+        if limit is None:
+            limit = settings.chat_history_limit
+        ids = self._by_session.get(session_id, [])
+        return [dict(self._messages[str(message_id)]) for message_id in reversed(ids[-limit:])] if limit > 0 else []
+
+    async def update_message_bot_response(self, message_id: str, bot_response: str, source: str = None):
+        doc = self._messages.get(str(message_id))
+        if doc is not None:
+            doc["bot_response"] = bot_response
+            if source is not None:
+                doc["source"] = source
+
+    async def iter_history(self, session_id: str, limit: int, before: str = None, after: str = None,
+                           fields: List[str] = None):
+        ids = self._by_session.get(session_id, [])
+        if after:
+            start = bisect.bisect_right(ids, self.parse_cursor(after))
+            page = ids[start:start + limit]
+        else:
+            end = bisect.bisect_left(ids, self.parse_cursor(before)) if before else len(ids)
+            page = ids[max(end - limit, 0):end][::-1]
+        for message_id in page:
+            yield project(dict(self._messages[str(message_id)]), fields)
+
+
+def create_chat_repository(backend: Optional[str] = None) -> BaseChatRepository:
+    backend = (backend or settings.chat_backend).lower()
+    if backend == "mongo":
+        return MongoChatRepository()
+    if backend == "sqlite":
+        from app.repositories.sqlite_chat_repository import SQLiteChatRepository
+        return SQLiteChatRepository(settings.sqlite_path)
+    if backend == "memory":
+        return InMemoryChatRepository()
+    raise ValueError(f"Unknown CHAT_BACKEND: {backend}")
+
 
-chat_repository = ChatRepository()
\ No newline at end of file
+chat_repository = create_chat_repository()
@@ -0,0 +1,46 @@
+import datetime
+from typing import Optional
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from app.core.mongo import LazyCollection
+
+class LeaseLostError(Exception):
+    """Worker khác đã giành lease trong lúc job đang chạy"""
+
+class LeaseRepository:
+    """Lease trên Mongo (sync_leases) để chỉ một worker làm leader cho một job nền"""
+
+    collection = LazyCollection("sync_leases")
+
+    async def acquire(self, name: str, owner: str, ttl_seconds: float) -> Optional[dict]:
+        """Giành hoặc gia hạn lease; trả về lease doc nếu thành công, None nếu worker khác đang giữ"""
+        now = datetime.datetime.now(datetime.timezone.utc)
+        try:
+            return await self.collection.find_one_and_update(
+                {"_id": name, "$or": [{"owner": owner}, {"expires_at": {"$lte": now}}]},
+                {"$set": {
+                    "owner": owner,
+                    "renewed_at": now,
+                    "expires_at": now + datetime.timedelta(seconds=ttl_seconds)
+                }},
+                upsert=True,
+                return_document=ReturnDocument.AFTER
+            )
+        except DuplicateKeyError:
+            # Lease đang được giữ: upsert va chạm với _id đã tồn tại
+            return None
+
+    async def update(self, name: str, owner: str, fields: dict):
+        """Ghi trạng thái job vào lease (chỉ khi còn là chủ lease)"""
+        await self.collection.update_one({"_id": name, "owner": owner}, {"$set": fields})
+
+    async def release(self, name: str, owner: str):
+        await self.collection.update_one(
+            {"_id": name, "owner": owner},
+            {"$set": {"expires_at": datetime.datetime.now(datetime.timezone.utc)}}
+        )
+
+    async def get(self, name: str) -> Optional[dict]:
+        return await self.collection.find_one({"_id": name})
+
+lease_repository = LeaseRepository()
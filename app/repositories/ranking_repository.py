@@ -1,8 +1,16 @@
-from app.core.mongo import mongo_db
+from typing import Callable, Optional
+from pymongo import UpdateOne
+from app.core.mongo import LazyCollection
 
 class RankingRepository:
+    collection = LazyCollection("student_ranking")
+
     def __init__(self):
-        self.collection = mongo_db["student_ranking"]
+        # Nguồn cục bộ (score store memory-map) được tra trước Mongo
+        self._local_source: Optional[Callable[[str], Optional[dict]]] = None
+
+    def set_local_source(self, source: Callable[[str], Optional[dict]]):
+        self._local_source = source
 
     async def upsert_ranking(self, candidate_number: str, data: dict):
         await self.collection.update_one(
@@ -12,6 +20,27 @@ class RankingRepository:
         )
 
     async def get_by_candidate_number(self, candidate_number: str):
+        if self._local_source is not None:
+            doc = self._local_source(candidate_number)
+            if doc is not None:
+                return doc
         return await self.collection.find_one({"candidate_number": candidate_number})
 
+    async def get_many_by_candidate_numbers(self, candidate_numbers: list, batch_size: int = 1000) -> dict:
+        result = {}
+        for i in range(0, len(candidate_numbers), batch_size):
+            cursor = self.collection.find({"candidate_number": {"$in": candidate_numbers[i:i + batch_size]}})
+            async for doc in cursor:
+                result[doc["candidate_number"]] = doc
+        return result
+
+    async def bulk_upsert_rankings(self, docs: list):
+        if not docs:
+            return None
+        operations = [
+            UpdateOne({"candidate_number": doc["candidate_number"]}, {"$set": doc}, upsert=True)
+            for doc in docs
+        ]
+        return await self.collection.bulk_write(operations, ordered=False)
+
 ranking_repository = RankingRepository()
\ No newline at end of file
@@ -0,0 +1,21 @@
+from pymongo import ReplaceOne
+from app.core.mongo import LazyCollection
+
+class ScoreDistributionRepository:
+    collection = LazyCollection("score_distributions")
+
+    async def replace_year(self, year: int, docs: list):
+        """Ghi đè histogram của cả năm trong một lần bulk_write"""
+        if not docs:
+            return None
+        operations = [
+            ReplaceOne({"block": doc["block"], "region": doc["region"], "year": year}, doc, upsert=True)
+            for doc in docs
+        ]
+        return await self.collection.bulk_write(operations, ordered=False)
+
+    async def get_year(self, year: int):
+        cursor = self.collection.find({"year": year}, {"_id": 0})
+        return [doc async for doc in cursor]
+
+score_distribution_repository = ScoreDistributionRepository()
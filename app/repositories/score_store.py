@@ -0,0 +1,164 @@
+import json
+import os
+import shutil
+import time
+from pathlib import Path
+from typing import Dict, Optional
+
+import numpy as np
+
+from app.core.exam_blocks import SUBJECTS
+
+SUBJECT_KEYS = list(SUBJECTS.keys())
+STORE_VERSION = 1
+# Điểm môn / điểm ưu tiên lượng tử hóa uint8 với bước 0.05; 255 = không có điểm
+QUANT_SCALE = 20
+MISSING = 255
+# SBD lưu dạng uint32
+MAX_CANDIDATE_NUMBER = np.iinfo(np.uint32).max
+
+
+def _quantize(values: np.ndarray) -> np.ndarray:
+    quantized = np.full(values.shape, MISSING, dtype=np.uint8)
+    present = ~np.isnan(values)
+    quantized[present] = np.clip(np.rint(values[present] * QUANT_SCALE), 0, MISSING - 1).astype(np.uint8)
+    return quantized
+
+
+def _dequantize(values: np.ndarray) -> np.ndarray:
+    result = values.astype(np.float32) / QUANT_SCALE
+    result[values == MISSING] = np.nan
+    return result
+
+
+class ScoreStore:
+    """
+    Kho điểm dạng cột cho một năm thi: cột SBD uint32 đã sắp xếp, mỗi môn một cột
+    uint8 lượng tử hóa, cộng cột khu vực và điểm ưu tiên. Các cột là file .npy được
+    memory-map (chỉ đọc) nên mọi worker uvicorn dùng chung page cache của hệ điều hành;
+    tra cứu theo SBD là binary search O(log n), không tạo object Python cho từng bản ghi.
+    """
+
+    def __init__(self, year: int, sbd: np.ndarray, subjects: Dict[str, np.ndarray],
+                 region: np.ndarray, priority: np.ndarray, path: Optional[Path] = None):
+        self.year = year
+        self.sbd = sbd
+        self.subjects = subjects
+        self.region = region
+        self.priority = priority
+        self.path = path
+
+    def __len__(self) -> int:
+        return int(self.sbd.size)
+
+    @classmethod
+    def from_arrays(cls, year: int, sbd: np.ndarray, scores: np.ndarray, region_idx: np.ndarray,
+                    priority: Optional[np.ndarray] = None) -> "ScoreStore":
+        """Dựng store in-memory từ ma trận điểm float (NaN = không thi), sắp xếp theo SBD"""
+        order = np.argsort(sbd, kind="stable")
+        if priority is None:
+            priority = np.zeros(sbd.size, dtype=np.float32)
+        return cls(
+            year=year,
+            sbd=np.ascontiguousarray(sbd[order], dtype=np.uint32),
+            subjects={key: _quantize(scores[order, i]) for i, key in enumerate(SUBJECT_KEYS)},
+            region=np.ascontiguousarray(region_idx[order], dtype=np.uint8),
+            priority=_quantize(priority[order].astype(np.float32))
+        )
+
+    @classmethod
+    def open(cls, path) -> "ScoreStore":
+        path = Path(path)
+        with open(path / "meta.json", "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("version") != STORE_VERSION:
+            raise ValueError(f"Unsupported score store version at {path}: {meta.get('version')}")
+
+        def load(name):
+            return np.load(path / f"{name}.npy", mmap_mode="r")
+
+        return cls(
+            year=meta["year"],
+            sbd=load("sbd"),
+            subjects={key: load(f"subject_{key}") for key in meta["subjects"]},
+            region=load("region"),
+            priority=load("priority"),
+            path=path
+        )
+
+    @staticmethod
+    def exists(path) -> bool:
+        return (Path(path) / "meta.json").exists()
+
+    def save(self, path) -> "ScoreStore":
+        """
+        Ghi store vào thư mục phiên bản mới (<path>.v<ns>) rồi trỏ symlink `path` sang đó bằng
+        os.replace (nguyên tử): người đọc luôn thấy store cũ hoặc store mới đầy đủ. Phiên bản
+        cũ bị xoá sau khi đổi; worker đang map file cũ vẫn giữ inode cũ cho tới khi mở lại.
+        """
+        path = Path(path)
+        version = path.with_name(f"{path.name}.v{time.time_ns()}")
+        version.mkdir(parents=True)
+        np.save(version / "sbd.npy", self.sbd)
+        np.save(version / "region.npy", self.region)
+        np.save(version / "priority.npy", self.priority)
+        for key, column in self.subjects.items():
+            np.save(version / f"subject_{key}.npy", column)
+        with open(version / "meta.json", "w", encoding="utf-8") as f:
+            json.dump({
+                "version": STORE_VERSION,
+                "year": self.year,
+                "count": len(self),
+                "quant_scale": QUANT_SCALE,
+                "subjects": list(self.subjects.keys())
+            }, f)
+        previous = path.resolve() if path.is_symlink() else None
+        if path.is_dir() and not path.is_symlink():
+            # Store cũ dạng thư mục thường (trước khi có symlink): chuyển sang bên cạnh một lần
+            legacy = path.with_name(f"{path.name}.old-{os.getpid()}")
+            os.rename(path, legacy)
+            previous = legacy
+        link = path.with_name(f"{path.name}.link-{os.getpid()}")
+        if link.is_symlink():
+            link.unlink()
+        os.symlink(version.name, link)
+        os.replace(link, path)
+        if previous is not None and previous != version:
+            shutil.rmtree(previous, ignore_errors=True)
+        return ScoreStore.open(path)
+
+    def find(self, candidate_number: str) -> Optional[int]:
+        if not candidate_number or not candidate_number.isdigit():
+            return None
+        number = int(candidate_number)
+        # SBD ngoài miền uint32 không thể có trong store (np.uint32 sẽ OverflowError)
+        if number > MAX_CANDIDATE_NUMBER:
+            return None
+        value = np.uint32(number)
+        pos = int(np.searchsorted(self.sbd, value))
+        if pos >= self.sbd.size or self.sbd[pos] != value:
+            return None
+        return pos
+
+    def row_scores(self, pos: int) -> np.ndarray:
+        """Điểm các môn (theo SUBJECT_KEYS) của một thí sinh, NaN nếu không thi"""
+        raw = np.array([self.subjects[key][pos] if key in self.subjects else MISSING for key in SUBJECT_KEYS],
+                       dtype=np.uint8)
+        return _dequantize(raw)
+
+    def row_priority(self, pos: int) -> float:
+        value = self.priority[pos]
+        return 0.0 if value == MISSING else float(value) / QUANT_SCALE
+
+    def scores_matrix(self) -> np.ndarray:
+        """Ma trận điểm float32 [n, SUBJECT_KEYS] cho tính toán hàng loạt"""
+        matrix = np.full((len(self), len(SUBJECT_KEYS)), np.nan, dtype=np.float32)
+        for i, key in enumerate(SUBJECT_KEYS):
+            if key in self.subjects:
+                matrix[:, i] = _dequantize(np.asarray(self.subjects[key]))
+        return matrix
+
+    def priority_array(self) -> np.ndarray:
+        priority = _dequantize(np.asarray(self.priority))
+        priority[np.isnan(priority)] = 0.0
+        return priority
@@ -0,0 +1,287 @@
+import asyncio
+import datetime
+import logging
+import sqlite3
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.core.config import settings
+from app.repositories.chat_repository import BaseChatRepository, project
+
+logger = logging.getLogger("sqlite_chat_repository")
+
+# Cùng schema với chatbot_tuyensinh.db; chỉ tạo khi file DB mới
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS chat_sessions (
+    user_id VARCHAR(100) NOT NULL,
+    session_id VARCHAR(100),
+    id INTEGER NOT NULL,
+    created_at DATETIME DEFAULT (CURRENT_TIMESTAMP),
+    updated_at DATETIME DEFAULT (CURRENT_TIMESTAMP),
+    PRIMARY KEY (id)
+);
+CREATE UNIQUE INDEX IF NOT EXISTS ix_chat_sessions_session_id ON chat_sessions (session_id);
+CREATE TABLE IF NOT EXISTS chat_messages (
+    session_id VARCHAR(100) NOT NULL,
+    user_message TEXT NOT NULL,
+    bot_response TEXT NOT NULL,
+    message_type VARCHAR(50),
+    source VARCHAR(20),
+    id INTEGER NOT NULL,
+    created_at DATETIME DEFAULT (CURRENT_TIMESTAMP),
+    updated_at DATETIME DEFAULT (CURRENT_TIMESTAMP),
+    PRIMARY KEY (id)
+);
+CREATE INDEX IF NOT EXISTS ix_chat_messages_session_id_id ON chat_messages (session_id, id);
+"""
+
+# Câu lệnh cố định: sqlite3 cache prepared statement theo chuỗi SQL trên mỗi connection
+INSERT_SESSION = "INSERT INTO chat_sessions (user_id, session_id, created_at, updated_at) VALUES (?, ?, ?, ?)"
+INSERT_MESSAGE = (
+    "INSERT INTO chat_messages (session_id, user_message, bot_response, message_type, source, created_at, updated_at) "
+    "VALUES (?, ?, ?, ?, ?, ?, ?)"
+)
+UPDATE_BOT_RESPONSE = "UPDATE chat_messages SET bot_response = ?, source = COALESCE(?, source), updated_at = ? WHERE id = ?"
+SELECT_COLUMNS = "SELECT id, session_id, user_message, bot_response, message_type, source, created_at FROM chat_messages "
+SELECT_HISTORY = SELECT_COLUMNS + "WHERE session_id = ? ORDER BY id DESC LIMIT ?"
+# Phân trang keyset trên index (session_id, id)
+SELECT_HISTORY_BEFORE = SELECT_COLUMNS + "WHERE session_id = ? AND id < ? ORDER BY id DESC LIMIT ?"
+SELECT_HISTORY_AFTER = SELECT_COLUMNS + "WHERE session_id = ? AND id > ? ORDER BY id ASC LIMIT ?"
+
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S.%f"
+
+
+def _now() -> str:
+    return datetime.datetime.now(datetime.timezone.utc).strftime(TIMESTAMP_FORMAT)
+
+
+def _parse_timestamp(value: Optional[str]) -> Optional[datetime.datetime]:
+    """Thời điểm UTC lưu dạng text (có hoặc không phần micro giây như CURRENT_TIMESTAMP)"""
+    if not value:
+        return None
+    try:
+        return datetime.datetime.fromisoformat(value).replace(tzinfo=datetime.timezone.utc)
+    except ValueError:
+        return None
+
+
+def _row_to_message(row: Tuple) -> Dict[str, Any]:
+    message_id, session_id, user_message, bot_response, message_type, source, created_at = row
+    return {
+        "_id": str(message_id),
+        "session_id": session_id,
+        "user_message": user_message,
+        "bot_response": bot_response,
+        "intent": message_type,
+        "source": source,
+        "created_at": _parse_timestamp(created_at)
+    }
+
+
+class SQLiteChatRepository(BaseChatRepository):
+    """
+    Backend SQLite nhúng cho triển khai một node (không cần Mongo), dùng các bảng
+    chat_sessions / chat_messages sẵn có; intent được lưu ở cột message_type.
+
+    - WAL + synchronous=NORMAL: đọc không chặn ghi, commit không fsync mỗi lần.
+    - Đọc: pool SQLITE_READ_POOL_SIZE thread, mỗi thread giữ một connection riêng.
+    - Ghi: một thread writer duy nhất; các lệnh ghi tới cùng lúc được gom thành một
+      transaction (tối đa SQLITE_WRITE_BATCH_SIZE lệnh) -> một commit cho cả lô.
+    """
+
+    def __init__(self, path: str, read_pool_size: int = None, batch_size: int = None):
+        self.path = path
+        self.read_pool_size = read_pool_size or settings.sqlite_read_pool_size
+        self.batch_size = batch_size or settings.sqlite_write_batch_size
+        self._local = threading.local()
+        self._connections: List[sqlite3.Connection] = []
+        self._connections_lock = threading.Lock()
+        self._readers: Optional[ThreadPoolExecutor] = None
+        self._writer: Optional[ThreadPoolExecutor] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._writer_task: Optional[asyncio.Task] = None
+        # Reader (pool) và writer có thể cùng gọi _ensure_schema lần đầu
+        self._schema_lock = threading.Lock()
+        self._schema_ready = False
+        self.batches = 0
+        self.batched_writes = 0
+
+    # ---------- Connections ----------
+
+    def _connect(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(self.path, timeout=5.0, isolation_level=None, check_same_thread=False, cached_statements=64)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        connection.execute("PRAGMA busy_timeout=5000")
+        connection.execute("PRAGMA temp_store=MEMORY")
+        with self._connections_lock:
+            self._connections.append(connection)
+        return connection
+
+    def _connection(self) -> sqlite3.Connection:
+        """Connection riêng của thread hiện tại (mỗi thread trong pool giữ một connection)"""
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = self._local.connection = self._connect()
+        return connection
+
+    def _ensure_schema(self):
+        if self._schema_ready:
+            return
+        with self._schema_lock:
+            if self._schema_ready:
+                return
+            connection = self._connection()
+            connection.executescript(SCHEMA)
+            # File DB tạo trước khi có cột source
+            columns = {row[1] for row in connection.execute("PRAGMA table_info(chat_messages)")}
+            if "source" not in columns:
+                connection.execute("ALTER TABLE chat_messages ADD COLUMN source VARCHAR(20)")
+            self._schema_ready = True
+
+    def _executors(self):
+        if self._readers is None:
+            self._readers = ThreadPoolExecutor(self.read_pool_size, thread_name_prefix="sqlite-read")
+            self._writer = ThreadPoolExecutor(1, thread_name_prefix="sqlite-write")
+        return self._readers, self._writer
+
+    async def open(self):
+        _, writer = self._executors()
+        await asyncio.get_running_loop().run_in_executor(writer, self._ensure_schema)
+
+    async def close(self):
+        if self._writer_task is not None:
+            await self._queue.join()
+            self._writer_task.cancel()
+            try:
+                await self._writer_task
+            except asyncio.CancelledError:
+                pass
+            self._writer_task = None
+            self._queue = None
+        if self._readers is not None:
+            self._readers.shutdown(wait=True)
+            self._writer.shutdown(wait=True)
+            self._readers = self._writer = None
+        with self._connections_lock:
+            for connection in self._connections:
+                connection.close()
+            self._connections = []
+        self._local = threading.local()
+        self._schema_ready = False
+
+    # ---------- Ghi theo lô ----------
+
+    async def _write(self, sql: str, params: Tuple) -> int:
+        """Đưa một lệnh ghi vào hàng đợi; trả về lastrowid sau khi lô chứa nó được commit"""
+        if self._writer_task is None or self._writer_task.done():
+            self._queue = asyncio.Queue()
+            self._writer_task = asyncio.create_task(self._writer_loop())
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((sql, params, future))
+        return await future
+
+    async def _writer_loop(self):
+        _, writer = self._executors()
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            # Gom các lệnh đang chờ sẵn (không đợi thêm): tải càng cao lô càng lớn
+            while len(batch) < self.batch_size and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            try:
+                try:
+                    results = await loop.run_in_executor(writer, self._apply_batch, [(sql, params) for sql, params, _ in batch])
+                    for (_, _, future), result in zip(batch, results):
+                        if not future.done():
+                            future.set_result(result)
+                except Exception:
+                    if len(batch) == 1:
+                        raise
+                    # Một lệnh lỗi làm hỏng cả lô: chạy lại từng lệnh để chỉ lệnh đó nhận lỗi
+                    for sql, params, future in batch:
+                        try:
+                            result = (await loop.run_in_executor(writer, self._apply_batch, [(sql, params)]))[0]
+                            if not future.done():
+                                future.set_result(result)
+                        except Exception as e:
+                            if not future.done():
+                                future.set_exception(e)
+            except Exception as e:
+                for _, _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+            finally:
+                self.batches += 1
+                self.batched_writes += len(batch)
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _apply_batch(self, statements: List[Tuple[str, Tuple]]) -> List[int]:
+        self._ensure_schema()
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            results = [connection.execute(sql, params).lastrowid for sql, params in statements]
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+        return results
+
+    # ---------- Đọc ----------
+
+    async def _read(self, fn, *args):
+        readers, _ = self._executors()
+        return await asyncio.get_running_loop().run_in_executor(readers, fn, *args)
+
+    def _select_history(self, session_id: str, limit: int, before: int = None, after: int = None) -> List[Dict[str, Any]]:
+        self._ensure_schema()
+        if after is not None:
+            rows = self._connection().execute(SELECT_HISTORY_AFTER, (session_id, after, limit))
+        elif before is not None:
+            rows = self._connection().execute(SELECT_HISTORY_BEFORE, (session_id, before, limit))
+        else:
+            rows = self._connection().execute(SELECT_HISTORY, (session_id, limit))
+        return [_row_to_message(row) for row in rows]
+
+    # ---------- Interface ----------
+
+    async def create_session(self, user_id: str) -> str:
+        session_id = str(uuid.uuid4())
+        now = _now()
+        await self._write(INSERT_SESSION, (user_id, session_id, now, now))
+        return session_id
+
+    async def create_message(self, session_id: str, user_message: str, bot_response: str, intent: str = "text", source: str = None):
+        now = _now()
+        message_id = await self._write(INSERT_MESSAGE, (session_id, user_message, bot_response, intent, source, now, now))
+        return {
+            "_id": str(message_id),
+            "session_id": session_id,
+            "user_message": user_message,
+            "bot_response": bot_response,
+            "intent": intent,
+            "source": source,
+            "created_at": _parse_timestamp(now)
+        }
+
+    async def get_chat_history(self, session_id: str, limit: int = None):
+        if limit is None:
+            limit = settings.chat_history_limit
+        return await self._read(self._select_history, session_id, limit)
+
+    async def update_message_bot_response(self, message_id: str, bot_response: str, source: str = None):
+        await self._write(UPDATE_BOT_RESPONSE, (bot_response, source, _now(), int(message_id)))
+
+    async def iter_history(self, session_id: str, limit: int, before: str = None, after: str = None,
+                           fields: List[str] = None):
+        page = await self._read(
+            self._select_history, session_id, limit,
+            self.parse_cursor(before) if before else None,
+            self.parse_cursor(after) if after else None
+        )
+        for doc in page:
+            yield project(doc, fields)
@@ -1,6 +1,9 @@
 from pydantic import BaseModel, Field
 from typing import List
 
+# Khu vực hợp lệ (app.core.exam_blocks.REGIONS); rỗng = CN
+REGION_PATTERN = "^(CN|MB|MT|MN)?$"
+
 class RankingSearchRequest(BaseModel):
     candidate_number: str = Field(
         ...,
@@ -9,7 +12,7 @@ class RankingSearchRequest(BaseModel):
         pattern="^\d{8}$",
         description="Số báo danh (8 chữ số)"
     )
-    region: str = Field(default="CN", description="Khu vực: CN, MB, MT, MN")
+    region: str = Field(default="CN", pattern=REGION_PATTERN, description="Khu vực: CN, MB, MT, MN")
 
 class SubjectScore(BaseModel):
     name: str
@@ -35,4 +38,8 @@ class StudentRankingResponse(BaseModel):
     candidate_number: str
     mark_info: List[SubjectScore]
     data_year: int
-    blocks: List[BlockRanking] 
\ No newline at end of file
+    blocks: List[BlockRanking]
+
+class BulkRankingRequest(BaseModel):
+    candidate_numbers: List[str] = Field(..., min_length=1, description="Danh sách số báo danh")
+    region: str = Field(default="CN", pattern=REGION_PATTERN, description="Khu vực: CN, MB, MT, MN")
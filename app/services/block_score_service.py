@@ -0,0 +1,133 @@
+import datetime
+import logging
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+
+from app.core.exam_blocks import EXAM_BLOCKS, REGIONS, SUBJECTS
+
+logger = logging.getLogger("block_score_service")
+
+SUBJECT_KEYS = list(SUBJECTS.keys())
+# Điểm được lượng tử hóa x100 (bước 0.01) để làm chỉ số bin của histogram
+SCORE_SCALE = 100
+# 30 điểm thi + tối đa 2.75 điểm ưu tiên, làm tròn lên
+MAX_SCORE = 33
+NUM_BINS = MAX_SCORE * SCORE_SCALE + 1
+# Từ ngưỡng này điểm ưu tiên giảm tuyến tính về 0 tại 30 điểm (quy chế tuyển sinh từ 2023)
+PRIORITY_THRESHOLD = 22.5
+
+
+class ScoreDistribution:
+    """Histogram điểm một khối/khu vực và phân phối tích lũy để xếp hạng O(1)"""
+
+    __slots__ = ("counts", "at_or_above")
+
+    def __init__(self, counts: np.ndarray):
+        self.counts = counts.astype(np.int64, copy=False)
+        # at_or_above[i] = số thí sinh có điểm >= bin i
+        self.at_or_above = np.cumsum(self.counts[::-1])[::-1]
+
+    @property
+    def total(self) -> int:
+        return int(self.at_or_above[0]) if self.at_or_above.size else 0
+
+    def rank(self, score: float) -> Dict[str, int]:
+        index = min(max(int(round(score * SCORE_SCALE)), 0), self.counts.size - 1)
+        higher = int(self.at_or_above[index + 1]) if index + 1 < self.counts.size else 0
+        return {"equal": int(self.counts[index]), "higher": higher, "total": self.total}
+
+    def cdf(self) -> np.ndarray:
+        """Tỷ lệ thí sinh có điểm <= mỗi bin"""
+        total = self.total
+        if not total:
+            return np.zeros(self.counts.size, dtype=np.float64)
+        return np.cumsum(self.counts) / total
+
+    def to_doc(self) -> Dict[str, Any]:
+        """Dạng lưu Mongo: chỉ giữ đoạn bin khác 0"""
+        nonzero = np.flatnonzero(self.counts)
+        if not nonzero.size:
+            return {"scale": SCORE_SCALE, "offset": 0, "counts": [], "total": 0}
+        start, end = int(nonzero[0]), int(nonzero[-1]) + 1
+        return {
+            "scale": SCORE_SCALE,
+            "offset": start,
+            "counts": self.counts[start:end].tolist(),
+            "total": self.total
+        }
+
+    @classmethod
+    def from_doc(cls, doc: Dict[str, Any]) -> "ScoreDistribution":
+        counts = np.zeros(NUM_BINS, dtype=np.int64)
+        values = np.asarray(doc.get("counts", []), dtype=np.int64)
+        offset = int(doc.get("offset", 0))
+        counts[offset:offset + values.size] = values
+        return cls(counts)
+
+
+class BlockScoreEngine:
+    """
+    Tính điểm mọi khối cho toàn bộ thí sinh cùng lúc bằng NumPy.
+
+    Đầu vào là ma trận điểm môn [n thí sinh, SUBJECT_KEYS] (NaN = không thi môn đó)
+    và (tùy chọn) điểm ưu tiên của từng thí sinh. Thiếu bất kỳ môn thành phần nào
+    thì thí sinh không có điểm khối đó (NaN).
+    """
+
+    def __init__(self):
+        index = {key: i for i, key in enumerate(SUBJECT_KEYS)}
+        self.block_columns = {block: [index[s] for s in subjects] for block, subjects in EXAM_BLOCKS.items()}
+
+    def compute_totals(self, scores: np.ndarray, priority: Optional[np.ndarray] = None) -> Dict[str, np.ndarray]:
+        """Tổng điểm từng khối (float32), đã cộng điểm ưu tiên nếu có"""
+        totals = {}
+        for block, columns in self.block_columns.items():
+            raw = scores[:, columns].sum(axis=1, dtype=np.float32)
+            if priority is not None:
+                raw = raw + self.priority_bonus(raw, priority)
+            totals[block] = raw
+        return totals
+
+    def priority_bonus(self, raw: np.ndarray, priority: np.ndarray) -> np.ndarray:
+        """Điểm ưu tiên thực cộng: giữ nguyên dưới 22.5, giảm dần về 0 khi đạt 30"""
+        factor = np.where(raw < PRIORITY_THRESHOLD, 1.0, (30.0 - raw) / 7.5)
+        bonus = np.clip(factor, 0.0, 1.0) * priority
+        return np.round(bonus, 2).astype(np.float32)
+
+    def build_distributions(self, totals: Dict[str, np.ndarray], region_idx: np.ndarray) -> Dict[Tuple[str, str], ScoreDistribution]:
+        """Histogram theo (khối, khu vực); CN là cả nước"""
+        distributions = {}
+        for block, block_totals in totals.items():
+            present = ~np.isnan(block_totals)
+            bins = np.clip(np.rint(block_totals[present] * SCORE_SCALE), 0, NUM_BINS - 1).astype(np.intp)
+            regions = region_idx[present]
+            for i, region in enumerate(REGIONS):
+                values = bins if region == "CN" else bins[regions == i]
+                distributions[(block, region)] = ScoreDistribution(np.bincount(values, minlength=NUM_BINS))
+        return distributions
+
+    def save_npz(self, path: str, distributions: Dict[Tuple[str, str], ScoreDistribution], year: int):
+        arrays = {f"{block}_{region}": dist.counts for (block, region), dist in distributions.items()}
+        np.savez_compressed(path, year=np.int32(year), scale=np.int32(SCORE_SCALE), **arrays)
+
+    def load_npz(self, path: str) -> Tuple[int, Dict[Tuple[str, str], ScoreDistribution]]:
+        with np.load(path) as data:
+            year = int(data["year"])
+            distributions = {}
+            for key in data.files:
+                if key in ("year", "scale"):
+                    continue
+                block, region = key.rsplit("_", 1)
+                distributions[(block, region)] = ScoreDistribution(data[key])
+        return year, distributions
+
+    def to_documents(self, distributions: Dict[Tuple[str, str], ScoreDistribution], year: int) -> list:
+        computed_at = datetime.datetime.now(datetime.timezone.utc)
+        return [
+            {"block": block, "region": region, "year": year, "computed_at": computed_at, **dist.to_doc()}
+            for (block, region), dist in distributions.items()
+        ]
+
+
+block_score_engine = BlockScoreEngine()
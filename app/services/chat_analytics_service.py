@@ -0,0 +1,221 @@
+"""
+Analytics lịch sử chat chạy phía server (MongoDB aggregation) và export dạng stream.
+
+Cửa sổ thời gian lọc theo khoảng _id (ObjectId chứa thời điểm tạo) nên đi qua index _id
+và áp dụng cả cho bản ghi cũ chưa có created_at. Không truy vấn nào kéo cả collection
+về Python: export duyệt cursor theo lô, các chỉ số được tính bằng pipeline.
+
+    python -m app.services.chat_analytics_service report --since 2025-07-01 --bucket day
+    python -m app.services.chat_analytics_service export --out chat_messages.ndjson.gz --since 2025-07-01
+"""
+import argparse
+import asyncio
+import datetime
+import sys
+import zlib
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from bson import ObjectId
+
+from app.core.config import settings
+from app.core.mongo import LazyCollection
+from app.utils.response import dumps
+
+# Khung thời gian -> định dạng $dateToString
+BUCKET_FORMATS = {
+    "hour": "%Y-%m-%dT%H:00:00Z",
+    "day": "%Y-%m-%d",
+    "week": "%G-W%V",
+    "month": "%Y-%m"
+}
+
+# Ranh giới histogram số tin nhắn mỗi session
+SESSION_SIZE_BOUNDARIES = [1, 2, 3, 5, 10, 20, 50, 100]
+
+EXPORT_FIELDS = ["session_id", "user_message", "bot_response", "intent", "source", "created_at"]
+
+
+def parse_time(value: Optional[str]) -> Optional[datetime.datetime]:
+    """ISO date/datetime (vd. 2025-07-01 hoặc 2025-07-01T08:00:00Z), mặc định UTC"""
+    if not value:
+        return None
+    parsed = datetime.datetime.fromisoformat(value.replace("Z", "+00:00"))
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=datetime.timezone.utc)
+
+
+def _is_error():
+    # Bản ghi cũ chưa có source: lỗi được ghi với intent "error"
+    return {"$or": [{"$in": ["$source", ["fallback", "error"]]}, {"$eq": ["$intent", "error"]}]}
+
+
+class ChatAnalyticsService:
+    message_collection = LazyCollection("chat_messages")
+
+    def window(self, since: datetime.datetime = None, until: datetime.datetime = None) -> Dict[str, Any]:
+        """Filter khoảng thời gian [since, until) theo _id"""
+        bounds = {}
+        if since:
+            bounds["$gte"] = ObjectId.from_datetime(since)
+        if until:
+            bounds["$lt"] = ObjectId.from_datetime(until)
+        return {"_id": bounds} if bounds else {}
+
+    async def _aggregate(self, pipeline: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        cursor = self.message_collection.aggregate(pipeline, allowDiskUse=True)
+        return await cursor.to_list(None)
+
+    # ---------- Chỉ số ----------
+
+    async def intent_distribution(self, since=None, until=None) -> List[Dict[str, Any]]:
+        rows = await self._aggregate([
+            {"$match": self.window(since, until)},
+            {"$group": {"_id": {"$ifNull": ["$intent", "unknown"]}, "count": {"$sum": 1}}},
+            {"$sort": {"count": -1}}
+        ])
+        return [{"intent": row["_id"], "count": row["count"]} for row in rows]
+
+    async def source_share(self, since=None, until=None) -> List[Dict[str, Any]]:
+        """Tỷ lệ câu trả lời dựng sẵn (template) so với LLM / fallback / error"""
+        rows = await self._aggregate([
+            {"$match": self.window(since, until)},
+            {"$group": {"_id": {"$ifNull": ["$source", "unknown"]}, "count": {"$sum": 1}}},
+            {"$sort": {"count": -1}}
+        ])
+        total = sum(row["count"] for row in rows)
+        return [
+            {"source": row["_id"], "count": row["count"], "share": round(row["count"] / total, 4)}
+            for row in rows
+        ]
+
+    async def messages_per_session(self, since=None, until=None) -> Dict[str, Any]:
+        rows = await self._aggregate([
+            {"$match": self.window(since, until)},
+            {"$group": {"_id": "$session_id", "messages": {"$sum": 1}}},
+            {"$facet": {
+                "summary": [{"$group": {
+                    "_id": None,
+                    "sessions": {"$sum": 1},
+                    "messages": {"$sum": "$messages"},
+                    "avg": {"$avg": "$messages"},
+                    "max": {"$max": "$messages"}
+                }}],
+                "histogram": [{"$bucket": {
+                    "groupBy": "$messages",
+                    "boundaries": SESSION_SIZE_BOUNDARIES,
+                    "default": f"{SESSION_SIZE_BOUNDARIES[-1]}+",
+                    "output": {"sessions": {"$sum": 1}}
+                }}]
+            }}
+        ])
+        facet = rows[0] if rows else {"summary": [], "histogram": []}
+        summary = facet["summary"][0] if facet["summary"] else {"sessions": 0, "messages": 0, "avg": None, "max": None}
+        summary.pop("_id", None)
+        if summary["avg"] is not None:
+            summary["avg"] = round(summary["avg"], 2)
+        summary["histogram"] = [{"min_messages": row["_id"], "sessions": row["sessions"]} for row in facet["histogram"]]
+        return summary
+
+    async def error_rates(self, since=None, until=None, bucket: str = "day") -> List[Dict[str, Any]]:
+        """Số tin nhắn và tỷ lệ lỗi (fallback / error) theo khung thời gian"""
+        if bucket not in BUCKET_FORMATS:
+            raise ValueError(f"bucket must be one of {', '.join(BUCKET_FORMATS)}")
+        rows = await self._aggregate([
+            {"$match": self.window(since, until)},
+            {"$group": {
+                "_id": {"$dateToString": {"format": BUCKET_FORMATS[bucket], "date": {"$toDate": "$_id"}}},
+                "messages": {"$sum": 1},
+                "errors": {"$sum": {"$cond": [_is_error(), 1, 0]}}
+            }},
+            {"$sort": {"_id": 1}}
+        ])
+        return [
+            {"bucket": row["_id"], "messages": row["messages"], "errors": row["errors"],
+             "error_rate": round(row["errors"] / row["messages"], 4)}
+            for row in rows
+        ]
+
+    async def report(self, since=None, until=None, bucket: str = "day") -> Dict[str, Any]:
+        intents, sources, sessions, errors = await asyncio.gather(
+            self.intent_distribution(since, until),
+            self.source_share(since, until),
+            self.messages_per_session(since, until),
+            self.error_rates(since, until, bucket)
+        )
+        return {
+            "since": since,
+            "until": until,
+            "intents": intents,
+            "sources": sources,
+            "sessions": sessions,
+            "error_rates": errors
+        }
+
+    # ---------- Export ----------
+
+    async def iter_messages(self, since=None, until=None, fields: List[str] = None) -> AsyncIterator[Dict[str, Any]]:
+        """Duyệt tin nhắn theo _id tăng dần, mỗi lần chỉ giữ một lô CHAT_EXPORT_BATCH_SIZE"""
+        projection = {field: 1 for field in (fields or EXPORT_FIELDS)}
+        cursor = (
+            self.message_collection.find(self.window(since, until), projection)
+            .sort("_id", 1)
+            .batch_size(settings.chat_export_batch_size)
+        )
+        async for doc in cursor:
+            doc["_id"] = str(doc["_id"])
+            yield doc
+
+    async def export_ndjson(self, since=None, until=None, fields: List[str] = None, compress: bool = True) -> AsyncIterator[bytes]:
+        """NDJSON (gzip nếu compress) theo từng khối, bộ nhớ không phụ thuộc kích thước collection"""
+        # wbits=31: định dạng gzip, nén tăng dần qua compressobj
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None
+        buffer = []
+        async for doc in self.iter_messages(since, until, fields):
+            buffer.append(dumps(doc))
+            if len(buffer) >= settings.chat_export_batch_size:
+                chunk = b"\n".join(buffer) + b"\n"
+                buffer = []
+                chunk = compressor.compress(chunk) if compressor else chunk
+                if chunk:
+                    yield chunk
+        tail = b"\n".join(buffer) + b"\n" if buffer else b""
+        if compressor:
+            tail = compressor.compress(tail) + compressor.flush()
+        if tail:
+            yield tail
+
+    async def export_to_file(self, path: str, since=None, until=None, fields: List[str] = None) -> int:
+        """Ghi export ra file (.gz -> nén); trả về số byte đã ghi"""
+        written = 0
+        with open(path, "wb") as f:
+            async for chunk in self.export_ndjson(since, until, fields, compress=path.endswith(".gz")):
+                f.write(chunk)
+                written += len(chunk)
+        return written
+
+
+# Singleton instance
+chat_analytics_service = ChatAnalyticsService()
+
+
+async def _main(args) -> int:
+    since, until = parse_time(args.since), parse_time(args.until)
+    if args.command == "export":
+        fields = [f.strip() for f in args.fields.split(",") if f.strip()] if args.fields else None
+        written = await chat_analytics_service.export_to_file(args.out, since, until, fields)
+        print(f"Wrote {written} bytes to {args.out}")
+    else:
+        report = await chat_analytics_service.report(since, until, args.bucket)
+        sys.stdout.buffer.write(dumps(report) + b"\n")
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Chat log export and analytics")
+    parser.add_argument("command", choices=["report", "export"])
+    parser.add_argument("--since", help="ISO date/datetime (UTC), inclusive")
+    parser.add_argument("--until", help="ISO date/datetime (UTC), exclusive")
+    parser.add_argument("--bucket", choices=list(BUCKET_FORMATS), default="day")
+    parser.add_argument("--out", default="chat_messages.ndjson.gz", help="export path (.gz -> gzip)")
+    parser.add_argument("--fields", help="comma-separated fields to export")
+    args = parser.parse_args()
+    sys.exit(asyncio.run(_main(args)))
@@ -0,0 +1,417 @@
+import asyncio
+import datetime
+import gzip
+import hashlib
+import logging
+import os
+import random
+import socket
+import threading
+import time
+import uuid
+from typing import Any, Dict, List, Optional, Tuple
+
+import orjson
+from bson import ObjectId
+
+from app.core.config import settings
+from app.core.mongo import LazyCollection
+from app.repositories.lease_repository import LeaseLostError, lease_repository
+from app.utils.cache import LRUCache
+from app.utils.response import dumps
+
+logger = logging.getLogger("chat_archive_service")
+
+LEASE_NAME = "chat_archive"
+# Watermark của bản cũ (trước khi lưu trong lease trên Mongo), chỉ còn được đọc để chuyển tiếp
+STATE_FILE = "_state.json"
+# Định danh của volume lưu trữ, đối chiếu với giá trị ghi trong lease
+VOLUME_FILE = "_volume"
+INDEX_DIR = "index"
+# Shard index theo 2 ký tự hex đầu của sha1(session_id): 256 shard
+INDEX_SHARD_CHARS = 2
+
+
+class ArchiveVolumeError(Exception):
+    """CHAT_ARCHIVE_DIR của worker này không phải volume lưu trữ mà cluster đang dùng"""
+
+
+def retention_seconds() -> int:
+    return max(settings.chat_retention_days, 0) * 86400
+
+
+def _created_at(doc: Dict[str, Any]) -> datetime.datetime:
+    created_at = doc.get("created_at")
+    if isinstance(created_at, datetime.datetime):
+        return created_at if created_at.tzinfo else created_at.replace(tzinfo=datetime.timezone.utc)
+    # Bản ghi cũ chưa có created_at: lấy thời điểm từ ObjectId
+    return doc["_id"].generation_time
+
+
+def _restore(doc: Dict[str, Any]) -> Dict[str, Any]:
+    """Dòng JSONL -> cùng dạng tin nhắn repository trả ra (_id str, created_at datetime)"""
+    created_at = doc.get("created_at")
+    if isinstance(created_at, str):
+        doc["created_at"] = datetime.datetime.fromisoformat(created_at.replace("Z", "+00:00"))
+    return doc
+
+
+class ChatArchive:
+    """
+    Kho lạnh trên đĩa cho một collection chat: file JSONL nén gzip, chia theo ngày
+    (`<dir>/<collection>/YYYY-MM-DD.jsonl.gz`).
+
+    Mỗi lượt ghi thêm một gzip member vào cuối file ngày (gzip cho phép nối member), và
+    ghi vị trí (offset, length) của member theo session_id vào index chia shard theo hash
+    của session_id (`index/<hh>.jsonl`, INDEX_SHARDS shard). Đọc lại một session chỉ mở
+    shard của nó và giải nén các member chứa session đó; member ghi dở (crash) không có
+    trong index nên bị bỏ qua. Mỗi process chỉ giữ tối đa CHAT_ARCHIVE_INDEX_CACHE shard
+    đã parse (LRU), nên bộ nhớ không tăng theo số session đã lưu trữ.
+    """
+
+    def __init__(self, root: str, collection: str):
+        self.directory = os.path.join(root, collection)
+        self._lock = threading.Lock()
+        # shard -> {"position": số byte đã đọc, "sessions": session_id -> [(file, offset, length)]}
+        self._shards = LRUCache(settings.chat_archive_index_cache)
+
+    @staticmethod
+    def shard(session_id: str) -> str:
+        return hashlib.sha1(str(session_id).encode("utf-8")).hexdigest()[:INDEX_SHARD_CHARS]
+
+    def shard_path(self, shard: str) -> str:
+        return os.path.join(self.directory, INDEX_DIR, f"{shard}.jsonl")
+
+    # ---------- Ghi ----------
+
+    def write(self, docs: List[Dict[str, Any]]) -> Dict[str, int]:
+        """Ghi một lô (đã sort theo _id) vào các file ngày; trả về số bản ghi theo ngày"""
+        partitions: Dict[str, Dict[str, List[Dict[str, Any]]]] = {}
+        for doc in docs:
+            day = _created_at(doc).strftime("%Y-%m-%d")
+            partitions.setdefault(day, {}).setdefault(doc.get("session_id"), []).append(doc)
+        os.makedirs(os.path.join(self.directory, INDEX_DIR), exist_ok=True)
+        index_lines: Dict[str, List[bytes]] = {}
+        written = {}
+        for day, sessions in sorted(partitions.items()):
+            lines = [dumps(doc) for session_docs in sessions.values() for doc in session_docs]
+            payload = gzip.compress(b"\n".join(lines) + b"\n")
+            filename = f"{day}.jsonl.gz"
+            with open(os.path.join(self.directory, filename), "ab") as f:
+                offset = f.tell()
+                f.write(payload)
+                f.flush()
+                os.fsync(f.fileno())
+            for session_id in sessions:
+                index_lines.setdefault(self.shard(session_id), []).append(
+                    dumps({"session_id": session_id, "file": filename, "offset": offset, "length": len(payload)})
+                )
+            written[day] = sum(len(session_docs) for session_docs in sessions.values())
+        # Index ghi sau dữ liệu: crash giữa chừng chỉ để lại member không ai trỏ tới
+        for shard, lines in index_lines.items():
+            with open(self.shard_path(shard), "ab") as f:
+                f.write(b"\n".join(lines) + b"\n")
+                f.flush()
+                os.fsync(f.fileno())
+        return written
+
+    # ---------- Đọc ----------
+
+    def _entries(self, session_id: str) -> List[Tuple[str, int, int]]:
+        """Vị trí các member chứa session, từ shard index (đọc tiếp phần leader mới ghi thêm)"""
+        shard = self.shard(session_id)
+        path = self.shard_path(shard)
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            return []
+        with self._lock:
+            cached = self._shards.get(shard)
+            if cached is None or cached["position"] > size:
+                cached = {"position": 0, "sessions": {}}
+            if cached["position"] < size:
+                with open(path, "rb") as f:
+                    f.seek(cached["position"])
+                    for line in f:
+                        if not line.endswith(b"\n"):
+                            break
+                        cached["position"] += len(line)
+                        entry = orjson.loads(line)
+                        cached["sessions"].setdefault(entry["session_id"], []).append(
+                            (entry["file"], entry["offset"], entry["length"])
+                        )
+            self._shards.set(shard, cached)
+            return list(cached["sessions"].get(session_id, []))
+
+    def has_session(self, session_id: str) -> bool:
+        return bool(self._entries(session_id))
+
+    def read_session(self, session_id: str) -> List[Dict[str, Any]]:
+        """
+        Mọi bản ghi đã lưu trữ của session, theo thứ tự ghi (cũ -> mới). Bản ghi bị lưu trữ
+        lại (crash trước khi watermark được lưu) chỉ được trả về một lần, theo _id.
+        """
+        result = []
+        seen = set()
+        for filename, offset, length in self._entries(session_id):
+            with open(os.path.join(self.directory, filename), "rb") as f:
+                f.seek(offset)
+                payload = gzip.decompress(f.read(length))
+            for line in payload.splitlines():
+                doc = orjson.loads(line)
+                if doc.get("session_id") != session_id or doc.get("_id") in seen:
+                    continue
+                seen.add(doc.get("_id"))
+                result.append(_restore(doc))
+        return result
+
+    def metrics(self) -> Dict[str, Any]:
+        return self._shards.metrics()
+
+
+class ChatArchiveService:
+    """
+    Retention lịch sử chat: TTL index (CHAT_RETENTION_DAYS) giữ chat_messages / chat_sessions
+    trong cửa sổ nóng; trước khi TTL xoá, job nền chuyển bản ghi sang kho lạnh (ChatArchive).
+    TTL index chỉ áp dụng cho bản ghi đã có `archived_at` (partial index), nên archiver chậm
+    hay dừng thì bản ghi ở lại Mongo lâu hơn chứ không bị xoá khi chưa lưu trữ.
+
+    Mỗi worker chạy một vòng lặp, chỉ worker giữ lease `chat_archive` mới lưu trữ; lease được
+    gia hạn trước mỗi lô và lượt lưu trữ dừng (LeaseLostError) nếu worker khác đã giành mất.
+    Bản ghi được quét theo _id tăng dần từ watermark (lưu trong lease trên Mongo, nên đi theo
+    leader) tới mốc now - (retention - CHAT_ARCHIVE_LEAD_HOURS), nên luôn đi trước TTL ít nhất
+    lead giờ.
+
+    Kho lạnh và index của nó nằm trên đĩa: với nhiều node, CHAT_ARCHIVE_DIR phải là volume dùng
+    chung để mọi node đọc được phần đã lưu trữ. Điều này được kiểm tra: lần lưu trữ đầu ghi
+    định danh volume (file `_volume`) vào lease; node nào có CHAT_ARCHIVE_DIR không chứa đúng
+    định danh đó thì không lưu trữ (ArchiveVolumeError) và báo lỗi trong status.
+    """
+
+    session_collection = LazyCollection("chat_sessions")
+    message_collection = LazyCollection("chat_messages")
+
+    def __init__(self):
+        self._set_owner()
+        self.is_leader = False
+        self.last_run_at: Optional[float] = None
+        self.last_result: Optional[Dict[str, Any]] = None
+        self.last_error: Optional[str] = None
+        self.volume_error: Optional[str] = None
+        self._task: Optional[asyncio.Task] = None
+        self._lock = asyncio.Lock()
+        self._archives: Dict[str, ChatArchive] = {}
+        self._stats = {"runs": 0, "failures": 0, "archived_messages": 0, "archived_sessions": 0, "archive_reads": 0}
+
+    def _set_owner(self):
+        self._owner_pid = os.getpid()
+        self.owner = f"{socket.gethostname()}:{self._owner_pid}:{uuid.uuid4().hex[:6]}"
+
+    @property
+    def enabled(self) -> bool:
+        return settings.chat_backend.lower() == "mongo" and retention_seconds() > 0 and bool(settings.chat_archive_dir)
+
+    def archive(self, collection: str) -> ChatArchive:
+        archive = self._archives.get(collection)
+        if archive is None:
+            archive = self._archives[collection] = ChatArchive(settings.chat_archive_dir, collection)
+        return archive
+
+    def cutoff(self, now: Optional[datetime.datetime] = None) -> datetime.datetime:
+        """Bản ghi tạo trước mốc này sẽ được lưu trữ (TTL xoá sau đó lead giờ)"""
+        now = now or datetime.datetime.now(datetime.timezone.utc)
+        hot_window = max(retention_seconds() - settings.chat_archive_lead_hours * 3600, 0)
+        return now - datetime.timedelta(seconds=hot_window)
+
+    # ---------- Lifecycle ----------
+
+    def start(self):
+        if not self.enabled or settings.chat_archive_interval <= 0 or self._task is not None:
+            return
+        if self._owner_pid != os.getpid():
+            self._set_owner()
+        self._task = asyncio.create_task(self._loop())
+        logger.info(f"Chat archiver started ({self.owner})")
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        if self.is_leader:
+            try:
+                await lease_repository.release(LEASE_NAME, self.owner)
+            except Exception as e:
+                logger.warning(f"Releasing archive lease failed: {e}")
+            self.is_leader = False
+
+    async def _loop(self):
+        # Node không thấy volume lưu trữ chung thì đọc lịch sử cũ không đầy đủ: báo sớm
+        try:
+            self._check_volume(await lease_repository.get(LEASE_NAME))
+        except ArchiveVolumeError:
+            pass
+        except Exception as e:
+            logger.warning(f"Checking archive volume failed: {e}")
+        while True:
+            await asyncio.sleep(settings.chat_archive_interval * (1 + random.uniform(-0.1, 0.1)))
+            try:
+                await self.run_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Chat archive tick failed: {e}")
+
+    # ---------- Lease, watermark, volume ----------
+
+    async def _acquire_lease(self) -> Optional[Dict[str, Any]]:
+        lease = await lease_repository.acquire(LEASE_NAME, self.owner, settings.chat_archive_interval * 3)
+        self.is_leader = lease is not None
+        return lease
+
+    async def _renew_lease(self):
+        """Gia hạn lease trước mỗi lô để lượt lưu trữ dài không để lease hết hạn giữa chừng"""
+        if await self._acquire_lease() is None:
+            raise LeaseLostError(f"Lease {LEASE_NAME} was taken over during archiving")
+
+    def _volume_id(self, create: bool = False) -> Optional[str]:
+        path = os.path.join(settings.chat_archive_dir, VOLUME_FILE)
+        try:
+            with open(path, "r") as f:
+                return f.read().strip() or None
+        except OSError:
+            if not create:
+                return None
+        os.makedirs(settings.chat_archive_dir, exist_ok=True)
+        volume = uuid.uuid4().hex
+        with open(path, "w") as f:
+            f.write(volume)
+            f.flush()
+            os.fsync(f.fileno())
+        return volume
+
+    def _check_volume(self, lease: Optional[Dict[str, Any]]):
+        """Đối chiếu định danh volume trong CHAT_ARCHIVE_DIR với giá trị ghi trong lease"""
+        expected = (lease or {}).get("volume")
+        local = self._volume_id()
+        if expected is not None and local != expected:
+            self.volume_error = (
+                f"CHAT_ARCHIVE_DIR {settings.chat_archive_dir} is not the shared archive volume "
+                f"(expected {expected}, found {local or 'none'})"
+            )
+            logger.error(self.volume_error)
+            raise ArchiveVolumeError(self.volume_error)
+        self.volume_error = None
+
+    async def _load_state(self, lease: Dict[str, Any]) -> Dict[str, str]:
+        """Watermark trong lease; lần đầu ghi định danh volume (và chuyển watermark từ file cũ nếu có)"""
+        await asyncio.to_thread(self._check_volume, lease)
+        if lease.get("volume") is None:
+            volume = await asyncio.to_thread(self._volume_id, True)
+            await lease_repository.update(LEASE_NAME, self.owner, {"volume": volume})
+        if lease.get("watermark") is not None:
+            return dict(lease["watermark"])
+        try:
+            with open(os.path.join(settings.chat_archive_dir, STATE_FILE), "rb") as f:
+                return orjson.loads(f.read())
+        except (OSError, ValueError):
+            return {}
+
+    async def _save_state(self, state: Dict[str, str]):
+        # Chỉ ghi khi còn là chủ lease (filter theo owner)
+        await lease_repository.update(LEASE_NAME, self.owner, {"watermark": dict(state)})
+
+    # ---------- Lưu trữ ----------
+
+    async def _archive_collection(self, name: str, collection, state: Dict[str, str], upper: ObjectId) -> int:
+        """Chuyển bản ghi có watermark < _id < upper sang kho lạnh theo lô CHAT_ARCHIVE_BATCH_SIZE"""
+        archive = self.archive(name)
+        total = 0
+        while True:
+            await self._renew_lease()
+            query: Dict[str, Any] = {"_id": {"$lt": upper}}
+            if state.get(name):
+                query["_id"]["$gt"] = ObjectId(state[name])
+            docs = await collection.find(query).sort("_id", 1).limit(settings.chat_archive_batch_size).to_list(None)
+            if not docs:
+                return total
+            await asyncio.to_thread(archive.write, docs)
+            # Đánh dấu đã lưu trữ -> TTL index được phép xoá; bản ghi cũ thiếu created_at
+            # (TTL không bao giờ xoá) thì xoá luôn
+            archived = [doc["_id"] for doc in docs if isinstance(doc.get("created_at"), datetime.datetime)]
+            legacy = [doc["_id"] for doc in docs if not isinstance(doc.get("created_at"), datetime.datetime)]
+            if archived:
+                await collection.update_many(
+                    {"_id": {"$in": archived}},
+                    {"$set": {"archived_at": datetime.datetime.now(datetime.timezone.utc)}}
+                )
+            if legacy:
+                await collection.delete_many({"_id": {"$in": legacy}})
+            state[name] = str(docs[-1]["_id"])
+            await self._save_state(state)
+            total += len(docs)
+
+    async def run_once(self, now: Optional[datetime.datetime] = None) -> Optional[Dict[str, Any]]:
+        """Một lượt lưu trữ mọi bản ghi cũ hơn cutoff(); None nếu worker khác đang giữ lease"""
+        async with self._lock:
+            lease = await self._acquire_lease()
+            if lease is None:
+                return None
+            self.last_run_at = time.time()
+            self._stats["runs"] += 1
+            try:
+                upper = ObjectId.from_datetime(self.cutoff(now))
+                state = await self._load_state(lease)
+                messages = await self._archive_collection("chat_messages", self.message_collection, state, upper)
+                sessions = await self._archive_collection("chat_sessions", self.session_collection, state, upper)
+                self._stats["archived_messages"] += messages
+                self._stats["archived_sessions"] += sessions
+                self.last_result = {"messages": messages, "sessions": sessions, "watermark": state}
+                self.last_error = None
+                if messages or sessions:
+                    logger.info(f"Archived {messages} messages, {sessions} sessions")
+                return self.last_result
+            except Exception as e:
+                self._stats["failures"] += 1
+                self.last_error = str(e)
+                raise
+
+    # ---------- Đọc ----------
+
+    async def get_archived_history(self, session_id: str, limit: int = None) -> List[Dict[str, Any]]:
+        """Tin nhắn đã lưu trữ của session, mới nhất trước (rỗng nếu session chưa từng lưu trữ; limit None = tất cả)"""
+        if not self.enabled or (limit is not None and limit <= 0):
+            return []
+        archive = self.archive("chat_messages")
+        if not await asyncio.to_thread(archive.has_session, session_id):
+            return []
+        self._stats["archive_reads"] += 1
+        docs = await asyncio.to_thread(archive.read_session, session_id)
+        # _id là ObjectId dạng hex (cùng độ dài) nên so sánh chuỗi đúng thứ tự thời gian
+        docs.sort(key=lambda doc: doc["_id"], reverse=True)
+        return docs if limit is None else docs[:limit]
+
+    # ---------- Observability ----------
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "retention_days": settings.chat_retention_days,
+            "archive_dir": settings.chat_archive_dir,
+            "owner": self.owner,
+            "is_leader": self.is_leader,
+            "last_run_at": self.last_run_at,
+            "last_result": self.last_result,
+            "last_error": self.last_error,
+            "volume_error": self.volume_error,
+            "metrics": dict(self._stats),
+            "index_cache": self.archive("chat_messages").metrics() if self.enabled else None
+        }
+
+
+# Singleton instance
+chat_archive_service = ChatArchiveService()
@@ -2,15 +2,18 @@ from typing import Dict, Any, List
 import uuid
 import re
 import logging
-import json
-from pathlib import Path
 from rapidfuzz import fuzz
 from app.repositories.chat_repository import chat_repository
 from app.repositories.ranking_repository import ranking_repository
 from app.services.openai_service import openai_service
 from app.services.knowledge_service import knowledge_service
+from app.services.kb_snapshot import knowledge_base_snapshot
+from app.services.gazetteer_service import gazetteer_service
+from app.services.fuzzy_match_service import fuzzy_match_service
 from app.core.config import settings
+from app.utils.lazy import LazyProxy
 from app.services.ranking_service import ranking_service
+from app.services.session_memory_service import session_memory_service
 from app.schemas.ranking import RankingSearchRequest
 import datetime
 from app.services.university_service import university_service
@@ -18,17 +21,21 @@ import unicodedata
 
 logger = logging.getLogger("chat_service")
 
+# Mã khối thi trong câu hỏi (A00, D01, ...)
+BLOCK_CODE_PATTERN = r"\b([A-Da-dXx]\d{2})\b"
+# Intent rõ ràng, không bị đổi bởi bộ nhớ session
+EXPLICIT_INTENTS = ("score_lookup", "greeting")
+SCHOOL_INTENTS = ("school_recommendation", "admission_score", "major_advice")
+
 class ChatService:
     def __init__(self):
-        # Load knowledge_base keywords (greeting, school, major, ...)
-        kb_path = Path(__file__).parent.parent / "data" / "knowledge_base.json"
-        with open(kb_path, "r", encoding="utf-8") as f:
-            self.knowledge_base = json.load(f)
-        self.greeting_keywords = self.knowledge_base.get("greeting", {}).get("keywords", [])
-        self.school_keywords = self.knowledge_base.get("school_recommendation", {}).get("keywords", [])
-        self.major_keywords = self.knowledge_base.get("major_advice", {}).get("keywords", [])
-        # Build intent_keywords mapping from all keys in knowledge_base.json that có 'keywords'
-        self.intent_keywords = {k: v["keywords"] for k, v in self.knowledge_base.items() if isinstance(v, dict) and "keywords" in v}
+        # Keywords của knowledge base (greeting, school, major, ...) lấy từ KB snapshot dùng chung
+        snapshot = knowledge_base_snapshot()
+        self.knowledge_base = snapshot.data
+        self.greeting_keywords = snapshot.greeting_keywords
+        self.school_keywords = snapshot.school_keywords
+        self.major_keywords = snapshot.major_keywords
+        self.intent_keywords = snapshot.intent_keywords
 
     async def create_session(self) -> str:
         # Nếu cần user_id, có thể sinh ngẫu nhiên hoặc bỏ qua
@@ -64,6 +71,38 @@ class ChatService:
             return sorted_intents[0][0]
         return "general"
     
+    def requested_subjects(self, message: str, ranking: Dict[str, Any]) -> List[str]:
+        """Tên các môn (theo mark_info của ranking đã tra) được nhắc trong câu hỏi"""
+        message_norm = self.normalize_text(message)
+        return [
+            mark["name"] for mark in (ranking or {}).get("mark_info", [])
+            if mark.get("name") and re.search(rf"\b{re.escape(self.normalize_text(mark['name']))}\b", message_norm)
+        ]
+
+    def route_with_memory(self, intent: str, message: str, memory: Dict[str, Any], entities: Dict[str, Any]) -> str:
+        """
+        Câu nối tiếp thường không đủ từ khóa để nhận intent ("khối D01 thì sao?"). Khi session
+        đã có ranking và câu nhắc tới khối / môn thi -> score_lookup; khi session đã có ranking
+        hoặc trường và câu nêu tên trường, hoặc đã có trường và câu hỏi một thông tin của trường
+        -> nhánh trả lời theo trường. Cả hai nhánh trả lời từ dữ liệu, không gọi LLM.
+        """
+        if intent in EXPLICIT_INTENTS:
+            return intent
+        ranking = (memory.get("ranking") or {}).get("data")
+        names_school = bool(entities.get("school_name"))
+        asks_admission_score = "diem chuan" in self.normalize_text(message)
+        if ranking and intent != "major_advice" and not names_school and not asks_admission_score and (
+            re.search(BLOCK_CODE_PATTERN, message) or self.requested_subjects(message, ranking)
+        ):
+            return "score_lookup"
+        if intent in SCHOOL_INTENTS:
+            return intent
+        if (ranking or memory.get("schools")) and names_school:
+            return "school_recommendation"
+        if memory.get("schools") and self.extract_university_info_from_question(message):
+            return "admission_score" if asks_admission_score else "school_recommendation"
+        return intent
+
     def extract_candidate_number(self, message: str) -> str:
         """Trích xuất số báo danh từ tin nhắn"""
         sbd_pattern = r'\b(\d{8})\b'
@@ -82,15 +121,7 @@ class ChatService:
 
     def _extract_location(self, message: str) -> str:
         """Trích xuất tên địa điểm"""
-        locations = [
-            "hà nội", "tp.hcm", "sài gòn", "đà nẵng", "cần thơ",
-            "hải phòng", "huế", "nha trang", "miền bắc", "miền nam", "miền trung"
-        ]
-        message_lower = message.lower()
-        for location in locations:
-            if location in message_lower:
-                return location
-        return None
+        return gazetteer_service.first(message, "location")
 
     async def get_student_data_if_available(self, message: str) -> Dict[str, Any]:
         """Lấy thông tin điểm thi nếu có SBD trong tin nhắn"""
@@ -213,6 +244,13 @@ class ChatService:
             # 1. Phát hiện ý định và entities
             intent = self.detect_intent(user_message)
             entities = self.extract_entities(user_message)
+            # Entity đã giải quyết ở các tin trước (SBD + ranking, khu vực, trường, tên)
+            memory = await session_memory_service.get(session_id)
+            # Câu nối tiếp về khối / môn / trường đã biết -> nhánh trả lời theo dữ liệu
+            routed = self.route_with_memory(intent, user_message, memory, entities)
+            if routed != intent:
+                logger.info(f"Routed follow-up from {intent} to {routed} using session memory")
+                intent = routed
             
             # 2. Lấy lịch sử chat
             chat_history = await chat_repository.get_chat_history(session_id, limit=settings.chat_history_limit)
@@ -248,10 +286,13 @@ class ChatService:
                     if cleaned_name.split()[0].lower() not in blacklist:
                         name = cleaned_name
                     break
+            if name and name != memory.get("name"):
+                memory = await session_memory_service.update(session_id, name=name)
 
             # 4. Xử lý đặc biệt cho score_lookup
             if intent == "score_lookup":
-                candidate_number = entities.get('candidate_number')
+                # Câu hỏi nối tiếp ("thế còn khối D01?") dùng lại SBD đã cung cấp
+                candidate_number = entities.get('candidate_number') or memory.get("candidate_number")
                 # Parse year từ message, mặc định 2025
                 year = 2025
                 year_match = re.search(r"\b(20\d{2})\b", user_message)
@@ -302,15 +343,20 @@ class ChatService:
                             "Ví dụ: 'SBD: 12345678, Khu vực: MB'"
                         )
                     else:
-                        # Parse region từ message, mặc định CN
-                        region = "CN"
+                        # Parse region từ message, mặc định khu vực đã dùng trong session hoặc CN
+                        region = memory.get("region") or "CN"
                         for reg in ["CN", "MB", "MT", "MN"]:
                             if reg.lower() in user_message.lower():
                                 region = reg
                                 break
                         
-                        req = RankingSearchRequest(candidate_number=candidate_number, region=region)
-                        student_obj = await ranking_service.get_student_ranking(req, save_to_db=True)
+                        # Snapshot ranking đã tra trong session -> không gọi lại ranking service
+                        student_obj = session_memory_service.cached_ranking(memory, candidate_number, region)
+                        if student_obj is None:
+                            req = RankingSearchRequest(candidate_number=candidate_number, region=region)
+                            student_obj = await ranking_service.get_student_ranking(req, save_to_db=True)
+                            if student_obj:
+                                memory = await session_memory_service.remember_ranking(session_id, student_obj, region)
                         
                         if not student_obj:
                             bot_response = f"Không tìm thấy thông tin cho SBD {candidate_number} hoặc số báo danh không tồn tại."
@@ -322,6 +368,10 @@ class ChatService:
                             msg_parts = []
                             if ask_score or not (ask_score or ask_rank):
                                 mark_info = getattr(student_obj, "mark_info", [])
+                                # Chỉ các môn được hỏi (vd. "điểm Toán"), nếu có
+                                requested = set(self.requested_subjects(user_message, student_obj.model_dump()))
+                                if requested:
+                                    mark_info = [m for m in mark_info if m.name in requested]
                                 if mark_info:
                                     msg_parts.append("**Kết quả điểm các môn:**")
                                     for m in mark_info:
@@ -329,6 +379,10 @@ class ChatService:
                             
                             if ask_rank or not (ask_score or ask_rank):
                                 blocks = getattr(student_obj, "blocks", [])
+                                # Chỉ các khối được hỏi (vd. "khối D01"), nếu có
+                                requested_blocks = {code.upper() for code in re.findall(BLOCK_CODE_PATTERN, user_message)}
+                                if requested_blocks:
+                                    blocks = [b for b in blocks if getattr(b, "label", "").upper() in requested_blocks] or blocks
                                 if blocks:
                                     msg_parts.append("\n**Xếp hạng theo khối và khu vực:**")
                                     for block in blocks:
@@ -348,7 +402,7 @@ class ChatService:
                 
                 # Lưu vào history và chunk từng phần
                 chat_message = await chat_repository.create_message(
-                    session_id, user_message, bot_response, intent
+                    session_id, user_message, bot_response, intent, source="template"
                 )
                 
                 import asyncio
@@ -364,20 +418,29 @@ class ChatService:
                 # Kiểm tra nếu là câu hỏi về trường cụ thể
                 if intent in ["school_recommendation", "admission_score", "major_advice"]:
                     # Chuẩn hóa tên trường từ user_message
+                    # Tìm trường trong câu hỏi bằng các index in-memory (gazetteer theo tên,
+                    # alias, code; trigram cho lỗi chính tả) rồi chỉ đọc đúng doc đó theo id
                     school_name = None
-                    universities = await university_service.get_all_universities_from_db()
-                    user_text_norm = self.normalize_text(user_message)
                     school_doc = None
-                    for uni in universities:
-                        # So sánh code, alias, name, không dấu
-                        if (
-                            ("code" in uni and uni["code"].lower() in user_text_norm) or
-                            ("alias" in uni and self.normalize_text(uni["alias"]) in user_text_norm) or
-                            ("name" in uni and self.normalize_text(uni["name"]) in user_text_norm)
-                        ):
-                            school_name = uni["name"]
-                            school_doc = uni
-                            break
+                    school_id = gazetteer_service.university_id(user_message)
+                    # Không khớp chính xác: thử khớp gần đúng (sai chính tả) qua trigram index.
+                    # Bỏ qua với câu hỏi ngành học để tên ngành không bị nhận nhầm thành tên trường.
+                    if school_id is None and intent != "major_advice":
+                        match = fuzzy_match_service.match(user_message)
+                        if match:
+                            school_id = match["id"]
+                            logger.info(f"Fuzzy matched school '{match['key']}' (score={match['score']:.0f})")
+                    if school_id is not None:
+                        school_doc = await university_service.get_university_by_id(school_id)
+                    if school_doc:
+                        memory = await session_memory_service.remember_school(session_id, school_doc)
+                    elif intent != "major_advice":
+                        # Câu hỏi nối tiếp không nêu tên trường: dùng trường vừa nhắc trong session
+                        remembered = session_memory_service.last_school(memory)
+                        if remembered:
+                            school_doc = await university_service.get_university_by_id(remembered["id"])
+                    if school_doc:
+                        school_name = school_doc["name"]
                     # Nếu tìm được trường trong DB
                     if school_name and school_doc:
                         # Ưu tiên extract field cụ thể từ câu hỏi
@@ -417,7 +480,7 @@ class ChatService:
                             else:
                                 response = f"**{school_name}**\n- **{field_labels.get(field_key, field_key)}:** {value}"
                             chat_message = await chat_repository.create_message(
-                                session_id, user_message, response, intent
+                                session_id, user_message, response, intent, source="template"
                             )
                             import asyncio
                             await asyncio.sleep(3)
@@ -433,7 +496,7 @@ class ChatService:
                         if focused_response and question_analysis["type"] != "general":
                             # Có focused response (và user hỏi cụ thể)
                             chat_message = await chat_repository.create_message(
-                                session_id, user_message, focused_response, intent
+                                session_id, user_message, focused_response, intent, source="template"
                             )
                             import asyncio
                             await asyncio.sleep(3)
@@ -444,7 +507,7 @@ class ChatService:
                             # Trả về markdown chuẩn, chỉ field hợp lý
                             markdown_summary = self.format_university_markdown(school_doc)
                             chat_message = await chat_repository.create_message(
-                                session_id, user_message, markdown_summary, intent
+                                session_id, user_message, markdown_summary, intent, source="template"
                             )
                             import asyncio
                             await asyncio.sleep(3)
@@ -465,7 +528,7 @@ class ChatService:
                 full_response = ""
                 # Lưu bản ghi tạm vào DB trước khi stream
                 chat_message = await chat_repository.create_message(
-                    session_id, user_message, "", intent
+                    session_id, user_message, "", intent, source="llm"
                 )
                 message_id = chat_message["_id"]
                 
@@ -477,7 +540,8 @@ class ChatService:
                         user_message=user_message,
                         intent=intent,
                         context=context,
-                        student_data=student_data
+                        student_data=student_data,
+                        session_facts=session_memory_service.facts(memory)
                     ):
                         full_response += chunk
                         yield chunk
@@ -491,7 +555,7 @@ class ChatService:
                     logger.error(f"Error in OpenAI stream: {e}")
                     fallback_response = self._get_enhanced_fallback("error", user_message)
                     await chat_repository.update_message_bot_response(
-                        message_id, fallback_response
+                        message_id, fallback_response, source="fallback"
                     )
                     
                     # ✅ FIX: Chunk fallback response properly
@@ -505,7 +569,7 @@ class ChatService:
             
             # Lưu fallback vào history
             chat_message = await chat_repository.create_message(
-                session_id, user_message, fallback_response, "error"
+                session_id, user_message, fallback_response, "error", source="error"
             )
             
             import asyncio
@@ -607,6 +671,13 @@ class ChatService:
             limit = settings.chat_history_limit
         return await chat_repository.get_chat_history(session_id, limit=limit)
 
+    def iter_chat_history(self, session_id: str, limit: int, before: str = None, after: str = None, fields: List[str] = None):
+        """Một trang lịch sử (keyset theo _id), stream từng tin nhắn; cursor sai -> ValueError ngay khi gọi"""
+        for cursor in (before, after):
+            if cursor:
+                chat_repository.parse_cursor(cursor)
+        return chat_repository.iter_history(session_id, limit, before=before, after=after, fields=fields)
+
     async def get_session_context(self, session_id: str) -> Dict[str, Any]:
         """Lấy context chi tiết của session"""
         history = await chat_repository.get_chat_history(session_id, limit=settings.chat_history_limit)
@@ -712,4 +783,4 @@ class ChatService:
                 lines.append(f"- {ds}")
         return "\n".join(lines)
 
-chat_service = ChatService()
\ No newline at end of file
+chat_service = LazyProxy("chat_service", ChatService)
@@ -0,0 +1,181 @@
+import logging
+import threading
+from collections import Counter
+from itertools import chain
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+from rapidfuzz import fuzz
+
+from app.core.config import settings
+from app.services.gazetteer_service import LOCATIONS, SCHOOL_NAME_PREFIXES
+from app.services.university_service import search_tokens, university_service
+
+logger = logging.getLogger("fuzzy_match_service")
+
+# Khóa quá ngắn (vd. "y") khớp nhầm quá nhiều, đã có so khớp chính xác theo code/alias lo
+MIN_KEY_LENGTH = 4
+# Số khóa ứng viên (theo trigram) được chấm lại bằng rapidfuzz
+MAX_CANDIDATES = 10
+# Trigram xuất hiện trong hơn tỷ lệ này số khóa ("dai", "hoc", ...) bị bỏ qua khi lọc ứng viên
+STOP_GRAM_DF = 0.5
+
+_LOCATION_TERMS = sorted(
+    {" ".join(search_tokens(term)) for canonical, aliases in LOCATIONS.items() for term in [canonical, *aliases]},
+    key=len,
+    reverse=True
+)
+
+
+def trigrams(text: str) -> Set[str]:
+    """Trigram ký tự theo từ, đệm 2 khoảng trắng đầu và 1 khoảng trắng cuối (kiểu pg_trgm)"""
+    result = set()
+    for word in text.split():
+        padded = f"  {word} "
+        result.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return result
+
+
+class FuzzyMatchService:
+    """
+    Tìm trường trong câu hỏi có lỗi chính tả ("bach khao", "ngoai thuog").
+
+    Mỗi trường sinh vài khóa không dấu (tên, alias, tên bỏ tiền tố "Đại học"...,
+    tên bỏ địa danh ở cuối). Inverted index trigram -> khóa cho ra các ứng viên có tỷ
+    lệ trigram của khóa xuất hiện trong câu hỏi đủ cao (bỏ qua trigram quá phổ biến);
+    chỉ vài khóa đầu mới được chấm bằng rapidfuzz trên các cửa sổ từ của câu hỏi.
+    """
+
+    def __init__(self):
+        # key index -> (university id, khóa, tập trigram); None = đã xóa
+        self._keys: List[Optional[tuple]] = []
+        self._by_university: Dict[Any, List[int]] = {}
+        self._postings: Dict[str, Set[int]] = {}
+        self._lock = threading.Lock()
+        # Trigram quá phổ biến và số trigram còn lại của từng khóa, tính lại (lazy) sau mỗi lần cập nhật
+        self._stop_grams: Set[str] = set()
+        self._key_sizes: List[int] = []
+        self._dirty = False
+
+    def __len__(self) -> int:
+        return len(self._by_university)
+
+    def update_universities(self, universities: Iterable[Dict[str, Any]]):
+        """Sync listener: thay các khóa của những trường vừa thay đổi"""
+        with self._lock:
+            for uni in universities:
+                uni_id = uni.get("id")
+                if uni_id is None or not uni.get("name"):
+                    continue
+                self._remove(uni_id)
+                indices = []
+                for key in self._university_keys(uni):
+                    grams = trigrams(key)
+                    index = len(self._keys)
+                    self._keys.append((uni_id, key, grams))
+                    for gram in grams:
+                        self._postings.setdefault(gram, set()).add(index)
+                    indices.append(index)
+                self._by_university[uni_id] = indices
+                self._dirty = True
+
+    def _remove(self, uni_id):
+        for index in self._by_university.pop(uni_id, []):
+            _, _, grams = self._keys[index]
+            for gram in grams:
+                postings = self._postings.get(gram)
+                if postings is not None:
+                    postings.discard(index)
+            self._keys[index] = None
+
+    def _university_keys(self, uni: Dict[str, Any]) -> Set[str]:
+        name = " ".join(search_tokens(uni["name"].split(" - ")[0]))
+        keys = {" ".join(search_tokens(uni["name"])), name}
+        if uni.get("alias"):
+            keys.add(" ".join(search_tokens(uni["alias"])))
+        short = name
+        stripped = True
+        while stripped:
+            stripped = False
+            for prefix in SCHOOL_NAME_PREFIXES:
+                if short.startswith(prefix + " "):
+                    short = short[len(prefix) + 1:]
+                    stripped = True
+        keys.add(short)
+        for location in _LOCATION_TERMS:
+            if short.endswith(" " + location):
+                keys.add(short[:-len(location) - 1])
+                break
+        return {key for key in keys if len(key) >= MIN_KEY_LENGTH}
+
+    def _compile(self):
+        with self._lock:
+            if not self._dirty:
+                return
+            live = sum(1 for entry in self._keys if entry is not None)
+            self._stop_grams = {
+                gram for gram, postings in self._postings.items() if len(postings) > STOP_GRAM_DF * live
+            }
+            self._key_sizes = [
+                len(entry[2] - self._stop_grams) if entry is not None else 0
+                for entry in self._keys
+            ]
+            self._dirty = False
+
+    def warm_up(self):
+        """Tính stop-gram ngay (lúc khởi động) thay vì ở truy vấn đầu tiên"""
+        if self._dirty:
+            self._compile()
+
+    def candidates(self, text: str, limit: int = MAX_CANDIDATES) -> List[Dict[str, Any]]:
+        """
+        Khóa có tỷ lệ trigram (không tính trigram phổ biến) xuất hiện trong `text`
+        >= fuzzy_candidate_threshold, khóa chứa trọn hơn và dài hơn đứng trước.
+        """
+        if self._dirty:
+            self._compile()
+        grams = trigrams(text) - self._stop_grams
+        counts = Counter(chain.from_iterable(self._postings.get(gram, ()) for gram in grams))
+        threshold = settings.fuzzy_candidate_threshold
+        result = []
+        for index, shared in counts.items():
+            size = self._key_sizes[index]
+            if shared < threshold * size:
+                continue
+            uni_id, key, _ = self._keys[index]
+            result.append({"id": uni_id, "key": key, "containment": shared / size, "size": size})
+        result.sort(key=lambda c: (-c["containment"], -c["size"]))
+        return result[:limit]
+
+    def match(self, message: str) -> Optional[Dict[str, Any]]:
+        """
+        Trường khớp tốt nhất trong câu hỏi, hoặc None nếu dưới fuzzy_match_threshold.
+        Trong các khóa đạt ngưỡng, xếp theo độ dài khóa x (điểm/100)^4: khóa dài hơn (cụ thể
+        hơn, "kinh te quoc dan" so với "kinh te") thắng trừ khi khớp kém rõ rệt.
+        """
+        words = search_tokens(message)
+        if not words:
+            return None
+        text = " ".join(words)
+        best, best_rank = None, None
+        for candidate in self.candidates(text):
+            score = self._window_score(words, candidate["key"])
+            if score < settings.fuzzy_match_threshold:
+                continue
+            rank = len(candidate["key"]) * (score / 100) ** 4
+            if best_rank is None or rank > best_rank:
+                best, best_rank = {**candidate, "score": score}, rank
+        return best
+
+    def _window_score(self, words: List[str], key: str) -> float:
+        """So khóa với các cụm từ liên tiếp của câu hỏi có số từ xấp xỉ khóa"""
+        size = len(key.split())
+        best = 0.0
+        for width in {max(size - 1, 1), size, size + 1}:
+            for start in range(0, max(len(words) - width, 0) + 1):
+                best = max(best, fuzz.ratio(" ".join(words[start:start + width]), key))
+        return best
+
+
+# Singleton instance
+fuzzy_match_service = FuzzyMatchService()
+university_service.add_sync_listener(fuzzy_match_service.update_universities)
@@ -0,0 +1,265 @@
+import logging
+import re
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from app.services.university_service import university_service
+from app.utils.text import remove_accents
+
+logger = logging.getLogger("gazetteer_service")
+
+# Tỉnh/thành và alias hay gặp. Giá trị canonical giữ dạng lowercase có dấu như trước đây.
+LOCATIONS = {
+    "hà nội": ["hn", "ha noi"],
+    "tp.hcm": ["tp hcm", "tphcm", "hcm", "hồ chí minh", "tp. hồ chí minh", "sài gòn", "saigon"],
+    "đà nẵng": [], "cần thơ": [], "hải phòng": [], "huế": ["thừa thiên huế"],
+    "nha trang": [], "đà lạt": [], "vũng tàu": [], "quy nhơn": [], "vinh": ["tp vinh"],
+    "an giang": [], "bà rịa - vũng tàu": [], "bắc giang": [], "bắc kạn": [], "bạc liêu": [],
+    "bắc ninh": [], "bến tre": [], "bình định": [], "bình dương": [], "bình phước": [],
+    "bình thuận": [], "cà mau": [], "cao bằng": [], "đắk lắk": ["đắc lắc"], "đắk nông": [],
+    "điện biên": [], "đồng nai": [], "đồng tháp": [], "gia lai": [], "hà giang": [], "hà nam": [],
+    "hà tĩnh": [], "hải dương": [], "hậu giang": [], "hòa bình": [], "hưng yên": [],
+    "khánh hòa": [], "kiên giang": [], "kon tum": [], "lai châu": [], "lâm đồng": [],
+    "lạng sơn": [], "lào cai": [], "long an": [], "nam định": [], "nghệ an": [], "ninh bình": [],
+    "ninh thuận": [], "phú thọ": [], "phú yên": [], "quảng bình": [], "quảng nam": [],
+    "quảng ngãi": [], "quảng ninh": [], "quảng trị": [], "sóc trăng": [], "sơn la": [],
+    "tây ninh": [], "thái bình": [], "thái nguyên": [], "thanh hóa": [], "tiền giang": [],
+    "trà vinh": [], "tuyên quang": [], "vĩnh long": [], "vĩnh phúc": [], "yên bái": [],
+    "miền bắc": ["north"], "miền trung": ["central"], "miền nam": ["south"],
+}
+
+# Các trường/ngành phổ biến trước đây được hardcode trong knowledge_service
+SEED_SCHOOLS = {
+    "bách khoa": ["bách khoa hà nội", "bách khoa hn", "bách khoa hcm", "bách khoa tp.hcm"],
+    "đại học y": ["đại học y hà nội", "đại học y hn", "đại học y hcm"],
+    "kinh tế quốc dân": ["neu"],
+    "ngoại thương": [],
+    "fpt university": ["đại học fpt"],
+    "sư phạm": ["sư phạm hà nội", "sư phạm hn", "sư phạm hcm"],
+}
+SEED_MAJORS = {
+    "công nghệ thông tin": ["cntt", "it"],
+    "y khoa": ["medicine"],
+    "kinh tế": ["economics"],
+    "cơ khí": ["mechanical"],
+    "điện tử": ["electronics"],
+    "luật": ["law"],
+    "sư phạm": ["education"],
+}
+
+# Tiền tố bỏ đi khi sinh alias ngắn cho tên trường ("Đại học Ngoại thương" -> "ngoai thuong")
+SCHOOL_NAME_PREFIXES = ("truong", "dai hoc", "hoc vien", "cao dang")
+
+# Độ ưu tiên của nguồn dữ liệu khi cùng một cụm từ trỏ tới nhiều giá trị (nhỏ hơn = ưu tiên hơn)
+SOURCE_PRIORITY = {"universities": 0, "kb": 1, "seed": 2}
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def _fold_char(c: str) -> str:
+    folded = remove_accents(c).lower()
+    return folded[:1] if folded else " "
+
+
+def _tokenize(text: str) -> List[Tuple[str, int, int]]:
+    """Tách token đã bỏ dấu, kèm offset (start, end) trên chuỗi gốc"""
+    folded = "".join(_fold_char(c) for c in text)
+    return [(m.group(0), m.start(), m.end()) for m in _TOKEN_RE.finditer(folded)]
+
+
+class _TrieNode:
+    __slots__ = ("children", "entries")
+
+    def __init__(self):
+        self.children: Dict[str, "_TrieNode"] = {}
+        # entity type -> (priority, value, source)
+        self.entries: Dict[str, Tuple[int, str, str]] = {}
+
+
+class GazetteerService:
+    """
+    Trích xuất thực thể (trường, ngành, địa điểm) bằng một gazetteer biên dịch từ
+    collection universities, knowledge base và danh sách tỉnh thành.
+
+    Mọi cụm từ được nạp vào một token trie duy nhất nên chi phí trích xuất chỉ phụ
+    thuộc độ dài tin nhắn (và độ sâu trie), không phụ thuộc số lượng pattern.
+    Trie được biên dịch lại (lazy) khi dữ liệu nguồn thay đổi.
+    """
+
+    def __init__(self):
+        self._kb_terms: List[Tuple[str, str, str, str]] = []
+        self._university_terms: Dict[Any, List[Tuple[str, str, str, str]]] = {}
+        # Tên trường (giá trị của entity school) -> id, để tra doc theo index thay vì đọc cả danh mục
+        self._university_ids: Dict[str, Any] = {}
+        self._root = _TrieNode()
+        self._dirty = True
+        self._lock = threading.Lock()
+        self.version = 0
+
+    # ---------- Nguồn dữ liệu ----------
+
+    def _static_terms(self) -> Iterable[Tuple[str, str, str, str]]:
+        for canonical, aliases in LOCATIONS.items():
+            for term in [canonical, *aliases]:
+                yield "location", term, canonical, "seed"
+        for canonical, aliases in SEED_SCHOOLS.items():
+            for term in [canonical, *aliases]:
+                yield "school", term, canonical, "seed"
+        for canonical, aliases in SEED_MAJORS.items():
+            for term in [canonical, *aliases]:
+                yield "major", term, canonical, "seed"
+
+    def load_knowledge_base(self, knowledge_base: Dict[str, Any]):
+        """Lấy keyword trường/ngành và danh sách ngành hot từ knowledge base"""
+        self.set_kb_terms(self.kb_terms(knowledge_base))
+
+    def kb_terms(self, knowledge_base: Dict[str, Any]) -> List[Tuple[str, str, str, str]]:
+        """(loại, cụm từ, giá trị chuẩn, nguồn) lấy từ knowledge base, để lưu vào KB snapshot"""
+        knowledge_base = knowledge_base or {}
+        terms = []
+        for keyword in knowledge_base.get("school_recommendation", {}).get("keywords", []):
+            terms.append(("school", keyword, keyword, "kb"))
+        for school in knowledge_base.get("school_info", {}).get("sample_schools", {}).values():
+            if isinstance(school, dict) and school.get("name"):
+                terms.append(("school", school["name"], school["name"], "kb"))
+        major_advice = knowledge_base.get("major_advice", {})
+        for keyword in major_advice.get("keywords", []):
+            terms.append(("major", keyword, keyword, "kb"))
+        for major_name in major_advice.get("hot_majors_2024", {}).keys():
+            terms.append(("major", major_name, major_name.lower(), "kb"))
+        return terms
+
+    def set_kb_terms(self, terms: List[Tuple[str, str, str, str]]):
+        with self._lock:
+            self._kb_terms = terms
+            self._dirty = True
+
+    def update_universities(self, universities: Iterable[Dict[str, Any]]):
+        """Sync listener: cập nhật cụm từ của các trường vừa thay đổi"""
+        changed = 0
+        with self._lock:
+            for uni in universities:
+                key = uni.get("id", uni.get("code"))
+                name = uni.get("name")
+                if key is None or not name:
+                    continue
+                previous = self._university_terms.get(key)
+                if previous:
+                    self._university_ids.pop(previous[0][2], None)
+                self._university_terms[key] = list(self._university_term_variants(uni))
+                if uni.get("id") is not None:
+                    self._university_ids[name] = uni["id"]
+                changed += 1
+            if changed:
+                self._dirty = True
+
+    def _university_term_variants(self, uni: Dict[str, Any]):
+        name = uni["name"]
+        yield "school", name, name, "universities"
+        if uni.get("alias"):
+            yield "school", uni["alias"], name, "universities"
+        code = uni.get("code")
+        if code and len(code) >= 3:
+            yield "school", code, name, "universities"
+        # Alias ngắn: bỏ tiền tố "Trường", "Đại học", ... và phần sau dấu "-"
+        short = " ".join(token for token, _, _ in _tokenize(name.split(" - ")[0]))
+        changed = True
+        while changed:
+            changed = False
+            for prefix in SCHOOL_NAME_PREFIXES:
+                if short.startswith(prefix + " "):
+                    short = short[len(prefix) + 1:]
+                    changed = True
+        if len(short.split()) >= 2:
+            yield "school", short, name, "universities"
+
+    # ---------- Biên dịch ----------
+
+    def _compile(self):
+        root = _TrieNode()
+        terms = [*self._static_terms(), *self._kb_terms]
+        for uni_terms in self._university_terms.values():
+            terms.extend(uni_terms)
+        for entity_type, term, value, source in terms:
+            tokens = [token for token, _, _ in _tokenize(term)]
+            if not tokens:
+                continue
+            node = root
+            for token in tokens:
+                node = node.children.setdefault(token, _TrieNode())
+            priority = SOURCE_PRIORITY.get(source, 9)
+            current = node.entries.get(entity_type)
+            if current is None or priority < current[0]:
+                node.entries[entity_type] = (priority, value, source)
+        self._root = root
+        self._dirty = False
+        self.version += 1
+        logger.debug(f"Compiled gazetteer v{self.version} with {len(terms)} terms")
+
+    def _ensure_compiled(self) -> _TrieNode:
+        if self._dirty:
+            with self._lock:
+                if self._dirty:
+                    self._compile()
+        return self._root
+
+    def warm_up(self):
+        """Biên dịch trie ngay (lúc khởi động) thay vì ở tin nhắn đầu tiên"""
+        self._ensure_compiled()
+
+    # ---------- Trích xuất ----------
+
+    def extract(self, message: str) -> List[Dict[str, Any]]:
+        """
+        Trả về mọi thực thể tìm thấy kèm offset trên tin nhắn gốc, trong một lượt quét.
+        Match ngắn nằm trọn trong match dài hơn cùng loại sẽ bị bỏ.
+        """
+        if not message:
+            return []
+        root = self._ensure_compiled()
+        tokens = _tokenize(message)
+        matches = []
+        for i in range(len(tokens)):
+            node = root
+            for j in range(i, len(tokens)):
+                node = node.children.get(tokens[j][0])
+                if node is None:
+                    break
+                for entity_type, (_, value, source) in node.entries.items():
+                    start, end = tokens[i][1], tokens[j][2]
+                    matches.append({
+                        "type": entity_type,
+                        "value": value,
+                        "text": message[start:end],
+                        "start": start,
+                        "end": end,
+                        "source": source
+                    })
+        # Giữ match dài nhất cho mỗi loại, theo thứ tự xuất hiện
+        matches.sort(key=lambda m: (m["start"], -(m["end"] - m["start"])))
+        result = []
+        last_end = {}
+        for match in matches:
+            if match["start"] < last_end.get(match["type"], 0):
+                continue
+            last_end[match["type"]] = match["end"]
+            result.append(match)
+        return result
+
+    def university_id(self, message: str) -> Optional[Any]:
+        """Id của trường đầu tiên được nêu trong tin nhắn (theo tên, alias, code), nếu có"""
+        for match in self.extract(message):
+            if match["type"] == "school" and match["value"] in self._university_ids:
+                return self._university_ids[match["value"]]
+        return None
+
+    def first(self, message: str, entity_type: str) -> Optional[str]:
+        for match in self.extract(message):
+            if match["type"] == entity_type:
+                return match["value"]
+        return None
+
+
+# Singleton instance
+gazetteer_service = GazetteerService()
+university_service.add_sync_listener(gazetteer_service.update_universities)
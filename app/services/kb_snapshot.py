@@ -0,0 +1,123 @@
+import hashlib
+import json
+import logging
+import os
+import pickle
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from app.core.config import settings
+from app.services.gazetteer_service import gazetteer_service
+from app.services.retrieval_service import retrieval_service
+
+logger = logging.getLogger("kb_snapshot")
+
+KB_PATH = Path(__file__).parent.parent / "data" / "knowledge_base.json"
+# Tăng khi đổi cấu trúc snapshot hoặc cách tính index dẫn xuất
+SNAPSHOT_VERSION = 1
+
+
+class KnowledgeBaseSnapshot:
+    """
+    Knowledge base đã parse cùng các index dẫn xuất: keyword theo intent, cụm từ cho
+    gazetteer và vector retrieval của các document KB. Được pickle ra file nhị phân,
+    lần khởi động sau chỉ cần so hash file nguồn là nạp lại được, không parse / vectorize.
+    """
+
+    def __init__(self, source_hash: str, data: Dict[str, Any]):
+        self.source_hash = source_hash
+        self.data = data
+        self.intent_keywords = {
+            k: v["keywords"] for k, v in data.items() if isinstance(v, dict) and "keywords" in v
+        }
+        self.greeting_keywords: List[str] = data.get("greeting", {}).get("keywords", [])
+        self.school_keywords: List[str] = data.get("school_recommendation", {}).get("keywords", [])
+        self.major_keywords: List[str] = data.get("major_advice", {}).get("keywords", [])
+        self.gazetteer_terms = gazetteer_service.kb_terms(data)
+        self.retrieval_ids, self.retrieval_payloads, self.retrieval_matrix = retrieval_service.kb_vectors(data)
+        self.loaded_from = "source"
+
+    @staticmethod
+    def fingerprint(source: bytes) -> str:
+        """Hash nội dung KB + tham số vector hóa (snapshot cũ không còn đúng khi đổi dim)"""
+        digest = hashlib.sha1(source)
+        digest.update(f"|v{SNAPSHOT_VERSION}|{retrieval_service.dim}|{retrieval_service.ngram_range}".encode("utf-8"))
+        return digest.hexdigest()
+
+
+_snapshot: Optional[KnowledgeBaseSnapshot] = None
+_lock = threading.Lock()
+
+
+def _read_snapshot(path: Path, source_hash: str) -> Optional[KnowledgeBaseSnapshot]:
+    if not path.exists():
+        return None
+    try:
+        with open(path, "rb") as f:
+            snapshot = pickle.load(f)
+    except Exception as e:
+        logger.warning(f"Ignoring unreadable KB snapshot {path}: {e}")
+        return None
+    if not isinstance(snapshot, KnowledgeBaseSnapshot) or snapshot.source_hash != source_hash:
+        return None
+    snapshot.loaded_from = "snapshot"
+    return snapshot
+
+
+def _write_snapshot(path: Path, snapshot: KnowledgeBaseSnapshot):
+    tmp = path.with_name(f"{path.name}.tmp-{os.getpid()}")
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(tmp, "wb") as f:
+            pickle.dump(snapshot, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)
+    except OSError as e:
+        logger.warning(f"Writing KB snapshot {path} failed: {e}")
+        if tmp.exists():
+            tmp.unlink()
+
+
+def build_snapshot(kb_path: Path = KB_PATH, snapshot_path: Optional[str] = None) -> KnowledgeBaseSnapshot:
+    """Nạp snapshot nếu hash file nguồn khớp, nếu không parse KB, dựng index rồi ghi snapshot mới"""
+    start = time.perf_counter()
+    try:
+        source = kb_path.read_bytes()
+    except FileNotFoundError:
+        logger.warning(f"Knowledge base file not found at {kb_path}")
+        return KnowledgeBaseSnapshot("", {})
+    source_hash = KnowledgeBaseSnapshot.fingerprint(source)
+    path = Path(snapshot_path) if snapshot_path else None
+    snapshot = _read_snapshot(path, source_hash) if path else None
+    if snapshot is None:
+        try:
+            data = json.loads(source)
+        except ValueError as e:
+            logger.error(f"Error loading knowledge base: {e}")
+            return KnowledgeBaseSnapshot("", {})
+        snapshot = KnowledgeBaseSnapshot(source_hash, data)
+        if path:
+            _write_snapshot(path, snapshot)
+    logger.info(
+        f"Loaded knowledge base ({len(snapshot.data)} categories) from {snapshot.loaded_from} "
+        f"in {(time.perf_counter() - start) * 1000:.1f}ms"
+    )
+    return snapshot
+
+
+def knowledge_base_snapshot() -> KnowledgeBaseSnapshot:
+    """Snapshot dùng chung trong process (knowledge_service, chat_service): KB chỉ nạp một lần"""
+    global _snapshot
+    if _snapshot is None:
+        with _lock:
+            if _snapshot is None:
+                _snapshot = build_snapshot(snapshot_path=settings.kb_snapshot_path)
+    return _snapshot
+
+
+def reset_snapshot():
+    """Bỏ snapshot đã nạp; lần gọi knowledge_base_snapshot() sau đọc lại file nguồn"""
+    global _snapshot
+    with _lock:
+        _snapshot = None
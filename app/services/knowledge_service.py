@@ -1,42 +1,26 @@
-import json
-import os
 from typing import List, Dict, Any, Optional
 import re
-from pathlib import Path
 from app.core.config import settings
+from app.services.retrieval_service import retrieval_service
+from app.services.gazetteer_service import gazetteer_service
+from app.services.kb_snapshot import knowledge_base_snapshot
+from app.utils.lazy import LazyProxy
 
 class KnowledgeService:
     def __init__(self):
         self.knowledge_base = None
         self.load_knowledge_base()
-        # Build intent_keywords mapping from all keys in knowledge_base.json that có 'keywords'
-        current_dir = Path(__file__).parent.parent
-        kb_path = current_dir / "data" / "knowledge_base.json"
-        with open(kb_path, 'r', encoding='utf-8') as f:
-            self.kb_json = json.load(f)
-        self.intent_keywords = {k: v["keywords"] for k, v in self.kb_json.items() if isinstance(v, dict) and "keywords" in v}
-        self.school_keywords = self.kb_json.get("school_recommendation", {}).get("keywords", [])
-        self.major_keywords = self.kb_json.get("major_advice", {}).get("keywords", [])
 
     def load_knowledge_base(self):
-        """Load knowledge base từ file JSON"""
-        try:
-            # Tìm đường dẫn file knowledge base
-            current_dir = Path(__file__).parent.parent
-            kb_path = current_dir / "data" / "knowledge_base.json"
-
-            if not kb_path.exists():
-                print(f"Knowledge base file not found at {kb_path}")
-                self.knowledge_base = {}
-                return
-
-            with open(kb_path, 'r', encoding='utf-8') as f:
-                self.knowledge_base = json.load(f)
-            print(f"✅ Loaded knowledge base with {len(self.knowledge_base)} categories")
-
-        except Exception as e:
-            print(f"Error loading knowledge base: {e}")
-            self.knowledge_base = {}
+        """Load knowledge base (từ KB snapshot nếu file nguồn không đổi) và nạp index dẫn xuất"""
+        snapshot = knowledge_base_snapshot()
+        self.knowledge_base = snapshot.data
+        self.kb_json = snapshot.data
+        self.intent_keywords = snapshot.intent_keywords
+        self.school_keywords = snapshot.school_keywords
+        self.major_keywords = snapshot.major_keywords
+        retrieval_service.load_kb_vectors(snapshot.retrieval_ids, snapshot.retrieval_payloads, snapshot.retrieval_matrix)
+        gazetteer_service.set_kb_terms(snapshot.gazetteer_terms)
     
     def search_by_intent(self, intent: str) -> Dict[str, Any]:
         """Lấy thông tin theo intent"""
@@ -145,19 +129,11 @@ class KnowledgeService:
     
     def _extract_school_name(self, message: str) -> Optional[str]:
         """Trích xuất tên trường từ tin nhắn"""
-        message_lower = message.lower()
-        for school in self.school_keywords:
-            if school in message_lower:
-                return school
-        return None
+        return gazetteer_service.first(message, "school")
     
     def _extract_major_name(self, message: str) -> Optional[str]:
         """Trích xuất tên ngành từ tin nhắn"""
-        message_lower = message.lower()
-        for major in self.major_keywords:
-            if major in message_lower:
-                return major
-        return None
+        return gazetteer_service.first(message, "major")
     
     def _find_relevant_faqs(self, message: str, limit: int = 2) -> List[Dict[str, str]]:
         """Tìm FAQs liên quan đến câu hỏi"""
@@ -235,7 +211,9 @@ class KnowledgeService:
             'primary_context': self.search_by_intent(intent),
             'entities': self._extract_all_entities(user_message),
             'conversation_context': {},
-            'relevant_data': {}
+            'relevant_data': {},
+            # Tài liệu liên quan từ vector retrieval (KB + universities)
+            'retrieved': retrieval_service.search(user_message)
         }
         entities = context['entities']
         # School-specific context
@@ -269,54 +247,25 @@ class KnowledgeService:
         """Extract all possible entities from message"""
         entities = {}
         message_lower = message.lower()
-        import re
         score_pattern = r'\b(\d{1,2}(?:\.\d{1,2})?)\s*(?:điểm|point)\b'
         scores = re.findall(score_pattern, message_lower)
         if scores:
             entities['score_mentioned'] = float(scores[0])
-        school_patterns = [
-            r'bách\s*khoa\s*(?:hà\s*nội|hn|hcm|tp\.hcm)?',
-            r'đại\s*học\s*y\s*(?:hà\s*nội|hn|hcm)?',
-            r'kinh\s*tế\s*quốc\s*dân',
-            r'ngoại\s*thương',
-            r'fpt\s*university',
-            r'sư\s*phạm\s*(?:hà\s*nội|hn|hcm)?'
-        ]
-        found_schools = []
-        for pattern in school_patterns:
-            matches = re.findall(pattern, message_lower)
-            found_schools.extend(matches)
+        # Trường, ngành, địa điểm: một lượt quét gazetteer, kèm offset
+        spans = gazetteer_service.extract(message)
+        found_schools = [m['value'] for m in spans if m['type'] == 'school']
         if found_schools:
             entities['schools'] = found_schools
             entities['school_name'] = found_schools[0]
-        major_patterns = [
-            r'công\s*nghệ\s*thông\s*tin|cntt|it',
-            r'y\s*khoa|medicine',
-            r'kinh\s*tế|economics',
-            r'cơ\s*khí|mechanical',
-            r'điện\s*tử|electronics',
-            r'luật|law',
-            r'sư\s*phạm|education'
-        ]
-        found_majors = []
-        for pattern in major_patterns:
-            if re.search(pattern, message_lower):
-                found_majors.append(pattern.split('|')[0])
+        found_majors = [m['value'] for m in spans if m['type'] == 'major']
         if found_majors:
             entities['majors'] = found_majors
             entities['major_name'] = found_majors[0]
-        location_patterns = [
-            r'hà\s*nội|hn',
-            r'tp\.?\s*hcm|sài\s*gòn|hcm',
-            r'đà\s*nẵng|da\s*nang',
-            r'cần\s*thơ',
-            r'miền\s*bắc|north',
-            r'miền\s*nam|south'
-        ]
-        for pattern in location_patterns:
-            if re.search(pattern, message_lower):
-                entities['location'] = pattern.split('|')[0]
-                break
+        locations = [m['value'] for m in spans if m['type'] == 'location']
+        if locations:
+            entities['location'] = locations[0]
+        if spans:
+            entities['spans'] = spans
         return entities
 
     def _analyze_score_level(self, score: float) -> dict:
@@ -384,4 +333,4 @@ class KnowledgeService:
         }
 
 # Singleton instance
-knowledge_service = KnowledgeService()
\ No newline at end of file
+knowledge_service = LazyProxy("knowledge_service", KnowledgeService)
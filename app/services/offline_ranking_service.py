@@ -0,0 +1,274 @@
+import csv
+import logging
+import os
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+
+from app.core.config import settings
+from app.core.exam_blocks import EXAM_BLOCKS, REGIONS, SUBJECTS, SUBJECT_ALIASES
+from app.repositories.ranking_repository import ranking_repository
+from app.repositories.score_distribution_repository import score_distribution_repository
+from app.repositories.score_store import MAX_CANDIDATE_NUMBER, ScoreStore
+from app.schemas.ranking import StudentRankingResponse
+from app.services.block_score_service import SUBJECT_KEYS, ScoreDistribution, block_score_engine
+
+logger = logging.getLogger("offline_ranking_service")
+
+PRIORITY_COLUMNS = ("uu_tien", "diem_uu_tien", "priority")
+DISTRIBUTIONS_FILE = "distributions.npz"
+# Số dòng CSV giữ dạng list Python trước khi chép vào mảng numpy
+CSV_CHUNK_ROWS = 65536
+
+
+class OfflineRankingService:
+    """
+    Xếp hạng offline từ dataset điểm thi chính thức (CSV, mỗi dòng một thí sinh).
+
+    Điểm khối của mọi thí sinh được tính vector hóa bởi BlockScoreEngine, sau đó
+    gom thành histogram + phân phối tích lũy cho từng (khối, khu vực, năm); số thí
+    sinh bằng điểm / cao hơn / tổng được tra trực tiếp, không cần gọi API ngoài.
+
+    Điểm thí sinh nằm trong ScoreStore dạng cột; khi có `score_store_dir` store được
+    ghi ra đĩa và memory-map, nên các worker chỉ cần mở store (kèm histogram đã tính
+    sẵn) thay vì mỗi worker tự đọc CSV và giữ một bản sao trong RAM.
+    """
+
+    def __init__(self):
+        # year -> điểm thí sinh dạng cột
+        self._stores: Dict[int, ScoreStore] = {}
+        # (block, region, year) -> histogram điểm khối
+        self._distributions: Dict[Tuple[str, str, int], ScoreDistribution] = {}
+
+    def has_year(self, year: int) -> bool:
+        return year in self._stores
+
+    def latest_year(self) -> Optional[int]:
+        return max(self._stores) if self._stores else None
+
+    # ---------- Ingest ----------
+
+    def load_configured_dataset(self) -> Optional[int]:
+        """
+        Nạp dataset theo cấu hình: mở store đã build nếu còn mới hơn file CSV,
+        ngược lại đọc CSV và build lại store. Trả về số thí sinh đã nạp.
+        """
+        year = settings.score_dataset_year
+        store_path = self._store_path(year)
+        csv_path = settings.score_dataset_path
+        if store_path and ScoreStore.exists(store_path):
+            csv_newer = csv_path and os.path.exists(csv_path) and \
+                os.path.getmtime(csv_path) > os.path.getmtime(store_path / "meta.json")
+            if not csv_newer:
+                return self.open_store(store_path)
+        if csv_path:
+            return self.load_csv(csv_path, year)
+        return None
+
+    def open_store(self, path) -> int:
+        """Mở store đã build (memory-map) và histogram đi kèm"""
+        start = time.perf_counter()
+        store = ScoreStore.open(path)
+        self._stores[store.year] = store
+        npz_path = Path(path) / DISTRIBUTIONS_FILE
+        if npz_path.exists():
+            self.load_distributions_npz(str(npz_path))
+        else:
+            self.recompute(store.year)
+        logger.info(f"Opened score store for {store.year} ({len(store)} candidates) in {time.perf_counter() - start:.2f}s")
+        return len(store)
+
+    def load_csv(self, path: str, year: int) -> int:
+        """
+        Đọc file điểm (cột sbd, các môn, tùy chọn region/khu_vuc) và dựng các mảng xếp hạng.
+        Mảng kết quả được cấp phát trước theo số dòng của file rồi điền theo từng khối
+        CSV_CHUNK_ROWS dòng, nên chỉ một khối nằm trong RAM dưới dạng object Python.
+        """
+        start = time.perf_counter()
+        with open(path, "rb") as f:
+            capacity = max(sum(1 for _ in f) - 1, 0)
+        sbd = np.zeros(capacity, dtype=np.uint32)
+        scores = np.full((capacity, len(SUBJECT_KEYS)), np.nan, dtype=np.float32)
+        region_idx = np.zeros(capacity, dtype=np.uint8)
+        priority = np.zeros(capacity, dtype=np.float32)
+        count = 0
+        with open(path, "r", encoding="utf-8-sig", newline="") as f:
+            reader = csv.reader(f)
+            header = [self._column_key(h) for h in next(reader)]
+            sbd_col = header.index("sbd")
+            region_col = next((i for i, h in enumerate(header) if h in ("region", "khu_vuc")), None)
+            priority_col = next((i for i, h in enumerate(header) if h in PRIORITY_COLUMNS), None)
+            subject_cols = [(header.index(key) if key in header else None) for key in SUBJECT_KEYS]
+            chunk_sbd, chunk_rows, chunk_regions, chunk_priorities = [], [], [], []
+
+            def flush():
+                nonlocal count
+                end = count + len(chunk_sbd)
+                sbd[count:end] = chunk_sbd
+                scores[count:end] = np.asarray(chunk_rows, dtype=np.float32).reshape(len(chunk_rows), len(SUBJECT_KEYS))
+                region_idx[count:end] = chunk_regions
+                priority[count:end] = chunk_priorities
+                count = end
+                for chunk in (chunk_sbd, chunk_rows, chunk_regions, chunk_priorities):
+                    chunk.clear()
+
+            for row in reader:
+                if not row or not row[sbd_col].strip().isdigit():
+                    continue
+                number = int(row[sbd_col])
+                # SBD phải vừa uint32 (cột sbd của ScoreStore)
+                if number > MAX_CANDIDATE_NUMBER:
+                    continue
+                chunk_sbd.append(number)
+                chunk_rows.append([self._parse_score(row[col]) if col is not None and col < len(row) else np.nan
+                                   for col in subject_cols])
+                region = row[region_col].strip().upper() if region_col is not None and region_col < len(row) else ""
+                chunk_regions.append(REGIONS.index(region) if region in REGIONS else 0)
+                value = self._parse_score(row[priority_col]) if priority_col is not None and priority_col < len(row) else 0.0
+                chunk_priorities.append(0.0 if np.isnan(value) else value)
+                if len(chunk_sbd) >= CSV_CHUNK_ROWS:
+                    flush()
+            if chunk_sbd:
+                flush()
+        self.load_arrays(sbd[:count], scores[:count], region_idx[:count], year, priority[:count])
+        logger.info(f"Loaded {count} candidates for {year} in {time.perf_counter() - start:.1f}s")
+        return count
+
+    def load_arrays(self, sbd: np.ndarray, scores: np.ndarray, region_idx: np.ndarray, year: int,
+                    priority: Optional[np.ndarray] = None):
+        """Nạp dữ liệu đã ở dạng mảng (sbd, điểm theo SUBJECT_KEYS, chỉ số khu vực theo REGIONS)"""
+        store = ScoreStore.from_arrays(year, sbd, scores, region_idx, priority)
+        store_path = self._store_path(year)
+        if store_path:
+            store = store.save(store_path)
+        self._stores[year] = store
+        distributions = self.recompute(year)
+        if store_path:
+            block_score_engine.save_npz(str(store_path / DISTRIBUTIONS_FILE), distributions, year)
+
+    def _store_path(self, year: int) -> Optional[Path]:
+        if not settings.score_store_dir:
+            return None
+        return Path(settings.score_store_dir) / str(year)
+
+    def recompute(self, year: int) -> Dict[Tuple[str, str], ScoreDistribution]:
+        """Tính lại toàn bộ điểm khối và histogram của một năm (ví dụ sau khi đính chính điểm)"""
+        start = time.perf_counter()
+        store = self._stores[year]
+        priority = store.priority_array() if settings.score_apply_priority else None
+        totals = block_score_engine.compute_totals(store.scores_matrix(), priority)
+        distributions = block_score_engine.build_distributions(totals, np.asarray(store.region))
+        # Thay cả bộ phân phối của năm cùng lúc (snapshot swap)
+        self._distributions = {
+            **{k: v for k, v in self._distributions.items() if k[2] != year},
+            **{(block, region, year): dist for (block, region), dist in distributions.items()}
+        }
+        logger.info(f"Recomputed {len(distributions)} score distributions for {year} in {time.perf_counter() - start:.2f}s")
+        return distributions
+
+    def year_distributions(self, year: int) -> Dict[Tuple[str, str], ScoreDistribution]:
+        return {(block, region): dist for (block, region, y), dist in self._distributions.items() if y == year}
+
+    async def save_distributions(self, year: int, npz_path: Optional[str] = None):
+        """Lưu histogram của năm vào Mongo (score_distributions) và tùy chọn file .npz"""
+        distributions = self.year_distributions(year)
+        if npz_path:
+            block_score_engine.save_npz(npz_path, distributions, year)
+        await score_distribution_repository.replace_year(year, block_score_engine.to_documents(distributions, year))
+
+    def load_distributions_npz(self, path: str) -> int:
+        """Nạp histogram đã tính sẵn (đủ để rank() một điểm bất kỳ, không cần dữ liệu thí sinh)"""
+        year, distributions = block_score_engine.load_npz(path)
+        self._distributions = {
+            **{k: v for k, v in self._distributions.items() if k[2] != year},
+            **{(block, region, year): dist for (block, region), dist in distributions.items()}
+        }
+        return year
+
+    def _column_key(self, header: str) -> str:
+        key = header.strip().lower().replace(" ", "_")
+        if key in ("so_bao_danh", "candidate_number"):
+            return "sbd"
+        return SUBJECT_ALIASES.get(key, key)
+
+    def _parse_score(self, value: str) -> float:
+        value = value.strip().replace(",", ".")
+        if not value:
+            return np.nan
+        try:
+            return float(value)
+        except ValueError:
+            return np.nan
+
+    # ---------- Query ----------
+
+    def rank(self, block: str, region: str, year: int, score: float) -> Optional[Dict[str, int]]:
+        """Số thí sinh bằng điểm, cao hơn và tổng số thí sinh có điểm khối này"""
+        distribution = self._distributions.get((block, region, year))
+        if distribution is None:
+            return None
+        return distribution.rank(score)
+
+    def get_scores(self, candidate_number: str, year: int) -> Optional[np.ndarray]:
+        store = self._stores.get(year)
+        pos = store.find(candidate_number) if store is not None else None
+        if pos is None:
+            return None
+        return store.row_scores(pos)
+
+    def get_student_ranking(self, candidate_number: str, region: str = "CN", year: int = 2025) -> Optional[StudentRankingResponse]:
+        """Dựng StudentRankingResponse giống API tuyensinh247 từ dữ liệu cục bộ"""
+        store = self._stores.get(year)
+        pos = store.find(candidate_number) if store is not None else None
+        if pos is None:
+            return None
+        scores = store.row_scores(pos)
+        region = region if region in REGIONS else "CN"
+        mark_info = [
+            {"name": SUBJECTS[key], "score": f"{float(scores[i]):g}"}
+            for i, key in enumerate(SUBJECT_KEYS) if not np.isnan(scores[i])
+        ]
+        priority = np.array([store.row_priority(pos)], dtype=np.float32) if settings.score_apply_priority else None
+        totals = block_score_engine.compute_totals(scores[None, :], priority)
+        blocks = []
+        for block_id, (block, subjects) in enumerate(EXAM_BLOCKS.items(), start=1):
+            total = totals[block][0]
+            if np.isnan(total):
+                continue
+            point = round(float(total), 2)
+            ranking = self.rank(block, region, year, point)
+            if ranking is None:
+                continue
+            blocks.append({
+                "label": block,
+                "value": block,
+                "id": block_id,
+                "subjects": [SUBJECTS[s] for s in subjects],
+                "point": point,
+                "ranking": ranking,
+                "region": region,
+                "year": year
+            })
+        return StudentRankingResponse(
+            candidate_number=candidate_number,
+            mark_info=mark_info,
+            data_year=year,
+            blocks=blocks
+        )
+
+    def get_document(self, candidate_number: str) -> Optional[Dict[str, Any]]:
+        """Bản ghi dạng student_ranking (năm mới nhất đã nạp) cho ranking_repository"""
+        year = self.latest_year()
+        if year is None:
+            return None
+        result = self.get_student_ranking(candidate_number, "CN", year)
+        if result is None:
+            return None
+        return {**result.model_dump(), "region": "CN", "source": "offline"}
+
+
+# Singleton instance
+offline_ranking_service = OfflineRankingService()
+ranking_repository.set_local_source(offline_ranking_service.get_document)
@@ -2,6 +2,7 @@ import openai
 from typing import List, Dict, Any, Optional
 from app.core.config import settings
 from app.services.knowledge_service import knowledge_service
+from app.utils.lazy import LazyProxy
 import json
 import logging
 import os
@@ -10,12 +11,8 @@ logger = logging.getLogger("openai_service")
 
 class OpenAIService:
     def __init__(self):
-        if not settings.openai_api_key:
-            raise ValueError("OPENAI_API_KEY not found in environment variables")
-        if not settings.openai_model:
-            raise ValueError("OPENAI_MODEL not found in environment variables")
-
-        self.client = openai.AsyncOpenAI(api_key=settings.openai_api_key)
+        # Client tạo lazy (lần gọi đầu hoặc trong lifespan) để import không phụ thuộc API key
+        self._client: Optional[openai.AsyncOpenAI] = None
         self.model = settings.openai_model
 
         # Load system prompt từ file nếu có
@@ -66,6 +63,25 @@ Nếu người dùng hỏi về điểm thi, hãy yêu cầu cung cấp SBD và
 Hãy phản hồi thân thiện, ghi nhớ thông tin và chuyển hướng về cách có thể hỗ trợ tuyển sinh.
 """
 
+    @property
+    def client(self) -> openai.AsyncOpenAI:
+        if self._client is None:
+            if not settings.openai_api_key:
+                raise ValueError("OPENAI_API_KEY not found in environment variables")
+            if not settings.openai_model:
+                raise ValueError("OPENAI_MODEL not found in environment variables")
+            self._client = openai.AsyncOpenAI(
+                api_key=settings.openai_api_key,
+                timeout=settings.openai_timeout,
+                max_retries=settings.openai_max_retries
+            )
+        return self._client
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.close()
+        self._client = None
+
     async def generate_response(
         self, 
         user_message: str, 
@@ -136,6 +152,7 @@ Hãy phản hồi thân thiện, ghi nhớ thông tin và chuyển hướng về
             prompt_parts.append(self._build_student_analysis(student_data, intent))
         prompt_parts.append(self._build_timeline_info(relevant_info))
         prompt_parts.append(self._build_faqs(relevant_info))
+        prompt_parts.append(self._build_retrieved_documents(knowledge_context.get('retrieved', [])))
         prompt_parts.append(self._build_instructions())
         return "\n".join([p for p in prompt_parts if p])
 
@@ -239,6 +256,17 @@ Hãy phản hồi thân thiện, ghi nhớ thông tin và chuyển hướng về
             parts.append(f"  A: {faq['answer']}")
         return "\n".join(parts)
 
+    def _build_retrieved_documents(self, retrieved):
+        if not retrieved:
+            return ""
+        parts = ["\n📚 RELATED DOCUMENTS:"]
+        for doc in retrieved:
+            label = doc.get('title', '')
+            if doc.get('code'):
+                label = f"{label} ({doc['code']})"
+            parts.append(f"• {label}: {doc.get('snippet', '')}")
+        return "\n".join(parts)
+
     def _build_instructions(self):
         return ("\n=== INSTRUCTIONS ===\n"
                 "✅ Use ONLY the information provided above\n"
@@ -328,12 +356,21 @@ Bạn có thể thử lại hoặc đặt câu hỏi cụ thể hơn.""")
             student_data=student_ranking_data
         )
 
-    async def stream_response(self, user_message: str, context=None, intent: str = "general", student_data=None):
+    async def stream_response(self, user_message: str, context=None, intent: str = "general", student_data=None,
+                              session_facts: str = None):
         """
         Gọi OpenAI API với stream=True, yield từng chunk assistant trả lời (chỉ content).
+        `session_facts`: các entity đã biết của session (session memory), gửi dạng system message.
         """
         import asyncio
         messages = [{"role": "system", "content": self.system_prompt}]
+        # Knowledge injection (smart context + retrieval) giống generate_response
+        smart_context = knowledge_service.get_smart_context(user_message, intent)
+        knowledge_prompt = self._build_enhanced_knowledge_prompt(smart_context, intent, student_data)
+        if knowledge_prompt:
+            messages.append({"role": "system", "content": knowledge_prompt})
+        if session_facts:
+            messages.append({"role": "system", "content": session_facts})
         if context:
             messages.extend(context)
         messages.append({"role": "user", "content": user_message})
@@ -353,4 +390,4 @@ Bạn có thể thử lại hoặc đặt câu hỏi cụ thể hơn.""")
             if delta:
                 yield delta
 
-openai_service = OpenAIService()
\ No newline at end of file
+openai_service = LazyProxy("openai_service", OpenAIService)
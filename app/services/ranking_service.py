@@ -1,8 +1,58 @@
 import aiohttp
+import asyncio
+import datetime
+import logging
 import time
-from typing import Optional, List, Dict, Any
+import re
+from typing import Optional, List, Dict, Any, AsyncIterator, Iterable, Set, Tuple
+from app.core.config import settings
+from app.core.http_client import http_client
 from app.schemas.ranking import RankingSearchRequest, StudentRankingResponse
 from app.repositories.ranking_repository import ranking_repository
+from app.services.offline_ranking_service import offline_ranking_service
+from app.utils.cache import LRUCache
+from app.utils.circuit_breaker import CircuitBreaker, OPEN
+from app.utils.rate_limiter import TokenBucket
+from app.utils.response import dumps
+from app.utils.single_flight import SingleFlight
+
+logger = logging.getLogger("ranking_service")
+
+# Số kết quả upstream mỗi lần bulk_write khi tra cứu hàng loạt
+BULK_PERSIST_BATCH = 100
+
+
+class UpstreamUnavailableError(Exception):
+    """API ranking ngoài lỗi hoặc đang bị circuit breaker chặn"""
+
+
+def normalize_candidate_numbers(values: Iterable[str]) -> Tuple[List[str], List[str]]:
+    """Chuẩn hóa và loại trùng danh sách SBD, giữ thứ tự; trả về (hợp lệ, không hợp lệ)"""
+    valid, invalid, seen = [], [], set()
+    for value in values:
+        value = str(value).strip()
+        if not value:
+            continue
+        # Excel thường làm mất số 0 đầu của SBD
+        if re.fullmatch(r"\d{7}", value):
+            value = value.zfill(8)
+        if value in seen:
+            continue
+        seen.add(value)
+        if re.fullmatch(r"\d{8}", value):
+            valid.append(value)
+        else:
+            invalid.append(value)
+    return valid, invalid
+
+
+def _is_upstream_failure(status: Optional[int]) -> bool:
+    """Chỉ timeout / lỗi kết nối (status None), 5xx và 429 được tính là lỗi cho circuit breaker"""
+    return status is None or status >= 500 or status == 429
+
+
+def _ndjson(row: Dict[str, Any]) -> bytes:
+    return dumps(row) + b"\n"
 
 class RankingService:
     def __init__(self):
@@ -12,48 +62,67 @@ class RankingService:
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
             'Referer': 'https://diemthi.tuyensinh247.com/xep-hang-thi-thptqg.html'
         }
-        self.rate_limit = 1
-        self.last_request_time = 0
+        # Giới hạn tốc độ gọi upstream, dùng chung cho mọi coroutine
+        self.limiter = TokenBucket(settings.ranking_rate_limit, settings.ranking_rate_burst)
+        # Cache tầng 1 (in-process) + circuit breaker cho upstream
+        self._cache = LRUCache(settings.ranking_cache_size)
+        self.breaker = CircuitBreaker(settings.ranking_breaker_threshold, settings.ranking_breaker_reset)
+        self._revalidating: Dict[tuple, asyncio.Task] = {}
+        # Task lưu kết quả tra cứu hàng loạt (giữ tham chiếu tới khi xong)
+        self._persisting: Set[asyncio.Task] = set()
+        # Gộp các lookup đồng thời cùng (candidate_number, region, year)
+        self._single_flight = SingleFlight()
+        self._stats = {
+            "offline_hits": 0,
+            "fresh_hits": 0,
+            "db_hits": 0,
+            "stale_served": 0,
+            "revalidations": 0,
+            "upstream_calls": 0,
+            "breaker_rejected": 0
+        }
 
     async def _make_api_request(self, candidate_number: str, region: str) -> Optional[Dict[str, Any]]:
-        import asyncio
-        current_time = time.time()
-        time_since_last_request = current_time - self.last_request_time
-        if time_since_last_request < self.rate_limit:
-            await asyncio.sleep(self.rate_limit - time_since_last_request)
         payload = {
             "region": region,
             "userNumber": candidate_number
         }
+        queue_wait = await self.limiter.acquire()
         start_time = time.time()
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.post(
-                    self.api_url,
-                    json=payload,
-                    headers=self.headers,
-                    timeout=aiohttp.ClientTimeout(total=30)
-                ) as response:
-                    self.last_request_time = time.time()
-                    response_time = time.time() - start_time
-                    if response.status == 200:
-                        data = await response.json()
-                        return {
-                            "success": True,
-                            "data": data,
-                            "response_time": response_time
-                        }
-                    else:
-                        return {
-                            "success": False,
-                            "error": f"HTTP {response.status}",
-                            "response_time": response_time
-                        }
+            session = await http_client.get_session()
+            async with session.post(
+                self.api_url,
+                json=payload,
+                headers=self.headers,
+                timeout=aiohttp.ClientTimeout(total=settings.ranking_upstream_timeout)
+            ) as response:
+                response_time = time.time() - start_time
+                if response.status == 200:
+                    data = await response.json()
+                    return {
+                        "success": True,
+                        "status": response.status,
+                        "data": data,
+                        "response_time": response_time,
+                        "queue_wait": queue_wait
+                    }
+                else:
+                    return {
+                        "success": False,
+                        "status": response.status,
+                        "error": f"HTTP {response.status}",
+                        "response_time": response_time,
+                        "queue_wait": queue_wait
+                    }
         except Exception as e:
+            # Timeout / lỗi kết nối: không có status
             return {
                 "success": False,
+                "status": None,
                 "error": str(e),
-                "response_time": time.time() - start_time
+                "response_time": time.time() - start_time,
+                "queue_wait": queue_wait
             }
 
     async def get_student_ranking(
@@ -61,22 +130,260 @@ class RankingService:
         request: RankingSearchRequest,
         save_to_db: bool = True
     ) -> Optional[StudentRankingResponse]:
+        """
+        Ưu tiên engine xếp hạng offline (nếu đã nạp dataset năm đó), sau đó
+        read-through cache 3 tầng: LRU in-process -> Mongo student_ranking -> API ngoài.
+        Dữ liệu quá hạn (theo năm) vẫn được trả ngay, đồng thời làm mới ở nền.
+        """
         region = request.region or "CN"
         year = 2025
         candidate_number = request.candidate_number
+        local = self._get_offline_ranking(candidate_number, region, year)
+        if local is not None:
+            return local
+        key = (candidate_number, region, year)
+        entry = await self._get_cached(key)
+        if entry is not None:
+            if self._is_fresh(entry, year):
+                self._stats["fresh_hits"] += 1
+            else:
+                # Stale-while-revalidate
+                self._stats["stale_served"] += 1
+                self._schedule_revalidate(key, save_to_db)
+            return self._build_response(entry["data"], region, year)
+        try:
+            entry = await self._load_from_upstream(key, persist=save_to_db)
+        except UpstreamUnavailableError as e:
+            logger.warning(f"Ranking upstream unavailable for {candidate_number}: {e}")
+            return None
+        if entry is None:
+            return None
+        return self._build_response(entry["data"], region, year)
+
+    def _get_offline_ranking(self, candidate_number: str, region: str, year: int) -> Optional[StudentRankingResponse]:
+        if not offline_ranking_service.has_year(year):
+            return None
+        result = offline_ranking_service.get_student_ranking(candidate_number, region, year)
+        if result is not None:
+            self._stats["offline_hits"] += 1
+        return result
+
+    async def _get_cached(self, key) -> Optional[Dict[str, Any]]:
+        entry = self._cache.get(key)
+        if entry is not None:
+            return entry
+        candidate_number, region, year = key
+        try:
+            doc = await ranking_repository.get_by_candidate_number(candidate_number)
+        except Exception as e:
+            logger.error(f"Error reading cached ranking {candidate_number}: {e}")
+            return None
+        return self._entry_from_doc(key, doc)
+
+    def _entry_from_doc(self, key, doc: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        """Chuyển bản ghi student_ranking thành cache entry (và nạp vào LRU)"""
+        _, region, year = key
+        if not doc or doc.get("region", region) != region or doc.get("data_year", year) != year:
+            return None
+        fetched_at = doc.pop("fetched_at", None)
+        for field in ("_id", "region"):
+            doc.pop(field, None)
+        if isinstance(fetched_at, datetime.datetime):
+            if fetched_at.tzinfo is None:
+                fetched_at = fetched_at.replace(tzinfo=datetime.timezone.utc)
+            fetched_ts = fetched_at.timestamp()
+        else:
+            # Bản ghi cũ chưa có fetched_at: luôn coi là stale
+            fetched_ts = 0.0
+        entry = {"data": doc, "fetched_at": fetched_ts}
+        self._cache.set(key, entry)
+        self._stats["db_hits"] += 1
+        return entry
+
+    def _is_fresh(self, entry: Dict[str, Any], year: int) -> bool:
+        ttl = settings.ranking_freshness.get(year, settings.ranking_fresh_ttl)
+        if ttl <= 0:
+            # TTL = 0: dữ liệu năm đó đã chốt, không bao giờ hết hạn
+            return True
+        return time.time() - entry["fetched_at"] < ttl
+
+    async def _load_from_upstream(self, key, persist: bool = True) -> Optional[Dict[str, Any]]:
+        """Single-flight: các caller đồng thời cùng key dùng chung một request và một lần lưu DB"""
+        return await self._single_flight.do(key, lambda: self._fetch_and_store(key, persist=persist))
+
+    async def _fetch_and_store(self, key, persist: bool = True) -> Optional[Dict[str, Any]]:
+        """Gọi API ngoài; trả None nếu SBD không tồn tại, raise UpstreamUnavailableError nếu upstream lỗi"""
+        candidate_number, region, year = key
+        if not self.breaker.allow_request():
+            self._stats["breaker_rejected"] += 1
+            raise UpstreamUnavailableError("circuit breaker open")
+        self._stats["upstream_calls"] += 1
         api_result = await self._make_api_request(candidate_number, region)
         if not api_result["success"]:
-            return None
+            if not _is_upstream_failure(api_result.get("status")):
+                # 4xx (trừ 429): upstream vẫn sống, request không hợp lệ / SBD không tồn tại
+                self.breaker.record_ignored()
+                logger.info(f"Ranking upstream rejected {candidate_number}: {api_result.get('error')}")
+                return None
+            self.breaker.record_failure()
+            raise UpstreamUnavailableError(api_result.get("error", "upstream error"))
+        self.breaker.record_success()
         api_data = api_result["data"]
         if not api_data.get("success") or not api_data.get("data"):
             return None
         ranking_data = api_data["data"]
-        if save_to_db:
-            await ranking_repository.upsert_ranking(ranking_data["candidate_number"], ranking_data)
-        # Gắn region và year vào từng block
-        for block in ranking_data.get("blocks", []):
-            block["region"] = region
-            block["year"] = year
-        return StudentRankingResponse(**ranking_data)
-
-ranking_service = RankingService()
\ No newline at end of file
+        entry = {"data": ranking_data, "fetched_at": time.time()}
+        self._cache.set(key, entry)
+        if persist:
+            try:
+                await ranking_repository.upsert_ranking(
+                    ranking_data["candidate_number"], self._to_db_doc(ranking_data, region)
+                )
+            except Exception as e:
+                logger.error(f"Error saving ranking {candidate_number}: {e}")
+        return entry
+
+    def _to_db_doc(self, ranking_data: Dict[str, Any], region: str) -> Dict[str, Any]:
+        return {
+            **ranking_data,
+            "region": region,
+            "fetched_at": datetime.datetime.now(datetime.timezone.utc)
+        }
+
+    def _schedule_revalidate(self, key, persist: bool):
+        if key in self._revalidating or self.breaker.state == OPEN:
+            return
+        self._stats["revalidations"] += 1
+        task = asyncio.create_task(self._revalidate(key, persist))
+        self._revalidating[key] = task
+        task.add_done_callback(lambda _: self._revalidating.pop(key, None))
+
+    async def _revalidate(self, key, persist: bool):
+        try:
+            await self._load_from_upstream(key, persist=persist)
+        except UpstreamUnavailableError as e:
+            logger.warning(f"Background ranking refresh failed for {key[0]}: {e}")
+
+    async def stream_bulk_rankings(self, candidate_numbers: List[str], region: str = "CN") -> AsyncIterator[bytes]:
+        """
+        Tra cứu hàng loạt, stream kết quả dạng NDJSON (mỗi dòng một SBD) theo thứ tự hoàn thành.
+        SBD đã có trong cache được trả ngay; phần còn lại gọi upstream với số request
+        đồng thời giới hạn, dùng chung rate limiter. Kết quả mới được lưu bằng bulk_write
+        theo lô BULK_PERSIST_BATCH, phần còn lại được lưu cả khi client ngắt kết nối giữa chừng.
+        """
+        region = region or "CN"
+        year = 2025
+        valid, invalid = normalize_candidate_numbers(candidate_numbers)
+        summary = {"total": len(valid) + len(invalid), "ok": 0, "cached": 0, "not_found": 0, "error": 0, "invalid": len(invalid)}
+
+        for value in invalid:
+            yield _ndjson({"candidate_number": value, "status": "invalid", "error": "Số báo danh phải gồm 8 chữ số"})
+
+        # 1. Engine offline, rồi cache: LRU và một truy vấn $in xuống Mongo
+        remaining = []
+        for cn in valid:
+            local = self._get_offline_ranking(cn, region, year)
+            if local is None:
+                remaining.append(cn)
+                continue
+            summary["ok"] += 1
+            summary["cached"] += 1
+            yield _ndjson({"candidate_number": cn, "status": "ok", "source": "offline", "stale": False, "data": local.model_dump()})
+        valid = remaining
+        pending = []
+        missing = [cn for cn in valid if (cn, region, year) not in self._cache]
+        stored = {}
+        if missing:
+            try:
+                stored = await ranking_repository.get_many_by_candidate_numbers(missing)
+            except Exception as e:
+                logger.error(f"Error reading cached rankings: {e}")
+        for cn in valid:
+            key = (cn, region, year)
+            entry = self._cache.get(key) or self._entry_from_doc(key, stored.get(cn))
+            if entry is None:
+                pending.append(cn)
+                continue
+            summary["ok"] += 1
+            summary["cached"] += 1
+            yield _ndjson({
+                "candidate_number": cn,
+                "status": "ok",
+                "source": "cache",
+                "stale": not self._is_fresh(entry, year),
+                "data": self._build_response(entry["data"], region, year).model_dump()
+            })
+
+        # 2. Upstream với concurrency giới hạn, trả về theo thứ tự hoàn thành
+        semaphore = asyncio.Semaphore(settings.ranking_bulk_concurrency)
+        fetched = []
+
+        async def fetch_one(cn: str) -> Dict[str, Any]:
+            async with semaphore:
+                try:
+                    entry = await self._load_from_upstream((cn, region, year), persist=False)
+                except UpstreamUnavailableError as e:
+                    return {"candidate_number": cn, "status": "error", "error": str(e)}
+                except Exception as e:
+                    logger.error(f"Bulk ranking lookup failed for {cn}: {e}")
+                    return {"candidate_number": cn, "status": "error", "error": "internal error"}
+            if entry is None:
+                return {"candidate_number": cn, "status": "not_found"}
+            fetched.append(self._to_db_doc(entry["data"], region))
+            return {
+                "candidate_number": cn,
+                "status": "ok",
+                "source": "upstream",
+                "stale": False,
+                "data": self._build_response(entry["data"], region, year).model_dump()
+            }
+
+        # 3. Lưu kết quả mới theo lô trong lúc stream
+        persisting = []
+        tasks = [asyncio.create_task(fetch_one(cn)) for cn in pending]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                row = await next_done
+                summary[row["status"]] += 1
+                yield _ndjson(row)
+                if len(fetched) >= BULK_PERSIST_BATCH:
+                    persisting.append(self._persist_rankings(fetched[:]))
+                    fetched.clear()
+        finally:
+            for task in tasks:
+                task.cancel()
+            # Chạy cả khi generator bị đóng do client ngắt kết nối
+            if fetched:
+                persisting.append(self._persist_rankings(fetched[:]))
+                fetched.clear()
+        await asyncio.gather(*persisting)
+        yield _ndjson({"summary": summary})
+
+    def _persist_rankings(self, docs: List[Dict[str, Any]]) -> asyncio.Task:
+        """bulk_upsert trong task riêng nên không bị huỷ cùng request đang stream"""
+        task = asyncio.create_task(self._bulk_upsert(docs))
+        self._persisting.add(task)
+        task.add_done_callback(self._persisting.discard)
+        return task
+
+    async def _bulk_upsert(self, docs: List[Dict[str, Any]]):
+        try:
+            await ranking_repository.bulk_upsert_rankings(docs)
+        except Exception as e:
+            logger.error(f"Error saving bulk rankings: {e}")
+
+    def _build_response(self, ranking_data: Dict[str, Any], region: str, year: int) -> StudentRankingResponse:
+        # Gắn region và year vào từng block (không sửa dữ liệu trong cache)
+        data = dict(ranking_data)
+        data["blocks"] = [{**block, "region": region, "year": year} for block in ranking_data.get("blocks", [])]
+        return StudentRankingResponse(**data)
+
+    def get_metrics(self) -> Dict[str, Any]:
+        return {
+            "rate_limiter": self.limiter.metrics(),
+            "cache": {**self._cache.metrics(), **self._stats},
+            "circuit_breaker": self.breaker.metrics(),
+            "single_flight": self._single_flight.metrics()
+        }
+
+ranking_service = RankingService()
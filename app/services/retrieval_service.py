@@ -0,0 +1,228 @@
+import logging
+import math
+import zlib
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from app.core.config import settings
+from app.services.university_service import university_service
+from app.utils.text import normalize_text
+
+logger = logging.getLogger("retrieval_service")
+
+# Các field của document trường được đưa vào vector (theo thứ tự ưu tiên)
+UNIVERSITY_TEXT_FIELDS = ["name", "alias", "code", "location", "type", "description", "dac_sac"]
+
+
+class RetrievalService:
+    """
+    Truy xuất vector cục bộ (CPU, offline) trên knowledge base và collection universities.
+
+    Mỗi document được biểu diễn bằng vector char n-gram đã hash (signed hashing),
+    lưu trong một ma trận NumPy float32 đã chuẩn hóa L2. Top-k cosine similarity
+    được tính bằng một phép nhân ma trận - vector duy nhất.
+    """
+
+    def __init__(self, dim: int = None, ngram_range: Tuple[int, int] = (3, 4)):
+        self.dim = dim or settings.retrieval_dim
+        self.ngram_range = ngram_range
+        self._matrix = np.zeros((256, self.dim), dtype=np.float32)
+        self._df = np.zeros(self.dim, dtype=np.float32)
+        self._ids: List[str] = []
+        self._payloads: List[Dict[str, Any]] = []
+        self._rows: Dict[str, int] = {}
+        self._kb_indexed = False
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    # ---------- Vectorize ----------
+
+    def _hash_features(self, text: str) -> Tuple[np.ndarray, np.ndarray]:
+        """Trả về (bucket, sign) của các char n-gram và từ đơn trong text"""
+        norm = normalize_text(text)
+        if not norm:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        padded = f" {norm} "
+        grams = []
+        low, high = self.ngram_range
+        for n in range(low, high + 1):
+            grams.extend(padded[i:i + n] for i in range(len(padded) - n + 1))
+        grams.extend(norm.split())
+        hashes = np.fromiter(
+            (zlib.crc32(g.encode("utf-8")) for g in grams),
+            dtype=np.int64,
+            count=len(grams)
+        )
+        buckets = hashes % self.dim
+        signs = np.where((hashes >> 31) & 1, -1.0, 1.0).astype(np.float32)
+        return buckets, signs
+
+    def _vectorize(self, text: str) -> np.ndarray:
+        buckets, signs = self._hash_features(text)
+        vec = np.bincount(buckets, weights=signs, minlength=self.dim).astype(np.float32)
+        # Sublinear tf: giảm ảnh hưởng n-gram lặp lại nhiều lần
+        vec = np.sign(vec) * np.log1p(np.abs(vec))
+        norm = np.linalg.norm(vec)
+        if norm > 0:
+            vec /= norm
+        return vec
+
+    # ---------- Index ----------
+
+    def upsert(self, doc_id: str, text: str, payload: Dict[str, Any]):
+        """Thêm mới hoặc cập nhật một document trong index"""
+        self.upsert_vector(doc_id, self._vectorize(text), payload)
+
+    def upsert_vector(self, doc_id: str, vec: np.ndarray, payload: Dict[str, Any]):
+        """Như upsert nhưng với vector đã tính sẵn (vd. từ KB snapshot)"""
+        row = self._rows.get(doc_id)
+        if row is None:
+            row = len(self._ids)
+            if row >= self._matrix.shape[0]:
+                grown = np.zeros((self._matrix.shape[0] * 2, self.dim), dtype=np.float32)
+                grown[:row] = self._matrix[:row]
+                self._matrix = grown
+            self._ids.append(doc_id)
+            self._payloads.append(payload)
+            self._rows[doc_id] = row
+        else:
+            self._df -= self._matrix[row] != 0
+            self._payloads[row] = payload
+        self._matrix[row] = vec
+        self._df += vec != 0
+
+    def remove(self, doc_id: str):
+        """Xóa document, dồn hàng cuối vào vị trí trống để ma trận luôn liền mạch"""
+        row = self._rows.pop(doc_id, None)
+        if row is None:
+            return
+        self._df -= self._matrix[row] != 0
+        last = len(self._ids) - 1
+        if row != last:
+            self._matrix[row] = self._matrix[last]
+            self._ids[row] = self._ids[last]
+            self._payloads[row] = self._payloads[last]
+            self._rows[self._ids[row]] = row
+        self._matrix[last] = 0
+        self._ids.pop()
+        self._payloads.pop()
+
+    def index_knowledge_base(self, knowledge_base: Dict[str, Any]):
+        """Đưa các section của knowledge base vào index (mỗi mục con là một document)"""
+        self.load_kb_vectors(*self.kb_vectors(knowledge_base))
+
+    def kb_vectors(self, knowledge_base: Dict[str, Any]) -> Tuple[List[str], List[Dict[str, Any]], np.ndarray]:
+        """(ids, payloads, ma trận vector) của các document KB, để lưu vào KB snapshot"""
+        ids, payloads, vectors = [], [], []
+        for doc_id, text, payload in self._iter_kb_documents(knowledge_base or {}):
+            ids.append(doc_id)
+            payloads.append(payload)
+            vectors.append(self._vectorize(text))
+        matrix = np.vstack(vectors) if vectors else np.zeros((0, self.dim), dtype=np.float32)
+        return ids, payloads, matrix
+
+    def load_kb_vectors(self, ids: List[str], payloads: List[Dict[str, Any]], matrix: np.ndarray):
+        # Nạp lại KB: bỏ các document KB không còn trong bản mới
+        current = set(ids)
+        for doc_id in [doc_id for doc_id in self._ids if doc_id.startswith("kb:") and doc_id not in current]:
+            self.remove(doc_id)
+        for doc_id, payload, vec in zip(ids, payloads, matrix):
+            self.upsert_vector(doc_id, vec, payload)
+        self._kb_indexed = True
+
+    def index_universities(self, universities: Iterable[Dict[str, Any]]):
+        """Cập nhật incremental các trường vừa được đồng bộ"""
+        count = 0
+        for uni in universities:
+            if uni.get("id") is None and uni.get("code") is None:
+                continue
+            doc_id = f"university:{uni.get('id', uni.get('code'))}"
+            text = self._flatten(uni, UNIVERSITY_TEXT_FIELDS)
+            self.upsert(doc_id, text, {
+                "source": "university",
+                "title": uni.get("name", ""),
+                "code": uni.get("code"),
+                "id": uni.get("id"),
+                "snippet": text[:300]
+            })
+            count += 1
+        if count:
+            logger.debug(f"Indexed {count} universities, index size={len(self)}")
+
+    def _iter_kb_documents(self, knowledge_base: Dict[str, Any]):
+        for category, section in knowledge_base.items():
+            if not isinstance(section, dict):
+                continue
+            header = " ".join([category.replace("_", " "), str(section.get("description", ""))])
+            for key, value in section.items():
+                if key in ("keywords", "description"):
+                    continue
+                if isinstance(value, dict) and value and all(isinstance(v, dict) for v in value.values()):
+                    # Ví dụ: school_info.sample_schools, major_advice.hot_majors_2024
+                    for child_key, child in value.items():
+                        title = child.get("name", child_key)
+                        text = f"{title} {self._flatten(child)}"
+                        yield f"kb:{category}:{key}:{child_key}", text, {
+                            "source": "kb", "category": category, "title": title, "snippet": text[:300]
+                        }
+                elif isinstance(value, list) and value and all(isinstance(v, dict) for v in value):
+                    # Ví dụ: common_questions.faqs, services
+                    for i, item in enumerate(value):
+                        title = item.get("question") or item.get("title") or f"{key} {i}"
+                        text = self._flatten(item)
+                        yield f"kb:{category}:{key}:{i}", text, {
+                            "source": "kb", "category": category, "title": title, "snippet": text[:300]
+                        }
+                else:
+                    text = f"{header} {key.replace('_', ' ')} {self._flatten(value)}"
+                    yield f"kb:{category}:{key}", text, {
+                        "source": "kb", "category": category, "title": key, "snippet": text[:300]
+                    }
+
+    def _flatten(self, value: Any, fields: Optional[List[str]] = None) -> str:
+        """Gộp mọi giá trị string/number trong object thành một đoạn text"""
+        if isinstance(value, dict):
+            keys = [f for f in fields if f in value] if fields else value.keys()
+            return " ".join(self._flatten(value[k]) for k in keys)
+        if isinstance(value, (list, tuple)):
+            return " ".join(self._flatten(v) for v in value)
+        if value is None or isinstance(value, bool):
+            return ""
+        return str(value)
+
+    # ---------- Query ----------
+
+    def search(self, query: str, k: int = None, min_score: float = None) -> List[Dict[str, Any]]:
+        """Top-k document theo cosine similarity (có trọng số idf phía query)"""
+        k = k or settings.retrieval_top_k
+        min_score = settings.retrieval_min_score if min_score is None else min_score
+        count = len(self._ids)
+        if not count or not query:
+            return []
+        query_vec = self._vectorize(query)
+        # Idf tính từ document frequency theo bucket, áp dụng cho query để giảm
+        # trọng số các n-gram phổ biến ("dai hoc", "truong", ...)
+        idf = np.log((1.0 + count) / (1.0 + self._df)) + 1.0
+        query_vec *= idf
+        norm = np.linalg.norm(query_vec)
+        if norm == 0:
+            return []
+        query_vec /= norm
+        scores = self._matrix[:count] @ query_vec
+        k = min(k, count)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        results = []
+        for row in top:
+            score = float(scores[row])
+            if score < min_score or math.isnan(score):
+                break
+            results.append({"id": self._ids[row], "score": round(score, 4), **self._payloads[row]})
+        return results
+
+
+# Singleton instance
+retrieval_service = RetrievalService()
+university_service.add_sync_listener(retrieval_service.index_universities)
@@ -0,0 +1,162 @@
+import datetime
+import logging
+import time
+from typing import Any, Dict, Optional
+
+from app.core.config import settings
+from app.core.mongo import LazyCollection
+from app.schemas.ranking import StudentRankingResponse
+from app.utils.cache import LRUCache
+
+logger = logging.getLogger("session_memory_service")
+
+
+def _empty(session_id: str) -> Dict[str, Any]:
+    return {
+        "session_id": session_id,
+        "name": None,
+        "candidate_number": None,
+        "region": None,
+        # Snapshot ranking đã tra: {"candidate_number", "region", "data": StudentRankingResponse.model_dump()}
+        "ranking": None,
+        # Các trường đã nhắc tới, gần nhất ở cuối: [{"id", "name"}]
+        "schools": []
+    }
+
+
+class SessionMemoryService:
+    """
+    Bộ nhớ có cấu trúc theo session: các entity đã giải quyết (tên, SBD kèm snapshot ranking,
+    khu vực, các trường đã chọn) để câu hỏi nối tiếp ("thế còn khối D01?") dùng lại mà không
+    trích xuất hay gọi API ranking lại, và để gửi cho LLM dạng sự kiện thay vì lịch sử thô.
+
+    Hai tầng: LRU in-process trước collection Mongo `session_memory` (chỉ với CHAT_BACKEND=mongo).
+    Bộ nhớ hết hạn sau SESSION_MEMORY_TTL giây kể từ lần ghi cuối (TTL index trên expires_at);
+    entry trong LRU được đọc lại từ Mongo sau SESSION_MEMORY_CACHE_TTL giây để thấy cập nhật
+    từ worker khác.
+    """
+
+    collection = LazyCollection("session_memory")
+
+    def __init__(self):
+        self._cache = LRUCache(settings.session_memory_cache_size)
+        self._stats = {"loads": 0, "saves": 0, "reused_rankings": 0, "reused_schools": 0}
+
+    @property
+    def persistent(self) -> bool:
+        return settings.chat_backend.lower() == "mongo"
+
+    # ---------- Đọc / ghi ----------
+
+    async def get(self, session_id: str) -> Dict[str, Any]:
+        """Bộ nhớ hiện tại của session (rỗng nếu chưa có hoặc đã hết hạn)"""
+        now = time.time()
+        entry = self._cache.get(session_id)
+        if entry is not None and entry["expires_at"] > now and (
+            not self.persistent or now - entry["loaded_at"] < settings.session_memory_cache_ttl
+        ):
+            return entry["memory"]
+        memory = _empty(session_id)
+        expires_at = now + settings.session_memory_ttl
+        if self.persistent:
+            self._stats["loads"] += 1
+            try:
+                doc = await self.collection.find_one({"_id": session_id})
+            except Exception as e:
+                logger.warning(f"Loading session memory failed: {e}")
+                doc = None
+            if doc:
+                stored_expiry = doc["expires_at"].replace(tzinfo=datetime.timezone.utc).timestamp()
+                # TTL monitor của Mongo chạy mỗi ~60s: bỏ qua bản ghi đã quá hạn nhưng chưa bị xoá
+                if stored_expiry > now:
+                    memory.update({key: doc.get(key, memory[key]) for key in memory if key != "session_id"})
+                    expires_at = stored_expiry
+        self._cache.set(session_id, {"memory": memory, "expires_at": expires_at, "loaded_at": now})
+        return memory
+
+    async def update(self, session_id: str, **fields) -> Dict[str, Any]:
+        """Gộp các entity mới vào bộ nhớ, gia hạn TTL và ghi xuống Mongo"""
+        memory = await self.get(session_id)
+        memory.update(fields)
+        now = time.time()
+        expires_at = now + settings.session_memory_ttl
+        self._cache.set(session_id, {"memory": memory, "expires_at": expires_at, "loaded_at": now})
+        if self.persistent:
+            self._stats["saves"] += 1
+            try:
+                await self.collection.update_one(
+                    {"_id": session_id},
+                    {"$set": {
+                        **fields,
+                        "updated_at": datetime.datetime.fromtimestamp(now, datetime.timezone.utc),
+                        "expires_at": datetime.datetime.fromtimestamp(expires_at, datetime.timezone.utc)
+                    }},
+                    upsert=True
+                )
+            except Exception as e:
+                logger.warning(f"Saving session memory failed: {e}")
+        return memory
+
+    async def remember_ranking(self, session_id: str, student: StudentRankingResponse, region: str) -> Dict[str, Any]:
+        return await self.update(
+            session_id,
+            candidate_number=student.candidate_number,
+            region=region,
+            ranking={"candidate_number": student.candidate_number, "region": region, "data": student.model_dump(exclude_none=True)}
+        )
+
+    async def remember_school(self, session_id: str, school_doc: Dict[str, Any]) -> Dict[str, Any]:
+        memory = await self.get(session_id)
+        schools = [school for school in memory["schools"] if school["id"] != school_doc.get("id")]
+        schools.append({"id": school_doc.get("id"), "name": school_doc.get("name")})
+        if schools == memory["schools"]:
+            return memory
+        return await self.update(session_id, schools=schools[-settings.session_memory_max_schools:])
+
+    # ---------- Dùng lại ----------
+
+    def cached_ranking(self, memory: Dict[str, Any], candidate_number: str, region: str) -> Optional[StudentRankingResponse]:
+        """Snapshot ranking đã tra cho đúng SBD + khu vực, nếu có"""
+        ranking = memory.get("ranking")
+        if not ranking or ranking["candidate_number"] != candidate_number or ranking["region"] != region:
+            return None
+        self._stats["reused_rankings"] += 1
+        return StudentRankingResponse.model_validate(ranking["data"])
+
+    def last_school(self, memory: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """{id, name} của trường được nhắc gần nhất (doc hiện tại được tra lại theo id)"""
+        if not memory.get("schools"):
+            return None
+        self._stats["reused_schools"] += 1
+        return memory["schools"][-1]
+
+    def facts(self, memory: Dict[str, Any]) -> Optional[str]:
+        """Các entity đã biết dạng system message cho LLM (None nếu chưa có gì)"""
+        lines = []
+        if memory.get("name"):
+            lines.append(f"- Tên người dùng: {memory['name']}")
+        if memory.get("candidate_number"):
+            lines.append(f"- Số báo danh: {memory['candidate_number']} (khu vực {memory.get('region') or 'CN'})")
+        ranking = (memory.get("ranking") or {}).get("data")
+        if ranking:
+            scores = ", ".join(f"{mark['name']}: {mark['score']}" for mark in ranking.get("mark_info", []))
+            if scores:
+                lines.append(f"- Điểm thi {ranking.get('data_year', '')}: {scores}")
+            for block in ranking.get("blocks", []):
+                ranking_data = block.get("ranking") or {}
+                rank = ""
+                if ranking_data.get("total"):
+                    rank = f", xếp hạng {ranking_data.get('higher', 0)}/{ranking_data['total']}"
+                lines.append(f"- Khối {block.get('label')} ({block.get('region')}): {block.get('point')} điểm{rank}")
+        if memory.get("schools"):
+            lines.append(f"- Trường đang quan tâm: {', '.join(school['name'] for school in memory['schools'] if school.get('name'))}")
+        if not lines:
+            return None
+        return "=== THÔNG TIN ĐÃ BIẾT VỀ NGƯỜI DÙNG (từ các tin nhắn trước) ===\n" + "\n".join(lines)
+
+    def metrics(self) -> Dict[str, Any]:
+        return {**self._stats, "cache": self._cache.metrics()}
+
+
+# Singleton instance
+session_memory_service = SessionMemoryService()
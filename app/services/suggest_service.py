@@ -0,0 +1,196 @@
+import hashlib
+import logging
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Tuple, Union
+
+from app.services.university_service import search_tokens, university_service
+from app.services.gazetteer_service import SCHOOL_NAME_PREFIXES
+
+logger = logging.getLogger("suggest_service")
+
+# Số gợi ý tính sẵn ở mỗi node của trie
+SUGGEST_TOP_K = 10
+# Chỉ index tối đa chừng này ký tự đầu của mỗi khóa (hậu tố theo từ: ngắn hơn)
+MAX_KEY_LENGTH = 40
+MAX_WORD_KEY_LENGTH = 24
+# Trọng số theo loại khóa khớp; khớp trọn khóa được cộng thêm COMPLETE_BONUS
+KEY_WEIGHTS = {"code": 4, "alias": 4, "name": 3, "short_name": 3, "word": 1}
+COMPLETE_BONUS = 2
+
+
+class _Node:
+    __slots__ = ("children", "top")
+
+    def __init__(self):
+        self.children: Dict[str, "_Node"] = {}
+        # Top-k (id, code, name) đã xếp hạng cho mọi khóa đi qua node này
+        self.top: Union[List[Dict[str, Any]], Dict[Any, int]] = []
+
+
+class SuggestService:
+    """
+    Gợi ý tên trường khi gõ (typeahead) bằng prefix trie in-memory, không dấu.
+
+    Khóa được index: code, alias, tên đầy đủ, tên bỏ tiền tố ("Đại học", "Học viện", ...)
+    và mọi hậu tố bắt đầu từ một từ của tên (để "khoa ha" tìm ra "Bách khoa Hà Nội").
+    Mỗi node giữ sẵn top-k nên một truy vấn chỉ là đi theo các ký tự của prefix.
+    Khi danh sách trường thay đổi, trie mới được dựng trong một thread nền rồi thay thế
+    nguyên khối (snapshot); truy vấn trong lúc dựng vẫn đọc trie cũ.
+    """
+
+    def __init__(self):
+        self._entries: Dict[Any, Dict[str, Any]] = {}
+        self._root = _Node()
+        self._lock = threading.Lock()
+        self._pending = False
+        self._building = False
+        self.etag = '"empty"'
+        self.built_at = None
+
+    @property
+    def ready(self) -> bool:
+        return self.built_at is not None
+
+    def update_universities(self, universities: Iterable[Dict[str, Any]]):
+        """Sync listener: cập nhật các trường thay đổi rồi dựng lại trie ở thread nền"""
+        with self._lock:
+            changed = 0
+            for uni in universities:
+                key = uni.get("id", uni.get("code"))
+                if key is None or not uni.get("name"):
+                    continue
+                self._entries[key] = {
+                    "id": uni.get("id"),
+                    "code": uni.get("code"),
+                    "name": uni["name"],
+                    "alias": uni.get("alias")
+                }
+                changed += 1
+            if not changed:
+                return
+            # Gộp các thay đổi tới trong lúc đang dựng vào một lần dựng tiếp theo
+            self._pending = True
+            if self._building:
+                return
+            self._building = True
+        threading.Thread(target=self._rebuild_loop, name="suggest-rebuild", daemon=True).start()
+
+    def join(self, timeout: float = 30.0) -> bool:
+        """Chờ thread dựng trie (nếu có) xong; dùng trước khi fork worker ở chế độ preload"""
+        deadline = time.monotonic() + timeout
+        while self._building:
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(0.01)
+        return True
+
+    def _rebuild_loop(self):
+        while True:
+            with self._lock:
+                if not self._pending:
+                    self._building = False
+                    return
+                self._pending = False
+                entries = dict(self._entries)
+            try:
+                self._rebuild(entries)
+            except Exception as e:
+                logger.error(f"Suggest trie rebuild failed: {e}")
+
+    def _keys(self, entry: Dict[str, Any]) -> Iterable[Tuple[str, str]]:
+        words = search_tokens(entry["name"])
+        if entry.get("code"):
+            yield "code", " ".join(search_tokens(entry["code"]))
+        if entry.get("alias"):
+            yield "alias", " ".join(search_tokens(entry["alias"]))
+        yield "name", " ".join(words)
+        short = " ".join(words)
+        stripped = True
+        while stripped:
+            stripped = False
+            for prefix in SCHOOL_NAME_PREFIXES:
+                if short.startswith(prefix + " "):
+                    short = short[len(prefix) + 1:]
+                    stripped = True
+        yield "short_name", short
+        for i in range(1, len(words)):
+            yield "word", " ".join(words[i:])[:MAX_WORD_KEY_LENGTH]
+
+    def _rebuild(self, entries: Dict[Any, Dict[str, Any]]):
+        start = time.perf_counter()
+        root = _Node()
+        # Lúc dựng, node.top tạm là dict {entry key: điểm} của các khóa kết thúc tại node
+        for entry_key, entry in entries.items():
+            for kind, key in self._keys(entry):
+                if not key:
+                    continue
+                node = root
+                for char in key[:MAX_KEY_LENGTH]:
+                    child = node.children.get(char)
+                    if child is None:
+                        child = node.children[char] = _Node()
+                        child.top = {}
+                    node = child
+                score = KEY_WEIGHTS[kind] + COMPLETE_BONUS
+                if node.top.get(entry_key, 0) < score:
+                    node.top[entry_key] = score
+        order = {entry_key: (len(entry["name"]), entry["name"]) for entry_key, entry in entries.items()}
+        public = {entry_key: self._public(entry) for entry_key, entry in entries.items()}
+        for child in root.children.values():
+            self._finalize(child, order, public)
+        digest = hashlib.sha1()
+        for entry_key in sorted(entries, key=str):
+            entry = entries[entry_key]
+            digest.update(f"{entry['id']}|{entry['code']}|{entry['name']}|{entry['alias']}\n".encode("utf-8"))
+        self._root = root
+        self.etag = f'"{digest.hexdigest()[:16]}"'
+        self.built_at = time.time()
+        logger.info(f"Built suggest trie for {len(entries)} universities in {(time.perf_counter() - start) * 1000:.1f}ms")
+
+    def _finalize(self, node: _Node, order, public) -> Tuple[List[Tuple[int, Any]], List[Dict[str, Any]]]:
+        """
+        Gán top-k cho node từ các khóa kết thúc tại node và top-k của các node con.
+        Trả về top-k "đi qua" node (không cộng COMPLETE_BONUS) cho node cha. Độ sâu trie
+        bị chặn bởi MAX_KEY_LENGTH nên đệ quy là an toàn.
+        """
+        terminal = node.top
+        children = [self._finalize(child, order, public) for child in node.children.values()]
+        if not terminal and len(children) == 1:
+            # Chuỗi node một nhánh: dùng chung kết quả của node con
+            node.top = children[0][1]
+            return children[0]
+        passing: Dict[Any, int] = {}
+        for pairs, _ in children:
+            for score, entry_key in pairs:
+                if passing.get(entry_key, 0) < score:
+                    passing[entry_key] = score
+        here = dict(passing)
+        for entry_key, score in terminal.items():
+            if here.get(entry_key, 0) < score:
+                here[entry_key] = score
+            if passing.get(entry_key, 0) < score - COMPLETE_BONUS:
+                passing[entry_key] = score - COMPLETE_BONUS
+        node.top = [public[k] for k in sorted(here, key=lambda k: (-here[k], order[k]))[:SUGGEST_TOP_K]]
+        ranked = sorted(passing, key=lambda k: (-passing[k], order[k]))[:SUGGEST_TOP_K]
+        pairs = [(passing[k], k) for k in ranked]
+        return pairs, [public[k] for k in ranked]
+
+    def _public(self, entry: Dict[str, Any]) -> Dict[str, Any]:
+        return {"id": entry["id"], "code": entry["code"], "name": entry["name"]}
+
+    def suggest(self, query: str, limit: int = 8) -> List[Dict[str, Any]]:
+        prefix = " ".join(search_tokens(query))[:MAX_KEY_LENGTH]
+        if not prefix:
+            return []
+        node = self._root
+        for char in prefix:
+            node = node.children.get(char)
+            if node is None:
+                return []
+        return node.top[:limit]
+
+
+# Singleton instance
+suggest_service = SuggestService()
+university_service.add_sync_listener(suggest_service.update_universities)
@@ -1,28 +1,250 @@
-import aiohttp
-from app.core.mongo import mongo_db
-import unicodedata
+import datetime
+import hashlib
+import json
+import logging
+import re
+import time
+from bson import ObjectId
+from pymongo import ASCENDING, ReturnDocument, UpdateOne
+from app.core.config import settings
+from app.core.http_client import http_client
+from app.core.mongo import LazyCollection
+from app.utils.text import normalize_text
+
+logger = logging.getLogger("university_service")
+
+# Trường tìm kiếm chuẩn hóa (không dấu, lower) được ghi cùng bản ghi
+SEARCH_FIELDS = ("name_normalized", "alias_normalized", "search_tokens")
+# Trường do hệ thống sinh ra, không tính vào hash nội dung
+DERIVED_FIELDS = ("_id", "_hash", "_seq", "_synced_at") + SEARCH_FIELDS
+SYNC_BATCH_SIZE = 1000
+# Số ứng viên tối đa lấy từ index trước khi xếp hạng
+SEARCH_CANDIDATE_LIMIT = 500
+SEARCH_PROJECTION = {field: 0 for field in SEARCH_FIELDS}
+# Trường nội bộ không trả ra API danh sách
+PUBLIC_PROJECTION = {field: 0 for field in SEARCH_FIELDS + ("_hash", "_seq", "_synced_at")}
+CATALOG_META_ID = "universities"
+
+
+def search_tokens(text: str):
+    return re.findall(r"[a-z0-9]+", normalize_text(text or ""))
+
+
+def build_search_fields(uni: dict) -> dict:
+    """name/alias chuẩn hóa và tập token (name, alias, code) cho index multikey search_tokens"""
+    tokens = set(search_tokens(uni.get("name"))) | set(search_tokens(uni.get("alias"))) | set(search_tokens(uni.get("code")))
+    return {
+        "name_normalized": normalize_text(uni.get("name") or ""),
+        "alias_normalized": normalize_text(uni.get("alias") or ""),
+        "search_tokens": sorted(tokens)
+    }
 
 class UniversityService:
+    collection = LazyCollection("universities")
+    # Version của danh mục trường (tăng mỗi khi có ghi), dùng làm ETag
+    meta_collection = LazyCollection("catalog_meta")
+
     def __init__(self):
-        self.collection = mongo_db["universities"]
         self.api_url = "https://diemthi.tuyensinh247.com/api/school/search?q="
+        # Các index in-memory (retrieval, ...) đăng ký để được cập nhật khi dữ liệu trường thay đổi
+        self._sync_listeners = []
+        # Mọi _seq <= watermark đã được nạp (hoặc đã quá hạn chờ) vào index của process này
+        self._watermark = 0
+        # _seq > watermark đã nạp, và _seq còn thiếu -> thời điểm (monotonic) phát hiện
+        self._applied = set()
+        self._gaps = {}
+
+    def add_sync_listener(self, listener):
+        """Đăng ký callback(universities) được gọi với các trường vừa được thêm/thay đổi"""
+        self._sync_listeners.append(listener)
+
+    def _notify_sync_listeners(self, universities):
+        for listener in self._sync_listeners:
+            try:
+                listener(universities)
+            except Exception as e:
+                logger.error(f"University sync listener error: {e}")
+
+    async def warm_up(self):
+        """Nạp toàn bộ trường từ DB vào các index in-memory đã đăng ký"""
+        await self.backfill_search_fields()
+        # Đọc bộ đếm trước khi nạp: lần ghi đang dở có _seq <= allocated được kéo lại sau
+        allocated = await self._allocated_seq()
+        universities = await self.get_all_universities_from_db()
+        self._watermark = max(allocated - settings.university_sync_inflight_window, 0)
+        self._applied, self._gaps = set(), {}
+        self._mark_applied(universities)
+        self._advance_watermark(allocated)
+        self._notify_sync_listeners(universities)
+        return len(universities)
+
+    async def backfill_search_fields(self):
+        """Bổ sung trường tìm kiếm cho bản ghi cũ (ghi trước khi có search_tokens)"""
+        operations = []
+        async for doc in self.collection.find({"search_tokens": {"$exists": False}}, {"name": 1, "alias": 1, "code": 1}):
+            operations.append(UpdateOne({"_id": doc["_id"]}, {"$set": build_search_fields(doc)}))
+        for i in range(0, len(operations), SYNC_BATCH_SIZE):
+            await self.collection.bulk_write(operations[i:i + SYNC_BATCH_SIZE], ordered=False)
+        if operations:
+            logger.info(f"Backfilled search fields for {len(operations)} universities")
+        return len(operations)
+
+    # ---------- Sequence thay đổi ----------
+
+    async def _allocate_seq(self, count: int) -> int:
+        """
+        Cấp `count` số thứ tự liên tiếp từ bộ đếm trên server (catalog_meta, $inc nguyên tử);
+        trả về số đầu tiên. Mỗi lần ghi gắn _seq mới nên follower kéo theo _seq > watermark,
+        không phụ thuộc đồng hồ của process ghi.
+        """
+        meta = await self.meta_collection.find_one_and_update(
+            {"_id": CATALOG_META_ID},
+            {"$inc": {"seq": count}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        return meta["seq"] - count + 1
+
+    async def _allocated_seq(self) -> int:
+        meta = await self.meta_collection.find_one({"_id": CATALOG_META_ID}, {"seq": 1})
+        return (meta or {}).get("seq", 0)
+
+    def _mark_applied(self, docs):
+        for doc in docs:
+            seq = doc.get("_seq")
+            if seq is not None and seq > self._watermark:
+                self._applied.add(seq)
+
+    def _advance_watermark(self, allocated: int):
+        """
+        Đẩy watermark qua các _seq liên tiếp đã nạp. _seq được cấp trước khi ghi nên có thể
+        commit sau một _seq lớn hơn: số còn thiếu được chờ UNIVERSITY_SYNC_GAP_GRACE giây
+        (ghi đang dở) rồi mới bỏ qua (ghi lỗi, hoặc bản ghi đã được ghi lại với _seq mới).
+        """
+        now = time.monotonic()
+        for seq in range(self._watermark + 1, allocated + 1):
+            if seq in self._applied:
+                self._gaps.pop(seq, None)
+            else:
+                self._gaps.setdefault(seq, now)
+        watermark = self._watermark
+        while watermark < allocated:
+            missing_since = self._gaps.get(watermark + 1)
+            if missing_since is not None and now - missing_since < settings.university_sync_gap_grace:
+                break
+            watermark += 1
+        self._watermark = watermark
+        self._applied = {seq for seq in self._applied if seq > watermark}
+        self._gaps = {seq: since for seq, since in self._gaps.items() if seq > watermark}
+
+    async def pull_changes(self):
+        """Nạp các trường được process khác ghi sau watermark (_seq) vào index in-memory"""
+        # Đọc bộ đếm trước truy vấn: mọi _seq <= allocated đã được cấp
+        allocated = await self._allocated_seq()
+        changed = []
+        cursor = self.collection.find({"_seq": {"$gt": self._watermark}}, SEARCH_PROJECTION).sort("_seq", ASCENDING)
+        async for doc in cursor:
+            # Bản ghi phía trên một khoảng trống được đọc lại tới khi watermark vượt qua
+            if doc["_seq"] in self._applied:
+                continue
+            doc["_id"] = str(doc["_id"])
+            changed.append(doc)
+        self._mark_applied(changed)
+        self._advance_watermark(max(allocated, max((doc["_seq"] for doc in changed), default=0)))
+        if changed:
+            self._notify_sync_listeners(changed)
+        return len(changed)
+
+    def sync_state(self) -> dict:
+        return {"watermark": self._watermark, "pending": len(self._applied), "gaps": len(self._gaps)}
 
     async def fetch_all_universities_from_api(self):
-        async with aiohttp.ClientSession() as session:
-            async with session.get(self.api_url) as resp:
-                data = await resp.json()
-                return data.get("data", [])
+        session = await http_client.get_session()
+        async with session.get(self.api_url) as resp:
+            data = await resp.json()
+            return data.get("data", [])
 
-    async def save_all_universities_to_db(self, universities):
-        for uni in universities:
-            await self.collection.update_one(
-                {"id": uni["id"]},
-                {"$set": uni},
-                upsert=True
+    async def fetch_universities_if_changed(self, etag: str = None, last_modified: str = None):
+        """
+        Conditional GET (If-None-Match / If-Modified-Since) tới API nguồn.
+        Trả về (universities hoặc None nếu 304, etag, last_modified).
+        """
+        headers = {}
+        if etag:
+            headers["If-None-Match"] = etag
+        if last_modified:
+            headers["If-Modified-Since"] = last_modified
+        session = await http_client.get_session()
+        async with session.get(self.api_url, headers=headers) as resp:
+            if resp.status == 304:
+                return None, etag, last_modified
+            resp.raise_for_status()
+            data = await resp.json()
+            return (
+                data.get("data", []),
+                resp.headers.get("ETag"),
+                resp.headers.get("Last-Modified")
             )
 
+    def _content_hash(self, uni: dict) -> str:
+        content = {k: v for k, v in uni.items() if k not in DERIVED_FIELDS}
+        payload = json.dumps(content, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+    async def save_all_universities_to_db(self, universities, before_batch=None):
+        """
+        Đồng bộ theo diff: so hash nội dung với hash đã lưu, chỉ ghi các trường mới/thay đổi
+        bằng bulk_write không thứ tự (mỗi lô SYNC_BATCH_SIZE bản ghi, một dải _seq mỗi lô).
+        `before_batch` (async, tùy chọn) được gọi trước mỗi lô, vd. để gia hạn lease.
+        Trả về changeset {inserted, updated, unchanged, total}.
+        """
+        stored = {}
+        async for doc in self.collection.find({}, {"_id": 0, "id": 1, "_hash": 1}):
+            stored[doc.get("id")] = doc.get("_hash")
+
+        incoming = {}
+        for uni in universities:
+            if uni.get("id") is not None:
+                incoming[uni["id"]] = uni
+
+        inserted, updated, changed_docs = [], [], []
+        for uni_id, uni in incoming.items():
+            content_hash = self._content_hash(uni)
+            if uni_id in stored and stored[uni_id] == content_hash:
+                continue
+            (updated if uni_id in stored else inserted).append(uni_id)
+            changed_docs.append({
+                **{k: v for k, v in uni.items() if k not in DERIVED_FIELDS},
+                "_hash": content_hash
+            })
+
+        for i in range(0, len(changed_docs), SYNC_BATCH_SIZE):
+            if before_batch is not None:
+                await before_batch()
+            batch = changed_docs[i:i + SYNC_BATCH_SIZE]
+            first_seq = await self._allocate_seq(len(batch))
+            for offset, doc in enumerate(batch):
+                doc["_seq"] = first_seq + offset
+            await self.collection.bulk_write([
+                UpdateOne({"id": doc["id"]}, {"$set": {**doc, **build_search_fields(doc)}}, upsert=True)
+                for doc in batch
+            ], ordered=False)
+
+        changeset = {
+            "inserted": inserted,
+            "updated": updated,
+            "unchanged": len(incoming) - len(changed_docs),
+            "total": len(incoming)
+        }
+        logger.info(f"University sync: {len(inserted)} inserted, {len(updated)} updated, {changeset['unchanged']} unchanged")
+        if changed_docs:
+            await self._bump_catalog_version()
+            self._mark_applied(changed_docs)
+            self._notify_sync_listeners(changed_docs)
+        return changeset
+
     async def get_all_universities_from_db(self):
-        cursor = self.collection.find({})
+        cursor = self.collection.find({}, SEARCH_PROJECTION)
         result = []
         async for doc in cursor:
             if "_id" in doc:
@@ -30,39 +252,118 @@ class UniversityService:
             result.append(doc)
         return result
 
-    def remove_accents(self, input_str: str) -> str:
-        nfkd_form = unicodedata.normalize('NFKD', input_str)
-        return ''.join([c for c in nfkd_form if not unicodedata.combining(c)])
+    async def get_university_by_id(self, uni_id):
+        """Một trường theo id (index unique trên id)"""
+        doc = await self.collection.find_one({"id": uni_id}, SEARCH_PROJECTION)
+        if doc and "_id" in doc:
+            doc["_id"] = str(doc["_id"])
+        return doc
+
+    async def get_catalog_version(self) -> int:
+        meta = await self.meta_collection.find_one({"_id": CATALOG_META_ID})
+        return meta.get("version", 0) if meta else 0
 
-    async def search_universities(self, code: str = None, name: str = None):
+    async def _bump_catalog_version(self):
+        await self.meta_collection.update_one(
+            {"_id": CATALOG_META_ID},
+            {"$inc": {"version": 1}, "$set": {"updated_at": datetime.datetime.now(datetime.timezone.utc)}},
+            upsert=True
+        )
+
+    def _public_projection(self, fields: list = None) -> dict:
+        if not fields:
+            return PUBLIC_PROJECTION
+        projection = {field: 1 for field in fields if field not in PUBLIC_PROJECTION}
+        projection["id"] = 1
+        return projection
+
+    async def list_universities_page(self, limit: int, after: str = None, fields: list = None):
+        """
+        Một trang danh sách trường theo keyset trên _id (không dùng skip).
+        Trả về (docs, next_cursor); next_cursor = None khi đã hết.
+        """
+        query = {"_id": {"$gt": ObjectId(after)}} if after else {}
+        cursor = self.collection.find(query, self._public_projection(fields)).sort("_id", ASCENDING).limit(limit + 1)
+        docs = []
+        async for doc in cursor:
+            doc["_id"] = str(doc["_id"])
+            docs.append(doc)
+        next_cursor = None
+        if len(docs) > limit:
+            docs = docs[:limit]
+            next_cursor = docs[-1]["_id"]
+        return docs, next_cursor
+
+    async def iter_universities(self, fields: list = None, batch_size: int = 500):
+        """Duyệt toàn bộ danh mục theo lô (cho stream), không giữ cả collection trong bộ nhớ"""
+        cursor = self.collection.find({}, self._public_projection(fields)).sort("_id", ASCENDING).batch_size(batch_size)
+        async for doc in cursor:
+            doc["_id"] = str(doc["_id"])
+            yield doc
+
+    async def search_universities(self, code: str = None, name: str = None, limit: int = None):
+        """
+        Tìm theo code (exact) và/hoặc name (không dấu, không phân biệt hoa thường).
+        Mọi token của `name` phải có trong search_tokens, token cuối khớp theo tiền tố;
+        cả hai đều dùng index multikey. Kết quả được xếp theo độ liên quan.
+        """
         query = {}
         if code:
             query["code"] = code.upper()
-        if name:
-            # Tìm kiếm không dấu, không phân biệt hoa thường
-            regex = self.remove_accents(name)
-            query["$or"] = [
-                {"name": {"$regex": name, "$options": "i"}},
-                {"name": {"$regex": regex, "$options": "i"}}
-            ]
-        cursor = self.collection.find(query)
+        tokens = search_tokens(name) if name else []
+        if name and not tokens:
+            return []
+        if tokens:
+            *complete, last = tokens
+            clauses = [{"search_tokens": token} for token in complete]
+            clauses.append({"search_tokens": {"$regex": f"^{re.escape(last)}"}})
+            query["$and"] = clauses
+        cursor = self.collection.find(query, SEARCH_PROJECTION)
+        if tokens:
+            cursor = cursor.limit(SEARCH_CANDIDATE_LIMIT)
         result = []
         async for doc in cursor:
             if "_id" in doc:
                 doc["_id"] = str(doc["_id"])
             result.append(doc)
-        return result
+        if tokens:
+            phrase = " ".join(tokens)
+            result.sort(key=lambda doc: (-self._relevance(doc, phrase), len(doc.get("name") or "")))
+        return result[:limit] if limit else result
+
+    def _relevance(self, doc: dict, phrase: str) -> int:
+        """3: trùng code/alias/tên; 2: tên/alias bắt đầu bằng cụm từ; 1: chứa nguyên cụm; 0: chỉ khớp token"""
+        name = " ".join(search_tokens(doc.get("name")))
+        alias = " ".join(search_tokens(doc.get("alias")))
+        if phrase in (name, alias, (doc.get("code") or "").lower()):
+            return 3
+        if name.startswith(phrase) or alias.startswith(phrase):
+            return 2
+        if f" {phrase}" in f" {name}" or f" {phrase}" in f" {alias}":
+            return 1
+        return 0
 
     async def create_university(self, uni_data: dict):
-        result = await self.collection.insert_one(uni_data)
+        uni_data["_seq"] = await self._allocate_seq(1)
+        result = await self.collection.insert_one({**uni_data, **build_search_fields(uni_data)})
         uni_data["_id"] = str(result.inserted_id)
+        await self._bump_catalog_version()
+        self._mark_applied([uni_data])
+        self._notify_sync_listeners([uni_data])
         return uni_data
 
     async def update_university(self, uni_id: int, update_data: dict):
-        await self.collection.update_one({"id": uni_id}, {"$set": update_data})
-        doc = await self.collection.find_one({"id": uni_id})
+        current = await self.collection.find_one({"id": uni_id}, {"name": 1, "alias": 1, "code": 1}) or {}
+        search_fields = build_search_fields({**current, **update_data})
+        seq = await self._allocate_seq(1)
+        await self.collection.update_one({"id": uni_id}, {"$set": {**update_data, **search_fields, "_seq": seq}})
+        await self._bump_catalog_version()
+        doc = await self.collection.find_one({"id": uni_id}, SEARCH_PROJECTION)
         if doc and "_id" in doc:
             doc["_id"] = str(doc["_id"])
+        if doc:
+            self._mark_applied([doc])
+            self._notify_sync_listeners([doc])
         return doc
 
 university_service = UniversityService() 
\ No newline at end of file
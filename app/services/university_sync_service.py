@@ -0,0 +1,216 @@
+import asyncio
+import logging
+import os
+import random
+import socket
+import time
+import uuid
+from typing import Any, Dict, Optional
+
+from app.core.config import settings
+from app.repositories.lease_repository import LeaseLostError, lease_repository
+from app.services.university_service import university_service
+
+logger = logging.getLogger("university_sync_service")
+
+LEASE_NAME = "university_sync"
+
+
+class UniversitySyncScheduler:
+    """
+    Job nền đồng bộ danh sách trường (kèm điểm chuẩn) từ API nguồn.
+
+    Mỗi worker chạy một vòng lặp; chỉ worker giữ lease `university_sync` trên Mongo
+    mới gọi API nguồn (conditional GET) và ghi thay đổi; lease được gia hạn trước mỗi lô ghi.
+    Mọi worker, kể cả leader, sau đó kéo các bản ghi mới ghi (`_seq` sau watermark) vào
+    index in-memory của mình.
+    """
+
+    def __init__(self):
+        self._set_owner()
+        self.is_leader = False
+        self.running = False
+        self.last_run_at: Optional[float] = None
+        self.last_success_at: Optional[float] = None
+        self.last_duration: Optional[float] = None
+        self.last_result: Optional[Dict[str, Any]] = None
+        self.last_error: Optional[str] = None
+        self.next_sync_at: Optional[float] = None
+        self._etag: Optional[str] = None
+        self._last_modified: Optional[str] = None
+        self._task: Optional[asyncio.Task] = None
+        self._lock = asyncio.Lock()
+        self._stats = {
+            "runs": 0,
+            "failures": 0,
+            "not_modified": 0,
+            "inserted": 0,
+            "updated": 0,
+            "pulled": 0,
+            "leader_ticks": 0,
+            "follower_ticks": 0
+        }
+
+    def _jittered(self, seconds: float) -> float:
+        jitter = settings.university_sync_jitter
+        return max(seconds * (1 + random.uniform(-jitter, jitter)), 0.0)
+
+    def _set_owner(self):
+        self._owner_pid = os.getpid()
+        self.owner = f"{socket.gethostname()}:{self._owner_pid}:{uuid.uuid4().hex[:6]}"
+
+    # ---------- Lifecycle ----------
+
+    def start(self):
+        if settings.university_sync_interval <= 0 or self._task is not None:
+            return
+        # Worker fork từ master (chế độ preload) cần owner riêng, không dùng lại owner của master
+        if self._owner_pid != os.getpid():
+            self._set_owner()
+        self._task = asyncio.create_task(self._loop())
+        logger.info(f"University sync scheduler started ({self.owner})")
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        if self.is_leader:
+            try:
+                await lease_repository.release(LEASE_NAME, self.owner)
+            except Exception as e:
+                logger.warning(f"Releasing sync lease failed: {e}")
+            self.is_leader = False
+
+    async def _loop(self):
+        while True:
+            await asyncio.sleep(self._jittered(settings.university_sync_poll_interval))
+            try:
+                await self._tick()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"University sync tick failed: {e}")
+
+    async def _tick(self):
+        lease = await lease_repository.acquire(LEASE_NAME, self.owner, settings.university_sync_lease_ttl)
+        self.is_leader = lease is not None
+        if self.is_leader:
+            self._stats["leader_ticks"] += 1
+            # Trạng thái lịch chạy nằm trên lease để leader mới không gọi lại API ngay
+            self.next_sync_at = lease.get("next_sync_at")
+            self._etag = lease.get("etag", self._etag)
+            self._last_modified = lease.get("last_modified", self._last_modified)
+            if self.next_sync_at is None or self.next_sync_at <= time.time():
+                await self.run_once()
+        else:
+            self._stats["follower_ticks"] += 1
+        pulled = await university_service.pull_changes()
+        self._stats["pulled"] += pulled
+
+    # ---------- Sync ----------
+
+    async def run_once(self, conditional: bool = True) -> Dict[str, Any]:
+        """
+        Một lượt đồng bộ; `conditional=False` bỏ qua ETag để tải lại toàn bộ. Chỉ ghi khi
+        worker này giữ lease (xem run_as_leader)
+        """
+        async with self._lock:
+            self.running = True
+            self.last_run_at = time.time()
+            self._stats["runs"] += 1
+            start = time.perf_counter()
+            try:
+                universities, etag, last_modified = await university_service.fetch_universities_if_changed(
+                    self._etag if conditional else None,
+                    self._last_modified if conditional else None
+                )
+                if universities is None:
+                    self._stats["not_modified"] += 1
+                    result = {"not_modified": True}
+                else:
+                    changeset = await university_service.save_all_universities_to_db(
+                        universities, before_batch=self._renew_lease
+                    )
+                    self._stats["inserted"] += len(changeset["inserted"])
+                    self._stats["updated"] += len(changeset["updated"])
+                    self._etag, self._last_modified = etag, last_modified
+                    result = {"not_modified": False, "count": len(universities), "changes": changeset}
+                self.last_success_at = time.time()
+                self.last_error = None
+                self.last_result = result
+                return result
+            except Exception as e:
+                self._stats["failures"] += 1
+                self.last_error = str(e)
+                raise
+            finally:
+                self.running = False
+                self.last_duration = round(time.perf_counter() - start, 3)
+                await self._record_schedule()
+
+    async def run_as_leader(self, conditional: bool = True) -> Optional[Dict[str, Any]]:
+        """
+        Lượt đồng bộ thủ công (vd. /university/update): giành lease trước khi ghi;
+        None nếu worker khác đang giữ lease (đang đồng bộ hoặc là leader).
+        """
+        lease = await lease_repository.acquire(LEASE_NAME, self.owner, settings.university_sync_lease_ttl)
+        self.is_leader = lease is not None
+        if not self.is_leader:
+            return None
+        return await self.run_once(conditional)
+
+    async def _renew_lease(self):
+        """
+        Gia hạn lease trước mỗi lô ghi để sync dài không để lease hết hạn giữa chừng; worker
+        không giữ lease thì không được ghi (LeaseLostError)
+        """
+        lease = await lease_repository.acquire(LEASE_NAME, self.owner, settings.university_sync_lease_ttl)
+        if lease is None:
+            self.is_leader = False
+            raise LeaseLostError(f"Lease {LEASE_NAME} was taken over during sync")
+
+    async def _record_schedule(self):
+        self.next_sync_at = time.time() + self._jittered(settings.university_sync_interval)
+        if not self.is_leader:
+            return
+        try:
+            await lease_repository.update(LEASE_NAME, self.owner, {
+                "next_sync_at": self.next_sync_at,
+                "last_run_at": self.last_run_at,
+                "last_success_at": self.last_success_at,
+                "last_error": self.last_error,
+                "etag": self._etag,
+                "last_modified": self._last_modified
+            })
+        except Exception as e:
+            logger.warning(f"Recording sync schedule failed: {e}")
+
+    # ---------- Observability ----------
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "enabled": settings.university_sync_interval > 0,
+            "owner": self.owner,
+            "is_leader": self.is_leader,
+            "running": self.running,
+            "last_run_at": self.last_run_at,
+            "last_success_at": self.last_success_at,
+            "last_duration_seconds": self.last_duration,
+            "last_result": self.last_result,
+            "last_error": self.last_error,
+            "next_sync_at": self.next_sync_at,
+            "interval_seconds": settings.university_sync_interval,
+            "pull": university_service.sync_state()
+        }
+
+    def metrics(self) -> Dict[str, Any]:
+        return dict(self._stats)
+
+
+# Singleton instance
+university_sync_scheduler = UniversitySyncScheduler()
@@ -0,0 +1,62 @@
+import time
+from typing import Any, Dict
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker cho lời gọi upstream.
+
+    Sau `failure_threshold` lỗi liên tiếp thì mở mạch trong `reset_timeout` giây
+    (không gọi upstream). Hết thời gian đó cho phép một lời gọi thử (half-open):
+    thành công thì đóng mạch, thất bại thì mở lại.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self.trips = 0
+
+    @property
+    def state(self) -> str:
+        if self._state == OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+            self._state = HALF_OPEN
+            self._trial_in_flight = False
+        return self._state
+
+    def allow_request(self) -> bool:
+        state = self.state
+        if state == CLOSED:
+            return True
+        if state == HALF_OPEN and not self._trial_in_flight:
+            self._trial_in_flight = True
+            return True
+        return False
+
+    def record_success(self):
+        self._state = CLOSED
+        self._failures = 0
+        self._trial_in_flight = False
+
+    def record_ignored(self):
+        """Lời gọi không tính là thành công hay lỗi (vd. 4xx): chỉ trả lại lượt thử half-open"""
+        self._trial_in_flight = False
+
+    def record_failure(self):
+        self._failures += 1
+        if self._state == HALF_OPEN or self._failures >= self.failure_threshold:
+            if self._state != OPEN:
+                self.trips += 1
+            self._state = OPEN
+            self._opened_at = time.monotonic()
+            self._trial_in_flight = False
+
+    def metrics(self) -> Dict[str, Any]:
+        return {"state": self.state, "consecutive_failures": self._failures, "trips": self.trips}
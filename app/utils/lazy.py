@@ -0,0 +1,74 @@
+import threading
+import time
+from typing import Any, Callable, Dict, Generic, Optional, TypeVar
+
+T = TypeVar("T")
+
+# Mọi proxy đã khai báo, theo tên (cho warm-up và báo cáo startup profile)
+_registry: Dict[str, "LazyProxy"] = {}
+
+
+class LazyProxy(Generic[T]):
+    """
+    Singleton dựng lazy: `factory()` chỉ chạy ở lần truy cập thuộc tính đầu tiên
+    (hoặc khi warm-up gọi resolve()), nên import module không tốn chi phí khởi tạo.
+    Mọi truy cập / gán thuộc tính được chuyển tiếp tới instance thật.
+    """
+
+    __slots__ = ("_name", "_factory", "_instance", "_lock", "init_seconds")
+
+    def __init__(self, name: str, factory: Callable[[], T]):
+        object.__setattr__(self, "_name", name)
+        object.__setattr__(self, "_factory", factory)
+        object.__setattr__(self, "_instance", None)
+        object.__setattr__(self, "_lock", threading.Lock())
+        object.__setattr__(self, "init_seconds", None)
+        _registry[name] = self
+
+    @property
+    def resolved(self) -> bool:
+        return self._instance is not None
+
+    def resolve(self) -> T:
+        instance = self._instance
+        if instance is None:
+            with self._lock:
+                instance = self._instance
+                if instance is None:
+                    start = time.perf_counter()
+                    instance = self._factory()
+                    object.__setattr__(self, "init_seconds", time.perf_counter() - start)
+                    object.__setattr__(self, "_instance", instance)
+        return instance
+
+    def reset(self):
+        """Bỏ instance hiện tại; lần truy cập sau dựng lại (vd. khi nạp lại snapshot)"""
+        with self._lock:
+            object.__setattr__(self, "_instance", None)
+            object.__setattr__(self, "init_seconds", None)
+
+    def __getattr__(self, attr: str) -> Any:
+        return getattr(self.resolve(), attr)
+
+    def __setattr__(self, attr: str, value: Any):
+        setattr(self.resolve(), attr, value)
+
+    def __repr__(self) -> str:
+        state = "resolved" if self.resolved else "pending"
+        return f"<LazyProxy {self._name} ({state})>"
+
+
+def resolve_all() -> Dict[str, float]:
+    """Dựng mọi singleton lazy còn chờ; trả về thời gian khởi tạo (giây) theo tên"""
+    for proxy in list(_registry.values()):
+        proxy.resolve()
+    return init_times()
+
+
+def reset_all():
+    for proxy in list(_registry.values()):
+        proxy.reset()
+
+
+def init_times() -> Dict[str, Optional[float]]:
+    return {name: proxy.init_seconds for name, proxy in _registry.items()}
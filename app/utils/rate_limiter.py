@@ -0,0 +1,69 @@
+import asyncio
+import time
+from typing import Any, Dict
+
+
+class TokenBucket:
+    """
+    Token bucket bất đồng bộ, an toàn khi nhiều coroutine gọi đồng thời.
+
+    Token được nạp lại với tốc độ `rate` token/giây, tối đa `burst` token.
+    Các coroutine chờ theo thứ tự FIFO (xếp hàng trên lock) nên không thể
+    cùng đọc một trạng thái cũ rồi vượt giới hạn như kiểu check timestamp.
+    """
+
+    def __init__(self, rate: float, burst: int = 1):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = float(rate)
+        self.burst = max(1, int(burst))
+        self._tokens = float(self.burst)
+        self._updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+        # Metrics
+        self._acquired = 0
+        self._waiting = 0
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+
+    async def acquire(self, tokens: float = 1.0) -> float:
+        """Chờ tới khi đủ token; trả về thời gian đã chờ (giây)"""
+        start = time.monotonic()
+        self._waiting += 1
+        try:
+            async with self._lock:
+                self._refill()
+                if self._tokens < tokens:
+                    await asyncio.sleep((tokens - self._tokens) / self.rate)
+                    self._refill()
+                self._tokens -= tokens
+        finally:
+            self._waiting -= 1
+        waited = time.monotonic() - start
+        self._acquired += 1
+        self._total_wait += waited
+        self._max_wait = max(self._max_wait, waited)
+        return waited
+
+    async def __aenter__(self):
+        await self.acquire()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        return False
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "rate": self.rate,
+            "burst": self.burst,
+            "acquired": self._acquired,
+            "queue_depth": self._waiting,
+            "total_wait_seconds": round(self._total_wait, 4),
+            "avg_wait_seconds": round(self._total_wait / self._acquired, 4) if self._acquired else 0.0,
+            "max_wait_seconds": round(self._max_wait, 4)
+        }
@@ -1,25 +1,45 @@
+import datetime
 from typing import Any, Optional, Dict
+import orjson
 from pydantic import BaseModel
 from bson import ObjectId
+from fastapi.responses import JSONResponse
 
 class APIResponse(BaseModel):
+    """Định dạng envelope chung của API (tham khảo; response được serialize trực tiếp bằng orjson)"""
     success: bool = True
     message: str = "Success"
     data: Optional[Any] = None
     error: Optional[Dict[str, Any]] = None
 
-def convert_objectid(obj):
+def _default(obj):
+    """Kiểu orjson không tự xử lý: ObjectId, pydantic model, date"""
     if isinstance(obj, ObjectId):
         return str(obj)
-    elif isinstance(obj, list):
-        return [convert_objectid(item) for item in obj]
-    elif isinstance(obj, dict):
-        return {k: convert_objectid(v) for k, v in obj.items()}
-    else:
-        return obj
+    if isinstance(obj, BaseModel):
+        return obj.model_dump()
+    if isinstance(obj, datetime.date):
+        return obj.isoformat()
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
 
-def success_response(data: Any = None, message: str = "Success") -> APIResponse:
-    return APIResponse(success=True, message=message, data=convert_objectid(data))
+def dumps(content: Any) -> bytes:
+    """Serialize một lượt bằng orjson (ObjectId/model/datetime/numpy xử lý trong cùng lượt; UTC ghi "Z" như pydantic)"""
+    return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_UTC_Z)
 
-def error_response(message: str = "Error", error: Dict[str, Any] = None) -> APIResponse:
-    return APIResponse(success=False, message=message, error=error)
\ No newline at end of file
+class FastJSONResponse(JSONResponse):
+    """JSONResponse render bằng orjson; trả trực tiếp từ controller để FastAPI bỏ qua jsonable_encoder"""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+def success_response(data: Any = None, message: str = "Success", headers: Dict[str, str] = None) -> FastJSONResponse:
+    return FastJSONResponse(
+        {"success": True, "message": message, "data": data, "error": None},
+        headers=headers
+    )
+
+def error_response(message: str = "Error", error: Dict[str, Any] = None, status_code: int = 400) -> FastJSONResponse:
+    return FastJSONResponse(
+        {"success": False, "message": message, "data": None, "error": error},
+        status_code=status_code
+    )
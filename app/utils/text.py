@@ -0,0 +1,15 @@
+import unicodedata
+
+
+def remove_accents(text: str) -> str:
+    """Bỏ dấu tiếng Việt (kể cả 'đ' -> 'd')"""
+    text = unicodedata.normalize('NFKD', text)
+    text = ''.join(c for c in text if not unicodedata.combining(c))
+    return text.replace('đ', 'd').replace('Đ', 'D')
+
+
+def normalize_text(text: str) -> str:
+    """Chuẩn hóa để so khớp: bỏ dấu, lower, gộp khoảng trắng"""
+    if not text:
+        return ""
+    return ' '.join(remove_accents(text).lower().split())
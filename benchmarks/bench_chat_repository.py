@@ -0,0 +1,113 @@
+"""
+Benchmark các backend lưu lịch sử chat: ghi tin nhắn (đồng thời), đọc lịch sử, và đọc
+một trang (keyset, iter_history) ở đầu / giữa / cuối một session dài so với cách cũ phải
+lấy cả `limit` lớn để lùi tới cùng độ sâu.
+
+memory và sqlite chạy không cần server; thêm mongo bằng --backends ... mongo (MONGO_URL).
+Backend sqlite ghi vào file tạm, không đụng tới chatbot_tuyensinh.db.
+
+    python -m benchmarks.bench_chat_repository --sessions 200 --messages 20 --reads 2000 --long-session 5000
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+
+from app.repositories.chat_repository import InMemoryChatRepository, MongoChatRepository
+from app.repositories.sqlite_chat_repository import SQLiteChatRepository
+
+
+def make_repository(backend: str, tmpdir: str):
+    if backend == "memory":
+        return InMemoryChatRepository()
+    if backend == "sqlite":
+        return SQLiteChatRepository(os.path.join(tmpdir, "bench_chat.db"))
+    if backend == "mongo":
+        return MongoChatRepository()
+    raise ValueError(backend)
+
+
+def percentiles(samples):
+    samples = sorted(samples)
+    return {
+        "p50_ms": round(statistics.median(samples), 3),
+        "p95_ms": round(samples[int(len(samples) * 0.95) - 1], 3),
+        "p99_ms": round(samples[int(len(samples) * 0.99) - 1], 3)
+    }
+
+
+async def run_pages(backend: str, repo, length: int, page_size: int = 30, rounds: int = 200):
+    session_id = await repo.create_session("bench")
+    ids = [(await repo.create_message(session_id, f"Câu hỏi {i}", "Trả lời " * 40))["_id"] for i in range(length)]
+    # cursor `before` = id của tin ngay sau trang cần đọc (ids tăng dần theo thời gian)
+    for label, depth in (("newest", 0), ("middle", length // 2), ("oldest", length - page_size)):
+        before = ids[length - depth] if depth else None
+        samples = []
+        for _ in range(rounds):
+            start = time.perf_counter()
+            page = [doc async for doc in repo.iter_history(session_id, page_size, before=before)]
+            samples.append((time.perf_counter() - start) * 1000)
+            assert len(page) == page_size
+        print(f"[{backend:6}] page {label:6} of {length}: {percentiles(samples)}")
+    samples = []
+    for _ in range(max(rounds // 10, 5)):
+        start = time.perf_counter()
+        await repo.get_chat_history(session_id, limit=length)
+        samples.append((time.perf_counter() - start) * 1000)
+    print(f"[{backend:6}] full limit={length} (old way to reach oldest page): {percentiles(samples)}")
+
+
+async def run_backend(backend: str, sessions: int, messages: int, reads: int, concurrency: int, tmpdir: str,
+                      long_session: int = 0):
+    repo = make_repository(backend, tmpdir)
+    await repo.open()
+    try:
+        session_ids = [await repo.create_session("bench") for _ in range(sessions)]
+        semaphore = asyncio.Semaphore(concurrency)
+        write_samples = []
+
+        async def write(session_id, i):
+            async with semaphore:
+                start = time.perf_counter()
+                await repo.create_message(session_id, f"Câu hỏi {i} về điểm chuẩn", "Trả lời " * 40, "admission_score")
+                write_samples.append((time.perf_counter() - start) * 1000)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(write(session_id, i) for i in range(messages) for session_id in session_ids))
+        write_seconds = time.perf_counter() - start
+
+        read_samples = []
+        for i in range(reads):
+            session_id = session_ids[i % sessions]
+            start = time.perf_counter()
+            history = await repo.get_chat_history(session_id, limit=30)
+            read_samples.append((time.perf_counter() - start) * 1000)
+            assert len(history) == messages
+        total = sessions * messages
+        print(f"[{backend:6}] write {total} msgs: {total / write_seconds:9.0f} msg/s {percentiles(write_samples)}")
+        print(f"[{backend:6}] read history x{reads}: {percentiles(read_samples)}")
+        if isinstance(repo, SQLiteChatRepository):
+            print(f"[{backend:6}] {repo.batched_writes} writes in {repo.batches} commits")
+        if long_session:
+            await run_pages(backend, repo, long_session)
+    finally:
+        await repo.close()
+
+
+async def main(args):
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for backend in args.backends:
+            await run_backend(backend, args.sessions, args.messages, args.reads, args.concurrency, tmpdir, args.long_session)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--backends", nargs="+", default=["memory", "sqlite"])
+    parser.add_argument("--sessions", type=int, default=200)
+    parser.add_argument("--messages", type=int, default=20)
+    parser.add_argument("--reads", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--long-session", type=int, default=5000, help="messages in the paginated session (0 = skip)")
+    asyncio.run(main(parser.parse_args()))
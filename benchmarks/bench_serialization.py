@@ -0,0 +1,121 @@
+"""
+Benchmark chi phí serialize response theo endpoint: đường cũ vs orjson một lượt.
+
+Đường cũ: convert_objectid -> APIResponse -> jsonable_encoder (FastAPI) -> json.dumps.
+Đường mới: success_response -> orjson.dumps với default (ObjectId/model/datetime).
+
+    python -m benchmarks.bench_serialization --repeat 20
+"""
+import argparse
+import datetime
+import json
+import random
+import statistics
+import time
+
+from bson import ObjectId
+from fastapi.encoders import jsonable_encoder
+
+from app.schemas.ranking import StudentRankingResponse
+from app.utils.response import APIResponse, success_response
+
+
+def convert_objectid(obj):
+    """Bản sao hàm cũ trong app/utils/response.py"""
+    if isinstance(obj, ObjectId):
+        return str(obj)
+    elif isinstance(obj, list):
+        return [convert_objectid(item) for item in obj]
+    elif isinstance(obj, dict):
+        return {k: convert_objectid(v) for k, v in obj.items()}
+    else:
+        return obj
+
+
+def legacy_render(data) -> bytes:
+    model = APIResponse(success=True, message="Success", data=convert_objectid(data))
+    content = jsonable_encoder(model)
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")).encode("utf-8")
+
+
+def fast_render(data) -> bytes:
+    return success_response(data=data).body
+
+
+def university_payload(n: int, rng: random.Random):
+    return [{
+        "_id": ObjectId(),
+        "id": i,
+        "name": f"Trường Đại học số {i}",
+        "code": f"U{i:04d}",
+        "alias": f"U{i}",
+        "location": rng.choice(["Hà Nội", "TP.HCM", "Đà Nẵng"]),
+        "diem_chuan": {
+            str(year): {
+                "cao_nhat": round(rng.uniform(24, 29), 2),
+                "thap_nhat": round(rng.uniform(15, 20), 2),
+                "nganh_hot": [{"nganh": f"Ngành {k}", "diem": round(rng.uniform(20, 28), 2)} for k in range(5)]
+            } for year in (2022, 2023, 2024)
+        },
+        "hoc_phi": {"khung_gia": "15-30 triệu/năm", "chi_tiet": "Theo tín chỉ"},
+        "hoc_bong": [f"Học bổng {k}" for k in range(3)]
+    } for i in range(n)]
+
+
+def ranking_payload(rng: random.Random):
+    return StudentRankingResponse(
+        candidate_number="01234567",
+        mark_info=[{"name": f"Môn {i}", "score": f"{rng.uniform(0, 10):.2f}"} for i in range(8)],
+        data_year=2025,
+        blocks=[{
+            "label": f"K{i:02d}", "value": f"K{i:02d}", "id": i, "subjects": ["Toán", "Vật lí", "Hóa học"],
+            "point": round(rng.uniform(10, 30), 2),
+            "ranking": {"equal": rng.randint(0, 2000), "higher": rng.randint(0, 100000), "total": 300000},
+            "region": "CN", "year": 2025
+        } for i in range(13)]
+    )
+
+
+def history_payload(n: int):
+    now = datetime.datetime.now(datetime.timezone.utc)
+    return [{
+        "_id": ObjectId(),
+        "session_id": "4d6f2a0e-5d2b-4f0e-9a43-1b7a3c2d9e10",
+        "user_message": "Điểm chuẩn Bách khoa Hà Nội năm 2024 là bao nhiêu?",
+        "bot_response": "**Đại học Bách khoa Hà Nội**\n- Cao nhất: 29.42\n- Thấp nhất: 21.5\n" * 4,
+        "intent": "admission_score",
+        "created_at": now - datetime.timedelta(minutes=i)
+    } for i in range(n)]
+
+
+def bench(fn, data, repeat: int):
+    fn(data)
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        body = fn(data)
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples), len(body)
+
+
+def main(repeat: int):
+    rng = random.Random(0)
+    cases = [
+        ("/university/all (2000 docs)", university_payload(2000, rng)),
+        ("/ranking/thptqg/2025/search", ranking_payload(rng)),
+        ("/chat/history (200 messages)", history_payload(200)),
+    ]
+    print(f"{'endpoint':32} {'legacy ms':>10} {'orjson ms':>10} {'speedup':>8} {'bytes':>9}")
+    for name, data in cases:
+        # Đường cũ của ranking gọi thêm .dict() trong controller
+        legacy_data = data.model_dump() if isinstance(data, StudentRankingResponse) else data
+        legacy_ms, _ = bench(legacy_render, legacy_data, repeat)
+        fast_ms, size = bench(fast_render, data, repeat)
+        print(f"{name:32} {legacy_ms:10.3f} {fast_ms:10.3f} {legacy_ms / fast_ms:7.1f}x {size:9d}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+    main(args.repeat)
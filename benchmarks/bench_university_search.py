@@ -0,0 +1,106 @@
+"""
+Benchmark tìm kiếm trường: regex scan cũ vs search_tokens (index multikey).
+
+Cần MongoDB thật (MONGO_URL); dữ liệu được sinh vào database tạm và xóa sau khi chạy.
+
+    python -m benchmarks.bench_university_search --sizes 10000 100000 --queries 200
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import time
+
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from app.core.indexes import INDEX_SPECS
+from app.services.university_service import UniversityService, build_search_fields
+from app.utils.text import remove_accents
+
+WORDS = [
+    "Đại học", "Học viện", "Trường", "Bách khoa", "Kinh tế", "Ngoại thương", "Y Dược", "Sư phạm",
+    "Công nghệ", "Khoa học", "Tự nhiên", "Xã hội", "Nhân văn", "Luật", "Kiến trúc", "Nông lâm",
+    "Thủy lợi", "Giao thông", "Vận tải", "Mỏ", "Địa chất", "Quốc tế", "Tài chính", "Ngân hàng"
+]
+CITIES = ["Hà Nội", "TP.HCM", "Đà Nẵng", "Huế", "Cần Thơ", "Hải Phòng", "Thái Nguyên", "Vinh"]
+QUERIES = ["bách khoa", "kinh te", "ngoại thương", "y duoc ha noi", "su pham", "luat", "quoc te", "nong lam hue"]
+
+
+def make_docs(n: int, seed: int = 0):
+    rng = random.Random(seed)
+    docs = []
+    for i in range(n):
+        name = f"{rng.choice(WORDS[:3])} {' '.join(rng.sample(WORDS[3:], 2))} {rng.choice(CITIES)}"
+        uni = {"id": i, "name": name, "code": f"U{i:05d}", "alias": f"U{i}"}
+        docs.append({**uni, **build_search_fields(uni)})
+    return docs
+
+
+async def legacy_regex_search(collection, name: str):
+    """Truy vấn cũ: hai regex không neo, không phân biệt hoa thường trên name"""
+    query = {"$or": [
+        {"name": {"$regex": name, "$options": "i"}},
+        {"name": {"$regex": remove_accents(name), "$options": "i"}}
+    ]}
+    return [doc async for doc in collection.find(query)]
+
+
+async def timed(fn, queries):
+    samples = []
+    for q in queries:
+        start = time.perf_counter()
+        await fn(q)
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return {
+        "p50_ms": round(statistics.median(samples), 3),
+        "p95_ms": round(samples[int(len(samples) * 0.95) - 1], 3),
+        "mean_ms": round(statistics.fmean(samples), 3)
+    }
+
+
+async def explain_stage(collection, query) -> str:
+    plan = await collection.find(query).explain()
+    stage = plan["queryPlanner"]["winningPlan"]
+    while "inputStage" in stage:
+        if stage["stage"] in ("IXSCAN", "COLLSCAN"):
+            break
+        stage = stage["inputStage"]
+    return stage["stage"]
+
+
+async def run(sizes, n_queries):
+    client = AsyncIOMotorClient(os.getenv("MONGO_URL", "mongodb://localhost:27017"))
+    db = client["bench_university_search"]
+    service = UniversityService()
+    try:
+        for size in sizes:
+            collection = db[f"universities_{size}"]
+            await collection.drop()
+            docs = make_docs(size)
+            for i in range(0, size, 10000):
+                await collection.insert_many(docs[i:i + 10000])
+            service.collection = collection
+            await collection.create_indexes(INDEX_SPECS["universities"])
+
+            queries = [QUERIES[i % len(QUERIES)] for i in range(n_queries)]
+            legacy = await timed(lambda q: legacy_regex_search(collection, q), queries)
+            indexed = await timed(lambda q: service.search_universities(name=q, limit=50), queries)
+            legacy_stage = await explain_stage(collection, {"name": {"$regex": "bach khoa", "$options": "i"}})
+            indexed_stage = await explain_stage(collection, {"$and": [
+                {"search_tokens": "bach"}, {"search_tokens": {"$regex": "^khoa"}}
+            ]})
+            print(f"[{size} docs] regex  {legacy_stage:8} {legacy}")
+            print(f"[{size} docs] tokens {indexed_stage:8} {indexed}")
+    finally:
+        await client.drop_database("bench_university_search")
+        client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000])
+    parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args()
+    asyncio.run(run(args.sizes, args.queries))
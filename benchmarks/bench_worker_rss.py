@@ -0,0 +1,122 @@
+"""
+Benchmark bộ nhớ theo worker: uvicorn --workers N (mỗi worker tự dựng state) vs
+chế độ preload (master dựng state rồi fork, chia sẻ copy-on-write).
+
+Đọc /proc/<pid>/smaps_rollup (Linux) của từng worker sau khi /health/ready trả 200:
+RSS, PSS (phần chia sẻ được chia đều cho các process) và Private (riêng của worker).
+Dữ liệu lấy theo cấu hình hiện tại (MONGO_URL, SCORE_DATASET_PATH, KB), nên chạy với
+danh mục trường / dataset thật để số liệu có ý nghĩa.
+
+    python -m benchmarks.bench_worker_rss --workers 4 --port 8011
+"""
+import argparse
+import os
+import signal
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+
+def children(pid: int):
+    result = []
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                fields = f.read().rsplit(")", 1)[1].split()
+        except OSError:
+            continue
+        if int(fields[1]) == pid:
+            result.append(int(entry))
+    return result
+
+
+def memory(pid: int):
+    """Rss, Pss, Private (kB) từ smaps_rollup"""
+    values = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) >= 2 and parts[0].endswith(":") and parts[1].isdigit():
+                values[parts[0][:-1]] = int(parts[1])
+    return {
+        "rss": values.get("Rss", 0),
+        "pss": values.get("Pss", 0),
+        "private": values.get("Private_Clean", 0) + values.get("Private_Dirty", 0)
+    }
+
+
+def wait_ready(port: int, timeout: float):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/health/ready", timeout=2) as resp:
+                if resp.status == 200:
+                    return True
+        except (urllib.error.URLError, ConnectionError, OSError):
+            pass
+        time.sleep(0.5)
+    return False
+
+
+def workers_of(master: int, preload: bool):
+    # uvicorn --workers: master -> (resource tracker) + worker spawn; preload: master -> fork
+    pids = children(master)
+    if not preload:
+        pids = [pid for pid in pids if children(pid) == [] and "multiprocessing.resource_tracker" not in _cmdline(pid)]
+    return pids
+
+
+def _cmdline(pid: int) -> str:
+    try:
+        with open(f"/proc/{pid}/cmdline", "rb") as f:
+            return f.read().replace(b"\0", b" ").decode()
+    except OSError:
+        return ""
+
+
+def run_mode(preload: bool, workers: int, port: int, settle: float, timeout: float):
+    cmd = [sys.executable, "run.py", "--host", "127.0.0.1", "--port", str(port), "--workers", str(workers)]
+    if preload:
+        cmd.append("--preload")
+    proc = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, env={**os.environ, "DEBUG": "False"})
+    try:
+        if not wait_ready(port, timeout):
+            raise RuntimeError("server did not become ready")
+        # Cho các worker còn lại warm-up xong (readiness chỉ trả lời từ một worker)
+        time.sleep(settle)
+        pids = workers_of(proc.pid, preload)
+        rows = [(pid, memory(pid)) for pid in pids]
+        master = memory(proc.pid)
+    finally:
+        proc.send_signal(signal.SIGTERM)
+        try:
+            proc.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+    return master, rows
+
+
+def main(workers: int, port: int, settle: float, timeout: float):
+    print(f"{'mode':10} {'pid':>8} {'rss MB':>9} {'pss MB':>9} {'private MB':>11}")
+    for preload in (False, True):
+        mode = "preload" if preload else "uvicorn"
+        master, rows = run_mode(preload, workers, port, settle, timeout)
+        for pid, mem in rows:
+            print(f"{mode:10} {pid:8d} {mem['rss'] / 1024:9.1f} {mem['pss'] / 1024:9.1f} {mem['private'] / 1024:11.1f}")
+        total_pss = (master["pss"] + sum(mem["pss"] for _, mem in rows)) / 1024
+        print(f"{mode:10} {'master':>8} {master['rss'] / 1024:9.1f} {master['pss'] / 1024:9.1f} "
+              f"{master['private'] / 1024:11.1f}   total PSS {total_pss:.1f} MB\n")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--port", type=int, default=8011)
+    parser.add_argument("--settle", type=float, default=5.0)
+    parser.add_argument("--timeout", type=float, default=120.0)
+    args = parser.parse_args()
+    main(args.workers, args.port, args.settle, args.timeout)
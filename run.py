@@ -1,10 +1,24 @@
+import argparse
 import uvicorn
 from app.core.config import settings
 
 if __name__ == "__main__":
-    uvicorn.run(
-        "app.main:app",
-        host="localhost",
-        port=settings.port,
-        reload=settings.debug
-    )
\ No newline at end of file
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=settings.port)
+    parser.add_argument("--workers", type=int, default=settings.workers)
+    parser.add_argument("--preload", action="store_true", default=settings.preload,
+                        help="build shared read-only state once, then fork workers (SIGHUP reloads)")
+    args = parser.parse_args()
+
+    if args.preload:
+        from app.core.prefork import serve
+        serve(args.host, args.port, args.workers)
+    else:
+        uvicorn.run(
+            "app.main:app",
+            host=args.host,
+            port=args.port,
+            workers=args.workers if not settings.debug else None,
+            reload=settings.debug
+        )
@@ -0,0 +1,55 @@
+import os
+
+# Cấu hình cho test, đặt trước khi import app (Settings đọc biến môi trường lúc import)
+os.environ.setdefault("OPENAI_API_KEY", "test")
+os.environ["CHAT_BACKEND"] = "mongo"
+os.environ["KB_SNAPSHOT_PATH"] = ""
+os.environ["SCORE_STORE_DIR"] = ""
+os.environ["MONGO_ENSURE_INDEXES"] = "False"
+
+import pytest
+from mongomock_motor import AsyncMongoMockClient
+
+from app.core.mongo import mongo
+
+MONGO_TEST_URL = os.getenv("MONGO_TEST_URL")
+# CI có mongod: đặt MONGO_TEST_REQUIRED=True để thiếu MONGO_TEST_URL là lỗi thay vì bỏ qua
+MONGO_TEST_REQUIRED = os.getenv("MONGO_TEST_REQUIRED", "False").lower() == "true"
+
+_skipped_mongo_tests = []
+
+
+def pytest_collection_modifyitems(config, items):
+    """Test đánh dấu `mongo` chỉ chạy khi có MONGO_TEST_URL"""
+    if MONGO_TEST_URL:
+        return
+    mongo_items = [item for item in items if item.get_closest_marker("mongo")]
+    if mongo_items and MONGO_TEST_REQUIRED:
+        raise pytest.UsageError("MONGO_TEST_REQUIRED=True nhưng chưa đặt MONGO_TEST_URL")
+    skip = pytest.mark.skip(reason="cần MongoDB thật: đặt MONGO_TEST_URL")
+    for item in mongo_items:
+        item.add_marker(skip)
+        _skipped_mongo_tests.append(item.nodeid)
+
+
+def pytest_terminal_summary(terminalreporter):
+    if not _skipped_mongo_tests:
+        return
+    terminalreporter.section("MongoDB tests SKIPPED", sep="!", red=True, bold=True)
+    terminalreporter.write_line(
+        f"{len(_skipped_mongo_tests)} test cần MongoDB thật KHÔNG chạy (chưa đặt MONGO_TEST_URL):",
+        yellow=True, bold=True,
+    )
+    for nodeid in _skipped_mongo_tests:
+        terminalreporter.write_line(f"  {nodeid}", yellow=True)
+    terminalreporter.write_line("Chạy: MONGO_TEST_URL=mongodb://localhost:27017 python -m pytest -m mongo", yellow=True)
+
+
+@pytest.fixture
+def mongo_db():
+    """Database Mongo giả lập (mongomock) thay cho client thật của MongoManager"""
+    mongo._client = AsyncMongoMockClient()
+    mongo._collections = {}
+    yield mongo.db
+    mongo._client = None
+    mongo._collections = {}
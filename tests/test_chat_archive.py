@@ -0,0 +1,167 @@
+import datetime
+import os
+
+import pytest
+from bson import ObjectId
+
+from app.core.config import settings
+from app.repositories import chat_repository as chat_repository_module
+from app.repositories.chat_repository import MongoChatRepository
+from app.repositories.lease_repository import LeaseLostError, lease_repository
+from app.services.chat_archive_service import INDEX_DIR, LEASE_NAME, ArchiveVolumeError, ChatArchiveService
+
+
+@pytest.fixture
+def archive_service(mongo_db, tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "chat_retention_days", 30)
+    monkeypatch.setattr(settings, "chat_archive_dir", str(tmp_path))
+    monkeypatch.setattr(settings, "chat_archive_batch_size", 7)
+    service = ChatArchiveService()
+    monkeypatch.setattr(chat_repository_module, "chat_archive_service", service)
+    return service
+
+
+async def seed(mongo_db, count=20):
+    """Tin nhắn cũ 60..41 ngày, xen kẽ hai session; một bản ghi cũ không có created_at"""
+    now = datetime.datetime.now(datetime.timezone.utc)
+    docs = []
+    for i in range(count):
+        created_at = now - datetime.timedelta(days=60 - i, seconds=i)
+        doc = {
+            "_id": ObjectId.from_datetime(created_at),
+            "session_id": "old" if i % 2 else "other",
+            "user_message": f"m{i}",
+            "bot_response": "r",
+            "intent": "text"
+        }
+        if i != 3:
+            doc["created_at"] = created_at.replace(tzinfo=None)
+        docs.append(doc)
+    await mongo_db["chat_messages"].insert_many(docs)
+
+
+async def expire_archived(mongo_db):
+    """Giả lập TTL monitor xoá các bản ghi đã lưu trữ"""
+    await mongo_db["chat_messages"].delete_many({"archived_at": {"$exists": True}})
+
+
+async def test_run_once_archives_only_messages_past_cutoff(archive_service, mongo_db):
+    await seed(mongo_db)
+    repo = MongoChatRepository()
+    await repo.create_message("old", "fresh", "r")
+
+    result = await archive_service.run_once()
+    assert result["messages"] == 20
+    assert await archive_service.run_once() == {"messages": 0, "sessions": 0, "watermark": result["watermark"]}
+
+    collection = mongo_db["chat_messages"]
+    assert await collection.count_documents({"archived_at": {"$exists": True}}) == 19
+    # Bản ghi cũ thiếu created_at bị xoá ngay sau khi lưu trữ, tin mới vẫn ở lại
+    assert await collection.count_documents({}) == 20
+    assert await collection.count_documents({"user_message": "fresh", "archived_at": {"$exists": False}}) == 1
+
+
+async def test_history_reads_through_to_archive(archive_service, mongo_db):
+    await seed(mongo_db)
+    repo = MongoChatRepository()
+    await repo.create_message("old", "fresh", "r")
+    await archive_service.run_once()
+    await expire_archived(mongo_db)
+
+    history = await repo.get_chat_history("old", 4)
+    assert [doc["user_message"] for doc in history] == ["fresh", "m19", "m17", "m15"]
+    assert all(isinstance(doc["created_at"], datetime.datetime) for doc in history)
+    assert len(await repo.get_chat_history("old", 100)) == 11
+
+    pages, before = [], None
+    while True:
+        page = [doc async for doc in repo.iter_history("old", 4, before=before, fields=["user_message"])]
+        pages.append([doc["user_message"] for doc in page])
+        if len(page) < 4:
+            break
+        before = page[-1]["_id"]
+    assert pages == [["fresh", "m19", "m17", "m15"], ["m13", "m11", "m9", "m7"], ["m5", "m3", "m1"]]
+
+
+async def test_rearchived_messages_are_returned_once(archive_service, mongo_db):
+    await seed(mongo_db)
+    await archive_service.run_once()
+    archive = archive_service.archive("chat_messages")
+    docs = archive.read_session("old")
+    assert len(docs) == 10
+
+    # Crash trước khi lưu watermark: cùng lô được ghi lại lần nữa
+    archive.write([{**doc, "_id": ObjectId(doc["_id"])} for doc in docs])
+    assert len(archive.read_session("old")) == 10
+    assert len(await archive_service.get_archived_history("old")) == 10
+
+
+async def test_index_is_sharded_by_session(archive_service, mongo_db):
+    await seed(mongo_db)
+    await archive_service.run_once()
+    archive = archive_service.archive("chat_messages")
+    shards = sorted(os.listdir(os.path.join(archive.directory, INDEX_DIR)))
+    assert shards == sorted({f"{archive.shard('old')}.jsonl", f"{archive.shard('other')}.jsonl"})
+    assert archive.has_session("other")
+    assert not archive.has_session("missing")
+
+
+async def test_watermark_follows_the_lease_to_another_worker(archive_service, mongo_db, monkeypatch):
+    await seed(mongo_db)
+    result = await archive_service.run_once()
+    lease = await lease_repository.get(LEASE_NAME)
+    assert lease["watermark"] == result["watermark"]
+    await lease_repository.release(LEASE_NAME, archive_service.owner)
+
+    # Leader mới trên cùng volume tiếp tục từ watermark, không lưu trữ lại
+    successor = ChatArchiveService()
+    monkeypatch.setattr(chat_repository_module, "chat_archive_service", successor)
+    assert (await successor.run_once())["messages"] == 0
+    assert len(successor.archive("chat_messages").read_session("old")) == 10
+
+
+async def test_worker_without_shared_volume_refuses_to_archive(archive_service, mongo_db, tmp_path, monkeypatch):
+    await seed(mongo_db)
+    await archive_service.run_once()
+    await lease_repository.release(LEASE_NAME, archive_service.owner)
+
+    monkeypatch.setattr(settings, "chat_archive_dir", str(tmp_path / "local-disk"))
+    other = ChatArchiveService()
+    with pytest.raises(ArchiveVolumeError):
+        await other.run_once()
+    assert other.status()["volume_error"]
+
+
+async def test_archiving_renews_lease_before_each_batch(archive_service, mongo_db, monkeypatch):
+    await seed(mongo_db)
+    renewals = []
+    original = lease_repository.acquire
+
+    async def counting_acquire(*args, **kwargs):
+        renewals.append(args[0])
+        return await original(*args, **kwargs)
+
+    monkeypatch.setattr(lease_repository, "acquire", counting_acquire)
+    await archive_service.run_once()
+    # Một lần giành lease + 4 lô chat_messages (20 bản ghi / 7) + 1 lô chat_sessions (rỗng)
+    assert renewals == [LEASE_NAME] * 6
+
+
+async def test_archiving_stops_when_lease_is_taken_over(archive_service, mongo_db, monkeypatch):
+    await seed(mongo_db)
+    original = lease_repository.acquire
+    calls = []
+
+    async def losing_acquire(*args, **kwargs):
+        calls.append(args[0])
+        if len(calls) == 3:
+            await mongo_db["sync_leases"].update_one({"_id": LEASE_NAME}, {"$set": {"owner": "other-worker"}})
+        return await original(*args, **kwargs)
+
+    monkeypatch.setattr(lease_repository, "acquire", losing_acquire)
+    with pytest.raises(LeaseLostError):
+        await archive_service.run_once()
+    assert not archive_service.is_leader
+    # Chỉ lô đầu tiên (7 bản ghi, gồm bản ghi cũ thiếu created_at đã bị xoá) đã được lưu trữ
+    assert await mongo_db["chat_messages"].count_documents({"archived_at": {"$exists": True}}) == 6
+    assert await mongo_db["chat_messages"].count_documents({}) == 19
@@ -0,0 +1,79 @@
+import pytest
+
+from app.repositories.chat_repository import BaseChatRepository, InMemoryChatRepository, MongoChatRepository
+from app.repositories.sqlite_chat_repository import SQLiteChatRepository
+
+
+@pytest.fixture(params=["memory", "sqlite", "mongo"])
+async def repository(request, tmp_path):
+    if request.param == "memory":
+        repo = InMemoryChatRepository()
+    elif request.param == "sqlite":
+        repo = SQLiteChatRepository(str(tmp_path / "chat.db"))
+    else:
+        request.getfixturevalue("mongo_db")
+        repo = MongoChatRepository()
+    await repo.open()
+    yield repo
+    await repo.close()
+
+
+async def fill(repo, session_id, count):
+    for i in range(count):
+        await repo.create_message(session_id, f"m{i}", f"r{i}")
+
+
+async def page(repo, session_id, limit, **kwargs):
+    return [doc async for doc in repo.iter_history(session_id, limit, **kwargs)]
+
+
+async def test_get_chat_history_returns_newest_first(repository):
+    await fill(repository, "s1", 5)
+    await fill(repository, "s2", 2)
+    history = await repository.get_chat_history("s1", 3)
+    assert [doc["user_message"] for doc in history] == ["m4", "m3", "m2"]
+    assert await repository.get_chat_history("missing", 3) == []
+
+
+async def test_before_cursor_walks_back_without_overlap(repository):
+    await fill(repository, "s1", 10)
+    await fill(repository, "s2", 3)
+    pages, before = [], None
+    while True:
+        docs = await page(repository, "s1", 4, before=before)
+        if not docs:
+            break
+        pages.append([doc["user_message"] for doc in docs])
+        before = docs[-1]["_id"]
+    assert pages == [["m9", "m8", "m7", "m6"], ["m5", "m4", "m3", "m2"], ["m1", "m0"]]
+
+
+async def test_after_cursor_returns_newer_messages_oldest_first(repository):
+    await fill(repository, "s1", 6)
+    oldest = (await page(repository, "s1", 6))[-1]
+    docs = await page(repository, "s1", 3, after=oldest["_id"])
+    assert [doc["user_message"] for doc in docs] == ["m1", "m2", "m3"]
+    newest = (await page(repository, "s1", 1))[0]
+    assert await page(repository, "s1", 3, after=newest["_id"]) == []
+
+
+async def test_fields_projection_keeps_cursor(repository):
+    await fill(repository, "s1", 2)
+    docs = await page(repository, "s1", 2, fields=["user_message"])
+    assert [set(doc) for doc in docs] == [{"_id", "user_message"}] * 2
+    assert all(isinstance(doc["_id"], str) for doc in docs)
+
+
+async def test_invalid_cursor_raises_value_error(repository):
+    await fill(repository, "s1", 1)
+    with pytest.raises(ValueError):
+        await page(repository, "s1", 2, before="not-a-cursor")
+
+
+def test_incomplete_backend_fails_at_instantiation():
+    class NoHistoryRepository(BaseChatRepository):
+        async def create_session(self, user_id):
+            return "s1"
+
+    with pytest.raises(TypeError, match="iter_history"):
+        NoHistoryRepository()
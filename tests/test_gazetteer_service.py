@@ -0,0 +1,56 @@
+from app.services.gazetteer_service import GazetteerService
+
+
+def make_service():
+    service = GazetteerService()
+    service.update_universities([
+        {"id": 1, "code": "NTH", "name": "Trường Đại học Ngoại thương"},
+        {"id": 2, "code": "BKA", "name": "Đại học Bách khoa Hà Nội"},
+    ])
+    return service
+
+
+def test_location_aliases_map_to_canonical_value():
+    service = make_service()
+    assert service.first("mình ở tp hcm", "location") == "tp.hcm"
+    assert service.first("học ở ha noi", "location") == "hà nội"
+
+
+def test_university_name_code_and_short_alias():
+    service = make_service()
+    assert service.first("điểm chuẩn NTH năm nay", "school") == "Trường Đại học Ngoại thương"
+    assert service.first("ngoai thuong lay bao nhieu diem", "school") == "Trường Đại học Ngoại thương"
+
+
+def test_longest_match_wins_and_offsets_point_into_message():
+    message = "Tôi muốn vào Đại học Bách khoa Hà Nội"
+    schools = [m for m in make_service().extract(message) if m["type"] == "school"]
+    assert len(schools) == 1
+    match = schools[0]
+    assert match["value"] == "Đại học Bách khoa Hà Nội"
+    assert match["source"] == "universities"
+    assert message[match["start"]:match["end"]] == match["text"] == "Đại học Bách khoa Hà Nội"
+
+
+def test_university_updates_recompile_the_trie():
+    service = make_service()
+    assert service.first("hỏi về trường VinUni", "school") is None
+    version = service.version
+    service.update_universities([{"id": 3, "code": "VIN", "name": "Trường Đại học VinUni", "alias": "VinUni"}])
+    assert service.first("hỏi về trường VinUni", "school") == "Trường Đại học VinUni"
+    assert service.version == version + 1
+
+
+def test_university_id_resolves_name_code_and_alias():
+    service = make_service()
+    assert service.university_id("học phí BKA") == 2
+    assert service.university_id("ngoai thuong lay bao nhieu diem") == 1
+    assert service.university_id("học ở ha noi") is None
+
+
+def test_renamed_university_drops_its_old_name():
+    service = make_service()
+    service.update_universities([{"id": 2, "code": "HUST", "name": "Đại học Bách khoa"}])
+    assert service.university_id("Đại học Bách khoa Hà Nội") == 2
+    assert service.first("Đại học Bách khoa Hà Nội", "school") == "Đại học Bách khoa"
+    assert "Đại học Bách khoa Hà Nội" not in service._university_ids
@@ -0,0 +1,88 @@
+import os
+import select
+import signal
+import time
+
+import pytest
+
+from app.core.config import settings
+from app.core.prefork import PreforkServer
+
+
+class SnapshotServer(PreforkServer):
+    """Zygote "nạp" snapshot `next_snapshot`; worker báo (pid, snapshot) qua pipe, chỉ ready nếu snapshot tốt"""
+
+    def __init__(self, report_write: int):
+        super().__init__(app=None, host="127.0.0.1", port=0, workers=2)
+        self.report_write = report_write
+        self.next_snapshot = None
+        self.snapshot = None
+
+    def preload(self):
+        self.snapshot = self.next_snapshot
+
+    def _run_worker(self):
+        for sig in (signal.SIGTERM, signal.SIGUSR1):
+            signal.signal(sig, signal.SIG_DFL)
+        os.write(self.report_write, f"{os.getpid()}:{self.snapshot}\n".encode())
+        if self.snapshot != "broken":
+            os.write(self._ready_write, b"1")
+        while True:
+            time.sleep(1)
+
+
+def read_reports(fd, count, timeout=10):
+    reports = []
+    deadline = time.monotonic() + timeout
+    while len(reports) < count and time.monotonic() < deadline:
+        if select.select([fd], [], [], 0.2)[0]:
+            for line in os.read(fd, 4096).decode().splitlines():
+                pid, snapshot = line.split(":")
+                reports.append((int(pid), snapshot))
+    return reports
+
+
+@pytest.fixture
+def server(monkeypatch):
+    monkeypatch.setattr(settings, "prefork_preload_timeout", 1)
+    monkeypatch.setattr(settings, "prefork_ready_timeout", 1)
+    report_read, report_write = os.pipe()
+    server = SnapshotServer(report_write)
+    server.report_read = report_read
+    yield server
+    server.shutdown()
+    os.close(report_read)
+    os.close(report_write)
+
+
+def test_aborted_roll_keeps_old_snapshot_for_respawned_workers(server):
+    server.next_snapshot = "v1"
+    server.start()
+    old = read_reports(server.report_read, 2)
+    assert [snapshot for _, snapshot in old] == ["v1", "v1"]
+    old_zygote = server._current()
+
+    server.next_snapshot = "broken"
+    assert server.roll() is False
+    assert [snapshot for _, snapshot in read_reports(server.report_read, 2)] == ["broken", "broken"]
+    assert server._current() == old_zygote
+
+    # Worker cũ chết sau roll hỏng: được fork lại từ snapshot cũ, không phải snapshot hỏng
+    os.kill(old[0][0], signal.SIGKILL)
+    respawned = read_reports(server.report_read, 1)
+    assert len(respawned) == 1
+    assert respawned[0][0] != old[0][0]
+    assert respawned[0][1] == "v1"
+
+
+def test_successful_roll_replaces_generation(server):
+    server.next_snapshot = "v1"
+    server.start()
+    read_reports(server.report_read, 2)
+    old_zygote = server._current()
+
+    server.next_snapshot = "v2"
+    assert server.roll() is True
+    assert [snapshot for _, snapshot in read_reports(server.report_read, 2)] == ["v2", "v2"]
+    server._wait_exit({old_zygote}, 5)
+    assert set(server._zygotes) == {server._current()}
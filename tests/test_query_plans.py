@@ -0,0 +1,103 @@
+import os
+
+import mongomock
+import pytest
+from mongomock.command_cursor import CommandCursor
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from app.core.indexes import INDEX_SPECS
+from app.core.mongo import mongo
+from app.core.query_plans import QueryRecorder, exercise, explain_query, query_filter, verify_query_plans
+
+
+@pytest.fixture
+def recording_db(mongo_db, monkeypatch):
+    """mongomock chưa hỗ trợ $toDate: pipeline analytics chỉ cần được ghi lại, không chạy"""
+    monkeypatch.setattr(mongomock.collection.Collection, "aggregate", lambda self, pipeline, **kwargs: CommandCursor([]))
+    return mongo_db
+
+
+async def test_exercise_records_queries_of_every_collection(recording_db):
+    queries = await exercise(QueryRecorder(), recording_db)
+    assert {query["collection"] for query in queries} == set(INDEX_SPECS)
+    # Các collection của service trở lại bình thường sau khi ghi
+    assert mongo._collections == {}
+
+
+async def test_exercise_covers_analytics_and_backfill(recording_db):
+    queries = await exercise(QueryRecorder(), recording_db)
+
+    aggregations = [query for query in queries if query["op"] == "aggregate"]
+    assert {query["label"] for query in aggregations} == {"chat analytics"}
+    assert len(aggregations) == 4
+    # Mọi pipeline analytics lọc theo cửa sổ _id ngay ở stage đầu
+    assert all(set(query_filter(query)["_id"]) == {"$gte", "$lt"} for query in aggregations)
+
+    backfill = [query for query in queries if query["filter"] == {"search_tokens": {"$exists": False}}]
+    assert [(query["collection"], query["op"]) for query in backfill] == [("universities", "find")]
+
+    history = [query for query in queries if query["label"] == "chat history" and query["op"] == "find"]
+    assert {tuple(query["sort"]) for query in history} == {(("_id", -1),), (("_id", 1),)}
+
+
+class ExplainDb:
+    """Database trả về plan explain dựng sẵn, ghi lại lệnh explain nhận được"""
+
+    def __init__(self, plan):
+        self.plan = plan
+        self.commands = []
+
+    async def command(self, name, value, **kwargs):
+        self.commands.append((name, value, kwargs))
+        return self.plan
+
+
+def explain_output(nested, winning):
+    """Output explain với plan thắng `winning` và một COLLSCAN bị loại trong rejectedPlans"""
+    rejected = [{"stage": "COLLSCAN"}]
+    if nested == "find":
+        return {"queryPlanner": {"winningPlan": winning, "rejectedPlans": rejected}}
+    # aggregate + SBE: plan nằm trong stages[0].$cursor và winningPlan.queryPlan
+    return {"stages": [
+        {"$cursor": {"queryPlanner": {"winningPlan": {"queryPlan": winning}, "rejectedPlans": rejected}}},
+        {"$group": {}}
+    ]}
+
+
+@pytest.mark.parametrize("nested", ["find", "aggregate"])
+async def test_explain_flags_collscan_in_winning_plan_only(nested):
+    recorder = QueryRecorder()
+    if nested == "find":
+        query = recorder.record("universities", "find", filter={"search_tokens": {"$exists": False}})
+    else:
+        query = recorder.record("chat_messages", "aggregate", pipeline=[{"$match": {"_id": {"$gte": 1}}}, {"$group": {"_id": "$intent"}}])
+    indexed = explain_output(nested, {"stage": "FETCH", "inputStage": {"stage": "IXSCAN"}})
+    assert (await explain_query(ExplainDb(indexed), query))["collscan"] is False
+    scanned = explain_output(nested, {"stage": "FETCH", "inputStage": {"stage": "COLLSCAN"}})
+    result = await explain_query(ExplainDb(scanned), query)
+    assert result["collscan"] is True
+    assert result["stages"] == ["FETCH", "COLLSCAN"]
+
+
+async def test_explain_allows_full_scan_without_filter():
+    recorder = QueryRecorder()
+    query = recorder.record("universities", "find", filter={})
+    query["sort"] = [("_id", 1)]
+    db = ExplainDb({"queryPlanner": {"winningPlan": {"stage": "COLLSCAN"}}})
+    result = await explain_query(db, query)
+    assert result["full_scan"] is True
+    assert result["collscan"] is False
+    assert db.commands == [("explain", {"find": "universities", "filter": {}, "sort": {"_id": 1}}, {"verbosity": "queryPlanner"})]
+
+
+@pytest.mark.mongo
+async def test_recorded_queries_do_not_collscan(monkeypatch):
+    client = AsyncIOMotorClient(os.environ["MONGO_TEST_URL"], serverSelectionTimeoutMS=5000)
+    monkeypatch.setattr(mongo, "_client", client)
+    monkeypatch.setattr(mongo, "_collections", {})
+    try:
+        plans = await verify_query_plans()
+    finally:
+        client.close()
+    assert any(plan["filter"] == {"search_tokens": {"$exists": False}} for plan in plans)
+    assert [plan for plan in plans if plan["collscan"]] == []
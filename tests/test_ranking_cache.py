@@ -0,0 +1,141 @@
+import asyncio
+import time
+
+import pytest
+
+from app.core.config import settings
+from app.schemas.ranking import RankingSearchRequest
+from app.services.ranking_service import RankingService
+from app.utils.circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker
+
+
+def ranking_payload(candidate_number):
+    return {
+        "candidate_number": candidate_number,
+        "data_year": 2025,
+        "mark_info": [{"name": "Toán", "score": "9.0"}],
+        "blocks": [{"label": "A00", "value": "A00", "id": 1, "subjects": ["Toán"], "point": 27.5,
+                    "ranking": {"equal": 3, "higher": 120, "total": 10000}}]
+    }
+
+
+@pytest.fixture
+def service(mongo_db):
+    service = RankingService()
+    service.upstream_calls = []
+    service.upstream_status = None
+
+    async def fake_request(candidate_number, region):
+        service.upstream_calls.append(candidate_number)
+        await asyncio.sleep(0.01)
+        if service.upstream_status:
+            return {"success": False, "status": service.upstream_status, "error": f"HTTP {service.upstream_status}"}
+        return {"success": True, "status": 200, "data": {"success": True, "data": ranking_payload(candidate_number)}}
+
+    service._make_api_request = fake_request
+    return service
+
+
+def request(candidate_number="01234567", region="MB"):
+    return RankingSearchRequest(candidate_number=candidate_number, region=region)
+
+
+# ---------- Circuit breaker ----------
+
+def test_breaker_opens_after_threshold_and_allows_one_trial():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.05)
+    breaker.record_failure()
+    assert breaker.state == CLOSED and breaker.allow_request()
+    breaker.record_failure()
+    assert breaker.state == OPEN and not breaker.allow_request()
+
+    time.sleep(0.06)
+    assert breaker.state == HALF_OPEN
+    assert breaker.allow_request()
+    assert not breaker.allow_request()
+    breaker.record_success()
+    assert breaker.state == CLOSED and breaker.metrics()["trips"] == 1
+
+
+def test_failed_trial_reopens_breaker():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.05)
+    breaker.record_failure()
+    time.sleep(0.06)
+    assert breaker.allow_request()
+    breaker.record_failure()
+    assert breaker.state == OPEN and breaker.metrics()["trips"] == 2
+
+
+# ---------- Cache 3 tầng ----------
+
+async def test_second_lookup_is_served_from_lru(service):
+    first = await service.get_student_ranking(request())
+    second = await service.get_student_ranking(request())
+    assert first == second
+    assert first.blocks[0].region == "MB"
+    assert service.upstream_calls == ["01234567"]
+
+
+async def test_lookup_falls_back_to_mongo_when_lru_is_cold(service, mongo_db):
+    await service.get_student_ranking(request())
+    assert await mongo_db["student_ranking"].count_documents({"candidate_number": "01234567"}) == 1
+
+    service._cache.clear()
+    result = await service.get_student_ranking(request())
+    assert result.candidate_number == "01234567"
+    assert service.upstream_calls == ["01234567"]
+    assert service.get_metrics()["cache"]["db_hits"] == 1
+
+
+async def test_concurrent_lookups_share_one_upstream_call(service):
+    results = await asyncio.gather(*[service.get_student_ranking(request()) for _ in range(5)])
+    assert all(result == results[0] for result in results)
+    assert service.upstream_calls == ["01234567"]
+
+
+async def test_stale_entry_is_served_and_revalidated(service, monkeypatch):
+    await service.get_student_ranking(request())
+    monkeypatch.setattr(settings, "ranking_freshness", {2025: 1})
+    entry = service._cache.get(("01234567", "MB", 2025))
+    entry["fetched_at"] -= 10
+
+    assert await service.get_student_ranking(request()) is not None
+    await asyncio.gather(*service._revalidating.values())
+    assert service.upstream_calls == ["01234567", "01234567"]
+    assert service.get_metrics()["cache"]["stale_served"] == 1
+
+
+async def test_open_breaker_short_circuits_upstream(service):
+    service.upstream_status = 503
+    for i in range(settings.ranking_breaker_threshold):
+        assert await service.get_student_ranking(request(f"0000000{i}")) is None
+    calls = len(service.upstream_calls)
+
+    assert await service.get_student_ranking(request("01234567")) is None
+    assert len(service.upstream_calls) == calls
+    assert service.get_metrics()["circuit_breaker"]["state"] == OPEN
+    assert service.get_metrics()["cache"]["breaker_rejected"] == 1
+
+
+async def test_client_errors_do_not_open_breaker(service):
+    service.upstream_status = 404
+    for i in range(settings.ranking_breaker_threshold + 1):
+        assert await service.get_student_ranking(request(f"0000000{i}")) is None
+    assert len(service.upstream_calls) == settings.ranking_breaker_threshold + 1
+    assert service.get_metrics()["circuit_breaker"] == {"state": CLOSED, "consecutive_failures": 0, "trips": 0}
+
+
+async def test_rate_limited_replies_count_as_failures(service):
+    service.upstream_status = 429
+    for i in range(settings.ranking_breaker_threshold):
+        assert await service.get_student_ranking(request(f"0000000{i}")) is None
+    assert service.get_metrics()["circuit_breaker"]["state"] == OPEN
+
+
+def test_ignored_call_frees_the_half_open_trial():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.05)
+    breaker.record_failure()
+    time.sleep(0.06)
+    assert breaker.allow_request()
+    breaker.record_ignored()
+    assert breaker.state == HALF_OPEN and breaker.allow_request()
@@ -0,0 +1,44 @@
+from app.services.retrieval_service import RetrievalService
+
+UNIVERSITIES = [
+    {"id": 1, "code": "BKA", "name": "Đại học Bách Khoa Hà Nội", "location": "Hà Nội"},
+    {"id": 2, "code": "QSB", "name": "Đại học Bách Khoa - ĐHQG TP.HCM", "location": "TP.HCM"},
+    {"id": 3, "code": "NTH", "name": "Đại học Ngoại Thương", "location": "Hà Nội"},
+    {"id": 4, "code": "KHA", "name": "Đại học Kinh tế Quốc dân", "location": "Hà Nội"},
+    {"id": 5, "code": "YHB", "name": "Đại học Y Hà Nội", "location": "Hà Nội"},
+]
+
+
+def make_service():
+    service = RetrievalService(dim=512)
+    service.index_universities(UNIVERSITIES)
+    return service
+
+
+def test_best_match_ranks_first():
+    results = make_service().search("đại học ngoại thương", k=3, min_score=0)
+    assert results[0]["code"] == "NTH"
+    assert [r["score"] for r in results] == sorted((r["score"] for r in results), reverse=True)
+
+
+def test_search_ignores_diacritics_and_case():
+    service = make_service()
+    with_accents = service.search("Bách Khoa Hà Nội", k=2, min_score=0)
+    without_accents = service.search("bach khoa ha noi", k=2, min_score=0)
+    assert with_accents[0]["code"] == without_accents[0]["code"] == "BKA"
+    assert with_accents[0]["score"] == without_accents[0]["score"]
+
+
+def test_min_score_filters_unrelated_queries():
+    assert make_service().search("zzzz qqqq", k=3, min_score=0.2) == []
+
+
+def test_reindex_replaces_and_remove_drops_document():
+    service = make_service()
+    service.index_universities([{"id": 3, "code": "FTU", "name": "Trường Đại học Ngoại thương (FTU)"}])
+    assert len(service) == len(UNIVERSITIES)
+    assert service.search("ngoại thương", k=1, min_score=0)[0]["code"] == "FTU"
+
+    service.remove("university:3")
+    assert len(service) == len(UNIVERSITIES) - 1
+    assert all(r["id"] != 3 for r in service.search("ngoại thương", k=5, min_score=0))
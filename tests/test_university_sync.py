@@ -0,0 +1,143 @@
+import pytest
+
+from app.core.config import settings
+from app.repositories.lease_repository import lease_repository
+from app.services import university_service as university_module
+from app.services import university_sync_service as sync_module
+from app.services.university_service import UniversityService
+from app.services.university_sync_service import LEASE_NAME, LeaseLostError, UniversitySyncScheduler
+
+
+def universities(count, prefix="Truong"):
+    return [{"id": i, "name": f"{prefix} {i}", "code": f"C{i}"} for i in range(count)]
+
+
+def follower():
+    """UniversityService của một worker khác, ghi lại các trường được nạp vào index"""
+    service = UniversityService()
+    service.applied = []
+    service.add_sync_listener(lambda docs: service.applied.extend(doc["id"] for doc in docs))
+    return service
+
+
+@pytest.fixture
+def leader(mongo_db):
+    return UniversityService()
+
+
+async def test_follower_pulls_changes_written_after_warm_up(leader):
+    await leader.save_all_universities_to_db(universities(20))
+    worker = follower()
+    assert await worker.warm_up() == 20
+    worker.applied.clear()
+
+    await leader.update_university(3, {"name": "Truong moi"})
+    assert await worker.pull_changes() == 1
+    assert worker.applied == [3]
+    # Không đọc lại bản ghi đã nạp
+    assert await worker.pull_changes() == 0
+
+
+async def test_write_committed_late_with_lower_seq_is_not_skipped(leader, monkeypatch):
+    monkeypatch.setattr(settings, "university_sync_gap_grace", 60)
+    await leader.save_all_universities_to_db(universities(20))
+    worker = follower()
+    await worker.warm_up()
+    worker.applied.clear()
+
+    # Số thứ tự được cấp cho một lần ghi chưa commit; lần ghi sau (seq lớn hơn) commit trước
+    in_flight = await leader._allocate_seq(1)
+    await leader.update_university(5, {"name": "Truong 5b"})
+    await worker.pull_changes()
+    assert worker.applied == [5]
+    assert worker.sync_state()["watermark"] < in_flight
+
+    await leader.collection.update_one({"id": 7}, {"$set": {"name": "Truong 7b", "_seq": in_flight}})
+    await worker.pull_changes()
+    assert worker.applied == [5, 7]
+    assert worker.sync_state() == {"watermark": in_flight + 1, "pending": 0, "gaps": 0}
+
+
+async def test_missing_seq_is_skipped_after_grace(leader, monkeypatch):
+    await leader.save_all_universities_to_db(universities(5))
+    worker = follower()
+    await worker.warm_up()
+
+    monkeypatch.setattr(settings, "university_sync_gap_grace", 60)
+    lost = await leader._allocate_seq(1)
+    await leader.update_university(1, {"name": "Truong 1b"})
+    await worker.pull_changes()
+    assert worker.sync_state()["watermark"] == lost - 1
+
+    monkeypatch.setattr(settings, "university_sync_gap_grace", 0)
+    await worker.pull_changes()
+    assert worker.sync_state()["watermark"] == lost + 1
+
+
+async def test_unchanged_universities_are_not_rewritten(leader):
+    await leader.save_all_universities_to_db(universities(5))
+    changeset = await leader.save_all_universities_to_db(universities(4) + [{"id": 4, "name": "Doi ten", "code": "C4"}])
+    assert changeset["updated"] == [4]
+    assert changeset["unchanged"] == 4
+    assert await leader._allocated_seq() == 6
+
+
+async def test_sync_renews_lease_between_batches(mongo_db, monkeypatch):
+    monkeypatch.setattr(university_module, "SYNC_BATCH_SIZE", 10)
+    scheduler = UniversitySyncScheduler()
+    assert await lease_repository.acquire(LEASE_NAME, scheduler.owner, 60)
+    scheduler.is_leader = True
+
+    renewals = []
+    original = lease_repository.acquire
+
+    async def counting_acquire(*args, **kwargs):
+        renewals.append(args[0])
+        return await original(*args, **kwargs)
+
+    async def fetch(etag=None, last_modified=None):
+        return universities(25), None, None
+
+    monkeypatch.setattr(lease_repository, "acquire", counting_acquire)
+    monkeypatch.setattr(sync_module.university_service, "fetch_universities_if_changed", fetch)
+    result = await scheduler.run_once()
+    assert result["changes"]["inserted"] == list(range(25))
+    assert renewals == [LEASE_NAME] * 3
+
+
+async def test_sync_stops_when_lease_is_taken_over(mongo_db, monkeypatch):
+    monkeypatch.setattr(university_module, "SYNC_BATCH_SIZE", 10)
+    scheduler = UniversitySyncScheduler()
+    await lease_repository.acquire(LEASE_NAME, scheduler.owner, 60)
+    scheduler.is_leader = True
+    await mongo_db["sync_leases"].update_one({"_id": LEASE_NAME}, {"$set": {"owner": "other-worker"}})
+
+    async def fetch(etag=None, last_modified=None):
+        return universities(25), None, None
+
+    monkeypatch.setattr(sync_module.university_service, "fetch_universities_if_changed", fetch)
+    with pytest.raises(LeaseLostError):
+        await scheduler.run_once()
+    assert not scheduler.is_leader
+    assert await mongo_db["universities"].count_documents({}) == 0
+
+
+async def test_manual_sync_is_refused_while_another_worker_holds_the_lease(mongo_db, monkeypatch):
+    async def fetch(etag=None, last_modified=None):
+        return universities(5), None, None
+
+    monkeypatch.setattr(sync_module.university_service, "fetch_universities_if_changed", fetch)
+    leader = UniversitySyncScheduler()
+    assert await lease_repository.acquire(LEASE_NAME, leader.owner, 60)
+
+    other = UniversitySyncScheduler()
+    assert await other.run_as_leader(conditional=False) is None
+    # Gọi thẳng run_once mà không giữ lease cũng không được ghi
+    with pytest.raises(LeaseLostError):
+        await other.run_once(conditional=False)
+    assert await mongo_db["universities"].count_documents({}) == 0
+
+    await lease_repository.release(LEASE_NAME, leader.owner)
+    result = await other.run_as_leader(conditional=False)
+    assert result["changes"]["inserted"] == list(range(5))
+    assert other.is_leader